@@ -0,0 +1,389 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import platform
+import sqlite3
+import tempfile
+import argparse
+from datetime import datetime
+
+from catalog_db import (
+    init_schema, tune_connection, iter_catalog_tree, BulkLoad, CatalogWriter, DirectoryTotals, INSERT_FILE_SEARCH_SQL
+)
+from catalog_scan import TreeScanner, ParallelTreeScanner
+from catalog_hash import (
+    HashPipeline, DEFAULT_HASH_WORKERS, DEFAULT_ALGORITHM, available_algorithms, fingerprint_algorithms
+)
+from catalog_core import CatalogScan, CatalogCompare
+
+
+def synthetic_entries(count):
+    """Generate (path, parent, name, is_directory, size) shaped like a wide two-level tree"""
+    for i in range(count):
+        parent = f'dir{i // 1000:04d}'
+        if i % 1000 == 0:
+            yield parent, '', parent, True, 0
+        name = f'file{i:07d}.dat'
+        yield os.path.join(parent, name), parent, name, False, i * 37 % 1048576
+
+
+def create_bench_catalog(db_path, tuned):
+    """Create a database with one empty catalog and return (conn, catalog_id)"""
+    conn = sqlite3.connect(db_path)
+    init_schema(conn)
+    if tuned:
+        tune_connection(conn)
+    cursor = conn.cursor()
+    cursor.execute('INSERT INTO catalogs (name, root_path) VALUES (?, ?)', ('bench', '/'))
+    return conn, cursor.lastrowid
+
+
+def bench_insert_per_row(db_path, rows):
+    """Baseline: one execute() per row, and per search index row, with default pragmas"""
+    conn, catalog_id = create_bench_catalog(db_path, tuned=False)
+    cursor = conn.cursor()
+    entries = list(synthetic_entries(rows))
+    modified = time.time_ns()
+    start = time.perf_counter()
+    cursor.execute(
+        'INSERT INTO directories (catalog_id, parent_id, path, name, modified_at) VALUES (?, NULL, ?, ?, ?)',
+        (catalog_id, '', 'bench', modified)
+    )
+    dir_ids = {'': cursor.lastrowid}
+    for path, parent, name, is_directory, size in entries:
+        if is_directory:
+            cursor.execute(
+                'INSERT INTO directories (catalog_id, parent_id, path, name, modified_at) VALUES (?, ?, ?, ?, ?)',
+                (catalog_id, dir_ids[parent], path, name, modified)
+            )
+            dir_ids[path] = cursor.lastrowid
+        else:
+            cursor.execute(
+                'INSERT INTO files (catalog_id, dir_id, name, size, modified_at) VALUES (?, ?, ?, ?, ?)',
+                (catalog_id, dir_ids[parent], name, size, modified)
+            )
+            # Every stored file is searchable, so the baseline indexes it too
+            cursor.execute(INSERT_FILE_SEARCH_SQL, (cursor.lastrowid, name, parent))
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def bench_insert_batched(db_path, rows):
+    """Batched executemany() inside one tuned bulk-load transaction"""
+    conn, catalog_id = create_bench_catalog(db_path, tuned=True)
+    entries = list(synthetic_entries(rows))
+    modified = time.time_ns()
+    start = time.perf_counter()
+    with BulkLoad(conn):
+        writer = CatalogWriter(conn, catalog_id)
+        writer.add_directory('', None, 'bench', modified, None)
+        for path, parent, name, is_directory, size in entries:
+            if is_directory:
+                writer.add_directory(path, parent, name, modified, None)
+            else:
+                writer.add_file(parent, name, size, modified, None, None)
+        writer.flush()
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def run_insert_benchmark(rows):
+    """Time both insert strategies on fresh databases and print rows per second"""
+    results = {}
+    for name, bench in (('per-row', bench_insert_per_row), ('batched', bench_insert_batched)):
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed = bench(os.path.join(tmp, 'bench.db'), rows)
+        results[name] = elapsed
+        print(f"{name:>8}: {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+    print(f" speedup: {results['per-row'] / results['batched']:.1f}x")
+    return results
+
+
+def create_synthetic_tree(root, width, depth, files, file_size=None):
+    """Create a tree with width subdirectories per level, depth levels deep and files per directory
+
+    file_size(i) gives the size of the i-th file; by default files hold up to
+    63 bytes. Returns (directories, files, bytes) created below root.
+    """
+    file_size = file_size or (lambda i: i % 64)
+    block = os.urandom(1024 * 1024)
+    levels = [root]
+    counts = [0, 0, 0]
+    for level in range(depth + 1):
+        next_level = []
+        for dir_path in levels:
+            for i in range(files):
+                size = file_size(counts[1])
+                with open(os.path.join(dir_path, f'file{i:03d}.dat'), 'wb') as f:
+                    remaining = size
+                    while remaining > 0:
+                        remaining -= f.write(block[:remaining])
+                counts[1] += 1
+                counts[2] += size
+            if level < depth:
+                for i in range(width):
+                    sub_path = os.path.join(dir_path, f'dir{i:03d}')
+                    os.mkdir(sub_path)
+                    next_level.append(sub_path)
+                    counts[0] += 1
+        levels = next_level
+    return tuple(counts)
+
+
+def with_latency(scanner_class, latency):
+    """Subclass a scanner so every listing and stat first waits like a network round trip"""
+    class LatencyScanner(scanner_class):
+        def _open_directory(self, dir_path, rel_dir):
+            time.sleep(latency)
+            return super()._open_directory(dir_path, rel_dir)
+
+        def _scan_entry(self, entry, rel_dir):
+            time.sleep(latency)
+            return super()._scan_entry(entry, rel_dir)
+    return LatencyScanner
+
+
+def run_scan_benchmark(width, depth, files, worker_counts, latency):
+    """Time sequential and parallel scans of one synthetic tree and print entries per second"""
+    with tempfile.TemporaryDirectory() as tmp:
+        create_synthetic_tree(tmp, width, depth, files)
+        results = {}
+        for workers in worker_counts:
+            if workers == 1:
+                scanner = with_latency(TreeScanner, latency)(tmp) if latency else TreeScanner(tmp)
+            elif latency:
+                scanner = with_latency(ParallelTreeScanner, latency)(tmp, workers)
+            else:
+                scanner = ParallelTreeScanner(tmp, workers)
+            start = time.perf_counter()
+            entries = sum(1 for _ in scanner.scan())
+            elapsed = time.perf_counter() - start
+            results[workers] = elapsed
+            speedup = results[worker_counts[0]] / elapsed
+            print(f"{workers:>3} workers: {entries} entries in {elapsed:.2f}s "
+                  f"({entries / elapsed:,.0f} entries/s, {speedup:.1f}x)")
+    return results
+
+
+SIZE_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+
+def size_distribution(kind, mean, seed):
+    """Return a file_size(i) drawing sizes with the given mean from a seeded distribution
+
+    lognormal gives many small files and a long tail of large ones, which is
+    closest to real disks.
+    """
+    rng = random.Random(seed)
+    if kind == 'fixed':
+        return lambda i: mean
+    if kind == 'uniform':
+        return lambda i: rng.randint(0, 2 * mean)
+    sigma = 1.5
+    mu = math.log(max(mean, 1)) - sigma * sigma / 2
+    return lambda i: int(rng.lognormvariate(mu, sigma))
+
+
+def timed(function, *args):
+    """Return (seconds, result) of one call"""
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def suite_scan(root):
+    """Walk the tree like a catalog scan without storing anything"""
+    return list(TreeScanner(root).scan())
+
+
+def suite_hash(entries, algorithm, workers):
+    """Fingerprint every file on the hash pipeline, without the hash cache"""
+    pipeline = HashPipeline(workers, fingerprint_algorithms(algorithm))
+    hashed = 0
+    try:
+        # Collect finished jobs while submitting, as a scan does, so the queue stays bounded
+        for entry in entries:
+            if not entry.is_directory:
+                pipeline.submit(entry.full_path, entry.device, entry.inode, entry)
+                hashed += sum(1 for _ in pipeline.completed())
+        return hashed + sum(1 for _ in pipeline.drain())
+    finally:
+        pipeline.close()
+
+
+def suite_insert(conn, root, entries):
+    """Store already scanned entries as a new catalog in one bulk load"""
+    cursor = conn.cursor()
+    cursor.execute('INSERT INTO catalogs (name, root_path) VALUES (?, ?)', ('insert', root))
+    totals = DirectoryTotals()
+    with BulkLoad(conn):
+        writer = CatalogWriter(conn, cursor.lastrowid)
+        for entry in [TreeScanner(root).root_entry()] + entries:
+            if entry.is_directory:
+                writer.add_directory(entry.path, entry.parent, entry.name, entry.mtime_ns, entry.inode)
+            else:
+                writer.add_file(entry.parent, entry.name, entry.size, entry.mtime_ns, None, entry.inode)
+                totals.add(entry.parent, entry.size, entry.mtime_ns)
+        writer.flush()
+        totals.write(cursor, writer.dir_ids)
+    conn.commit()
+    return len(entries)
+
+
+def open_suite_database(db_path):
+    """Create an empty tuned database for one or more suite phases"""
+    conn = sqlite3.connect(db_path)
+    init_schema(conn)
+    tune_connection(conn)
+    return conn
+
+
+def suite_load(conn, catalog_id):
+    """Read a whole catalog back in tree order, as the catalog view and exports do"""
+    return sum(1 for _ in iter_catalog_tree(conn, catalog_id))
+
+
+def run_suite(width, depth, files, distribution, mean_size, algorithm, hash_workers, seed, baseline=None):
+    """Time scan, hash, insert, catalog, load and compare on one synthetic tree
+
+    Returns a JSON-ready dict. Every phase reads a tree that an earlier
+    phase has already walked, so times are for a warm page cache. insert
+    and catalog each start from an empty database; compare runs on the
+    catalog's database with the hash cache cleared, so it hashes every
+    file. Each phase records its database in the JSON.
+    """
+    results = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'parameters': {
+            'width': width, 'depth': depth, 'files': files, 'distribution': distribution,
+            'mean_size': mean_size, 'algorithm': algorithm, 'hash_workers': hash_workers, 'seed': seed,
+        },
+        'phases': {},
+    }
+    phases = results['phases']
+
+    def record(name, seconds, items, size=None):
+        phase = {'seconds': round(seconds, 4), 'items': items, 'items_per_second': round(items / seconds, 1)}
+        if size is not None:
+            phase['bytes_per_second'] = round(size / seconds, 1)
+        phases[name] = phase
+        line = f"{name:>8}: {items:,} in {seconds:.2f}s ({items / seconds:,.0f}/s"
+        if size is not None:
+            line += f", {size / seconds / 1e6:,.1f} MB/s"
+        previous = (baseline or {}).get('phases', {}).get(name)
+        if previous:
+            line += f", {previous['seconds'] / seconds:.2f}x baseline"
+        print(line + ")")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'tree')
+        os.mkdir(root)
+        seconds, (dirs, file_count, total_bytes) = timed(
+            create_synthetic_tree, root, width, depth, files, size_distribution(distribution, mean_size, seed))
+        results['tree'] = {'directories': dirs, 'files': file_count, 'bytes': total_bytes,
+                           'create_seconds': round(seconds, 4)}
+        print(f"    tree: {dirs:,} directories, {file_count:,} files, {total_bytes / 1e6:,.1f} MB")
+
+        seconds, entries = timed(suite_scan, root)
+        record('scan', seconds, len(entries))
+        if algorithm:
+            seconds, hashed = timed(suite_hash, entries, algorithm, hash_workers)
+            record('hash', seconds, hashed, total_bytes)
+
+        # The insert phase gets its own database, so the catalog phase starts
+        # from an empty one and takes the deferred-index path of a first scan
+        conn = open_suite_database(os.path.join(tmp, 'insert.db'))
+        try:
+            seconds, inserted = timed(suite_insert, conn, root, entries)
+            record('insert', seconds, inserted)
+            phases['insert']['database'] = 'fresh'
+        finally:
+            conn.close()
+
+        conn = open_suite_database(os.path.join(tmp, 'bench.db'))
+        try:
+            # Scan, hash and store together, as the catalog worker does
+            scan = CatalogScan(root, algorithm, name='bench', hash_workers=hash_workers)
+            seconds, catalog_id = timed(scan.run, conn)
+            record('catalog', seconds, len(entries), total_bytes if algorithm else None)
+            phases['catalog']['database'] = 'fresh'
+
+            seconds, loaded = timed(suite_load, conn, catalog_id)
+            record('load', seconds, loaded)
+            phases['load']['database'] = 'catalog'
+
+            # Without the digests the catalog phase cached, compare hashes every file again
+            conn.execute('DELETE FROM hash_cache')
+            conn.commit()
+            content = 'tiered' if algorithm else None
+            compare = CatalogCompare(catalog_id, root, {'check_size': True, 'content': content},
+                                     hash_workers=hash_workers)
+            seconds, _ = timed(compare.run, conn)
+            record('compare', seconds, len(entries))
+            phases['compare']['database'] = 'catalog, hash_cache cleared'
+            phases['compare']['differences'] = compare.differences
+        finally:
+            conn.close()
+    return results
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Disk Catalog benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    insert = subparsers.add_parser('insert', help="catalog row insert throughput")
+    insert.add_argument('--rows', type=int, default=1_000_000)
+    scan = subparsers.add_parser('scan', help="tree scan throughput by number of scan workers")
+    scan.add_argument('--width', type=int, default=4, help="subdirectories per directory")
+    scan.add_argument('--depth', type=int, default=5, help="directory levels below the root")
+    scan.add_argument('--files', type=int, default=10, help="files per directory")
+    scan.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    scan.add_argument('--latency-ms', type=float, default=0.0,
+                      help="simulated round trip per listing and stat, as on NFS or SMB")
+    suite = subparsers.add_parser('suite', help="scan, hash, insert, load and compare on a synthetic tree")
+    suite.add_argument('--width', type=int, default=6, help="subdirectories per directory")
+    suite.add_argument('--depth', type=int, default=4, help="directory levels below the root")
+    suite.add_argument('--files', type=int, default=20, help="files per directory")
+    suite.add_argument('--distribution', choices=SIZE_DISTRIBUTIONS, default='lognormal',
+                       help="file size distribution")
+    suite.add_argument('--mean-size', type=int, default=16 * 1024, help="mean file size in bytes")
+    suite.add_argument('--algorithm', choices=available_algorithms(), default=DEFAULT_ALGORITHM)
+    suite.add_argument('--no-hash', dest='algorithm', action='store_const', const=None,
+                       help="skip the hash phase and store no fingerprints")
+    suite.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS)
+    suite.add_argument('--seed', type=int, default=0)
+    suite.add_argument('--output', help="write the results as JSON to this file")
+    suite.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    if args.command == 'insert':
+        run_insert_benchmark(args.rows)
+    elif args.command == 'scan':
+        run_scan_benchmark(args.width, args.depth, args.files, args.workers, args.latency_ms / 1000)
+    elif args.command == 'suite':
+        baseline = load_results(args.baseline) if args.baseline else None
+        results = run_suite(args.width, args.depth, args.files, args.distribution, args.mean_size,
+                            args.algorithm, args.hash_workers, args.seed, baseline)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+                f.write('\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
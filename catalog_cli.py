@@ -0,0 +1,520 @@
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from datetime import datetime
+
+from catalog_scan import DEFAULT_SCAN_WORKERS
+from catalog_hash import DEFAULT_HASH_WORKERS, available_algorithms
+from catalog_db import (
+    DEFAULT_DB_PATH, init_schema, catalog_entries, compare_results, list_catalogs, find_catalog,
+    evict_hash_cache, hash_cache_stats, duplicate_sets, duplicate_summary, search_files, largest_directories,
+    delete_catalog, compact_database, catalog_hash_algorithm, checkable_hash_algorithm, shared_hash_algorithm,
+    format_mtime, HASH_CACHE_MAX_ENTRIES, HASH_CACHE_MAX_AGE, SEARCH_LIMIT
+)
+from catalog_profile import Profile, PROFILE_ENV, connect
+from catalog_store import DB_PATH_ENV, default_db_path
+from catalog_core import (
+    CatalogScan, CatalogUpdate, CatalogRefresh, CatalogExport, CatalogImport, CatalogCompare, CatalogDiff,
+    DuplicateSearch, CatalogPurge, OperationCancelled, ProgressThrottle, format_progress
+)
+from catalog_watch import CatalogWatcher, WATCH_DEBOUNCE
+from catalog_transfer import CatalogReader, CatalogFormatError, available_formats, available_compressions
+
+# Exit codes; argparse itself exits with 2 on usage errors
+EXIT_OK = 0
+EXIT_DIFFERENCES = 1
+EXIT_USAGE = 2
+EXIT_ERROR = 3
+EXIT_NOT_FOUND = 4
+EXIT_CANCELLED = 130
+
+
+class CatalogNotFound(Exception):
+    """Raised when a catalog id or name does not match any stored catalog"""
+
+
+class ProgressPrinter:
+    """Progress callback that rewrites one stderr line; operations call it twice a second at most"""
+
+    INTERVAL = 0.5
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.written = False
+
+    def __call__(self, value, total, message, stats):
+        if not self.enabled:
+            return
+        self.written = True
+        sys.stderr.write(f"\r{format_progress(value, total, stats)} {message[:50]:<50}")
+        sys.stderr.flush()
+
+    def finish(self):
+        if self.written:
+            sys.stderr.write("\n")
+
+
+def emit(args, record, columns):
+    """Print one result record as a JSON line or as tab-separated columns"""
+    if args.json:
+        print(json.dumps(record, default=str))
+    else:
+        print("\t".join("" if record[column] is None else str(record[column]) for column in columns))
+
+
+def resolve_catalog(conn, reference):
+    catalog = find_catalog(conn, reference)
+    if catalog is None:
+        raise CatalogNotFound(f"no catalog matches '{reference}'")
+    return catalog
+
+
+def run_operation(args, operation, conn):
+    """Run a core operation with optional progress output on stderr"""
+    progress = ProgressPrinter(args.progress and sys.stderr.isatty())
+    operation.progress = ProgressThrottle(progress, ProgressPrinter.INTERVAL)
+    operation.profile = args.profile
+    try:
+        return operation.run(conn)
+    finally:
+        progress.finish()
+        if progress.enabled and operation.hash_cache and operation.hash_cache.hit_rate() is not None:
+            print(operation.hash_cache.summary(), file=sys.stderr)
+
+
+def cmd_scan(args, conn):
+    root_path = os.path.abspath(args.path)
+    if not os.path.isdir(root_path):
+        raise CatalogNotFound(f"folder '{args.path}' does not exist")
+    operation = CatalogScan(root_path, args.algorithm, name=args.name, hash_workers=args.hash_workers,
+                            scan_workers=args.scan_workers)
+    catalog_id = run_operation(args, operation, conn)
+    emit(args, {
+        'catalog_id': catalog_id,
+        'name': operation.catalog_name,
+        'root_path': root_path,
+        'files': operation.files_processed,
+    }, ['catalog_id', 'name', 'files'])
+    return EXIT_OK
+
+
+def cmd_update(args, conn):
+    catalog_id, name, root_path = resolve_catalog(conn, args.catalog)
+    if not os.path.isdir(root_path):
+        raise CatalogNotFound(f"catalog folder '{root_path}' is not available")
+    operation = CatalogUpdate(catalog_id, name, root_path, args.algorithm, hash_workers=args.hash_workers,
+                              scan_workers=args.scan_workers)
+    added, changed, removed = run_operation(args, operation, conn)
+    emit(args, {
+        'catalog_id': catalog_id,
+        'name': name,
+        'added': added,
+        'changed': changed,
+        'removed': removed,
+    }, ['catalog_id', 'added', 'changed', 'removed'])
+    return EXIT_OK
+
+
+def cmd_watch(args, conn):
+    catalog_id, name, root_path = resolve_catalog(conn, args.catalog)
+    if not os.path.isdir(root_path):
+        raise CatalogNotFound(f"catalog folder '{root_path}' is not available")
+    # New and changed files get the fingerprints the catalog already has
+    algorithm = args.algorithm or catalog_hash_algorithm(conn, catalog_id)
+    watcher = CatalogWatcher(root_path, debounce=args.debounce)
+    watcher.start()
+    print(f"watching {root_path} ({len(watcher.paths)} directories), Ctrl-C to stop", file=sys.stderr)
+    try:
+        while True:
+            changes = watcher.poll()
+            if changes is None:
+                continue
+            operation = CatalogRefresh(catalog_id, name, root_path, algorithm, changes.dirs, changes.subtrees,
+                                       hash_workers=args.hash_workers)
+            added, changed, removed = run_operation(args, operation, conn)
+            emit(args, {
+                'catalog_id': catalog_id,
+                'dirs': len(changes.dirs),
+                'subtrees': len(changes.subtrees),
+                'added': added,
+                'changed': changed,
+                'removed': removed,
+            }, ['catalog_id', 'dirs', 'subtrees', 'added', 'changed', 'removed'])
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        return EXIT_OK
+    finally:
+        watcher.close()
+
+
+def cmd_compare(args, conn):
+    catalog_id, _, _ = resolve_catalog(conn, args.catalog)
+    if not os.path.isdir(args.path):
+        raise CatalogNotFound(f"folder '{args.path}' does not exist")
+    if args.content == 'full' and checkable_hash_algorithm(conn, catalog_id) is None:
+        # No file could be hashed to compare, so every file would look unchanged
+        print(f"error: the catalog has no full hashes that can be checked here "
+              f"({describe_hash_algorithm(conn, catalog_id)}), use --content sample or tiered", file=sys.stderr)
+        return EXIT_USAGE
+    options = {'check_size': not args.no_size, 'content': args.content}
+    operation = CatalogCompare(catalog_id, args.path, options, hash_workers=args.hash_workers,
+                               scan_workers=args.scan_workers)
+    return emit_differences(args, operation, conn)
+
+
+def cmd_diff(args, conn):
+    catalog_id, _, _ = resolve_catalog(conn, args.catalog)
+    other_catalog_id, _, _ = resolve_catalog(conn, args.other)
+    if args.content == 'full' and shared_hash_algorithm(conn, catalog_id, other_catalog_id) is None:
+        # No full hash could be compared, so every file would look unchanged
+        print(f"error: the catalogs have no full hashes of the same algorithm "
+              f"({describe_hash_algorithm(conn, catalog_id)} and {describe_hash_algorithm(conn, other_catalog_id)}), "
+              f"use --content sample or tiered", file=sys.stderr)
+        return EXIT_USAGE
+    options = {'check_size': not args.no_size, 'content': args.content}
+    operation = CatalogDiff(catalog_id, other_catalog_id, options)
+    return emit_differences(args, operation, conn)
+
+
+def emit_differences(args, operation, conn):
+    """Run a compare operation and print its stored differences"""
+    run_id = run_operation(args, operation, conn)
+    for result in compare_results(conn, run_id):
+        emit(args, {
+            'status': result.status,
+            'detail': result.detail,
+            'path': result.path,
+        }, ['status', 'path'])
+    return EXIT_DIFFERENCES if operation.differences else EXIT_OK
+
+
+def cmd_query(args, conn):
+    if args.catalog is None:
+        for catalog_id, name, root_path, created_at in list_catalogs(conn):
+            emit(args, {
+                'catalog_id': catalog_id,
+                'name': name,
+                'root_path': root_path,
+                'created_at': created_at,
+            }, ['catalog_id', 'name', 'root_path', 'created_at'])
+        return EXIT_OK
+
+    catalog_id, _, _ = resolve_catalog(conn, args.catalog)
+    if args.largest:
+        for path, total_size, total_files, newest_modified_at in largest_directories(conn, catalog_id, args.largest):
+            emit(args, {
+                'path': path,
+                'total_size': total_size,
+                'total_files': total_files,
+                'newest_modified_at': format_mtime(newest_modified_at),
+            }, ['path', 'total_size', 'total_files', 'newest_modified_at'])
+        return EXIT_OK
+
+    prefix = os.path.normpath(args.path) if args.path else None
+    for entry in catalog_entries(conn, catalog_id):
+        if prefix and entry.path != prefix and not entry.path.startswith(prefix + os.sep):
+            continue
+        emit(args, {
+            'path': entry.path,
+            'is_directory': entry.is_directory,
+            'size': entry.size,
+            'modified_at': format_mtime(entry.modified_at),
+        }, ['path', 'size', 'modified_at'])
+    return EXIT_OK
+
+
+def cmd_search(args, conn):
+    catalog_id = resolve_catalog(conn, args.catalog)[0] if args.catalog else None
+    results = search_files(
+        conn, ' '.join(args.text), catalog_id=catalog_id, min_size=args.min_size, max_size=args.max_size,
+        modified_after=args.after, modified_before=args.before, extensions=args.ext, limit=args.limit
+    )
+    for result in results:
+        emit(args, {
+            'catalog': result.catalog_name,
+            'path': result.path,
+            'full_path': os.path.join(result.root_path, result.path),
+            'size': result.size,
+            'modified_at': format_mtime(result.modified_at),
+        }, ['catalog', 'path', 'size', 'modified_at'])
+    if len(results) == args.limit:
+        print(f"stopped after {args.limit} matches; use --limit to see more", file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_export(args, conn):
+    catalog_id, _, _ = resolve_catalog(conn, args.catalog)
+    run_operation(args, CatalogExport(catalog_id, args.output, args.format, args.compress), conn)
+    return EXIT_OK
+
+
+def cmd_import(args, conn):
+    with CatalogReader(args.file, args.format, args.compress) as source:
+        operation = CatalogImport(source, name=args.name, root_path=args.root, algorithm=args.algorithm)
+        catalog_id = run_operation(args, operation, conn)
+    emit(args, {
+        'catalog_id': catalog_id,
+        'name': operation.catalog_name,
+        'root_path': operation.root_path,
+        'entries': operation.entries_read,
+        'files': operation.files_processed,
+    }, ['catalog_id', 'name', 'entries'])
+    return EXIT_OK
+
+
+def cmd_duplicates(args, conn):
+    operation = DuplicateSearch(args.min_size, hash_workers=args.hash_workers)
+    run_operation(args, operation, conn)
+    for duplicate in duplicate_sets(conn):
+        files = [{'catalog': catalog_name, 'path': path} for catalog_name, _, path in duplicate.files]
+        if args.json:
+            emit(args, {
+                'set': duplicate.id,
+                'size': duplicate.size,
+                'reclaimable': duplicate.reclaimable,
+                'files': files,
+            }, [])
+            continue
+        for file in files:
+            emit(args, {'set': duplicate.id, 'size': duplicate.size, **file}, ['set', 'size', 'catalog', 'path'])
+
+    sets, copies, reclaimable = duplicate_summary(conn)
+    print(f"{sets} duplicate sets, {copies} files, {reclaimable} bytes reclaimable", file=sys.stderr)
+    if operation.unverified:
+        print(f"{operation.unverified} same-size files could not be checked (offline and not hashed)",
+              file=sys.stderr)
+    return EXIT_OK
+
+
+def cmd_cache(args, conn):
+    if args.action == 'evict':
+        evicted = evict_hash_cache(conn, args.max_entries, args.max_age_days * 24 * 3600)
+        conn.commit()
+        emit(args, {'evicted': evicted}, ['evicted'])
+        return EXIT_OK
+
+    for algorithm, entries, hits, misses in hash_cache_stats(conn):
+        lookups = hits + misses
+        emit(args, {
+            'algorithm': algorithm,
+            'entries': entries,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else None,
+        }, ['algorithm', 'entries', 'hits', 'misses', 'hit_rate'])
+    return EXIT_OK
+
+
+def cmd_delete(args, conn):
+    catalog_id, name, root_path = resolve_catalog(conn, args.catalog)
+    delete_catalog(conn, catalog_id)
+    conn.commit()
+    rows_removed = None if args.no_purge else purge_deleted(args, conn)
+    emit(args, {'catalog_id': catalog_id, 'name': name, 'rows_removed': rows_removed},
+         ['catalog_id', 'name', 'rows_removed'])
+    return EXIT_OK
+
+
+def cmd_vacuum(args, conn):
+    rows_removed = purge_deleted(args, conn)
+    size_before = os.path.getsize(args.db)
+    compact_database(conn)
+    emit(args, {'rows_removed': rows_removed, 'bytes_before': size_before, 'bytes_after': os.path.getsize(args.db)},
+         ['rows_removed', 'bytes_before', 'bytes_after'])
+    return EXIT_OK
+
+
+def purge_deleted(args, conn):
+    """Remove the rows of deleted catalogs, with optional progress output on stderr"""
+    progress = ProgressPrinter(args.progress and sys.stderr.isatty())
+    operation = CatalogPurge()
+    operation.progress = ProgressThrottle(progress, ProgressPrinter.INTERVAL)
+    try:
+        return operation.run(conn)
+    finally:
+        progress.finish()
+
+
+def describe_hash_algorithm(conn, catalog_id):
+    return catalog_hash_algorithm(conn, catalog_id) or 'not hashed'
+
+
+def parse_size(text):
+    """Parse a byte count with an optional K, M, G or T suffix"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    text = text.strip().upper().rstrip('B')
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size '{text}'")
+
+
+def parse_date(text):
+    """Parse an ISO date or date and time"""
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{text}', expected YYYY-MM-DD")
+
+
+def add_hash_arguments(parser):
+    parser.add_argument('--hash', dest='algorithm', choices=available_algorithms(),
+                        help="fingerprint files with this algorithm")
+    parser.add_argument('--md5', dest='algorithm', action='store_const', const='md5',
+                        help="calculate MD5 hashes (same as --hash md5)")
+
+
+def add_scan_arguments(parser):
+    parser.add_argument('--scan-workers', type=int, default=DEFAULT_SCAN_WORKERS,
+                        help="walk subtrees on this many threads (default: 8 on network file systems, else 1)")
+
+
+def add_content_arguments(parser):
+    parser.add_argument('--content', choices=['sample', 'full', 'tiered'],
+                        help="compare file contents by sample fingerprint, full hash, or sample then full hash")
+    parser.add_argument('--md5', dest='content', action='store_const', const='full',
+                        help="compare full hashes (same as --content full)")
+
+
+def add_transfer_arguments(parser):
+    parser.add_argument('--format', choices=available_formats(),
+                        help="file format (default: from the file name, else jsonl)")
+    parser.add_argument('--compress', choices=available_compressions() + ['none'],
+                        help="compression of jsonl and csv files (default: from the file name, else none)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="disk_catalog", description="Headless Disk Catalog commands")
+    parser.add_argument('--db', default=default_db_path(),
+                        help=f"catalog database (default: ${DB_PATH_ENV}, else {DEFAULT_DB_PATH})")
+    parser.add_argument('--json', action='store_true', help="print results as JSON lines")
+    parser.add_argument('--progress', action='store_true', help="show progress on stderr")
+    parser.add_argument('--profile', nargs='?', const='', metavar='DUMP',
+                        help=f"print time per stage on stderr, and write a cProfile dump to DUMP if given "
+                             f"(also switched on by {PROFILE_ENV})")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan = subparsers.add_parser('scan', help="catalog a folder")
+    scan.add_argument('path')
+    scan.add_argument('--name', help="catalog name (default: folder name)")
+    add_hash_arguments(scan)
+    scan.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS)
+    add_scan_arguments(scan)
+    scan.set_defaults(handler=cmd_scan)
+
+    update = subparsers.add_parser('update', help="update a catalog in place")
+    update.add_argument('catalog', help="catalog id or name")
+    add_hash_arguments(update)
+    update.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS)
+    add_scan_arguments(update)
+    update.set_defaults(handler=cmd_update)
+
+    watch = subparsers.add_parser('watch', help="keep a catalog up to date as its folder changes (Linux)")
+    watch.add_argument('catalog', help="catalog id or name")
+    add_hash_arguments(watch)
+    watch.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS)
+    watch.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE,
+                       help="apply changes once the folder was quiet for this many seconds (default: %(default)s)")
+    watch.set_defaults(handler=cmd_watch)
+
+    compare = subparsers.add_parser('compare', help="compare a catalog with a folder")
+    compare.add_argument('catalog', help="catalog id or name")
+    compare.add_argument('path')
+    compare.add_argument('--no-size', action='store_true', help="don't compare file sizes")
+    add_content_arguments(compare)
+    compare.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS)
+    add_scan_arguments(compare)
+    compare.set_defaults(handler=cmd_compare)
+
+    diff = subparsers.add_parser('diff', help="compare two stored catalogs without reading the folders")
+    diff.add_argument('catalog', help="catalog id or name")
+    diff.add_argument('other', help="catalog id or name to compare with")
+    diff.add_argument('--no-size', action='store_true', help="don't compare file sizes")
+    add_content_arguments(diff)
+    diff.set_defaults(handler=cmd_diff)
+
+    query = subparsers.add_parser('query', help="list catalogs, or the entries of one catalog")
+    query.add_argument('catalog', nargs='?', help="catalog id or name")
+    query.add_argument('--path', help="only list entries at or below this relative path")
+    query.add_argument('--largest', type=int, metavar='N', help="list the N directories with the most bytes below them")
+    query.set_defaults(handler=cmd_query)
+
+    search = subparsers.add_parser('search', help="find files by name or path across all catalogs")
+    search.add_argument('text', nargs='*', help="words the file name or directory path must contain")
+    search.add_argument('--catalog', help="only search this catalog (id or name)")
+    search.add_argument('--ext', action='append', default=[], help="only files with this extension (repeatable)")
+    search.add_argument('--min-size', type=parse_size, help="only files of at least this size, e.g. 10M")
+    search.add_argument('--max-size', type=parse_size, help="only files of at most this size")
+    search.add_argument('--after', type=parse_date, help="only files modified on or after this date")
+    search.add_argument('--before', type=parse_date, help="only files modified before this date")
+    search.add_argument('--limit', type=int, default=SEARCH_LIMIT, help="stop after this many matches")
+    search.set_defaults(handler=cmd_search)
+
+    export = subparsers.add_parser('export', help="export a catalog")
+    export.add_argument('catalog', help="catalog id or name")
+    export.add_argument('-o', '--output', help="output file (default: stdout)")
+    add_transfer_arguments(export)
+    export.set_defaults(handler=cmd_export)
+
+    import_ = subparsers.add_parser('import', help="load an exported catalog as a new catalog")
+    import_.add_argument('file', help="exported catalog, or - for stdin")
+    import_.add_argument('--name', help="catalog name (default: the exported name)")
+    import_.add_argument('--root', help="catalog folder (default: the exported folder)")
+    import_.add_argument('--hash', dest='algorithm', choices=available_algorithms(),
+                         help="algorithm of the imported fingerprints (default: the exported one)")
+    add_transfer_arguments(import_)
+    import_.set_defaults(handler=cmd_import)
+
+    duplicates = subparsers.add_parser('duplicates', help="find files with the same contents across all catalogs")
+    duplicates.add_argument('--min-size', type=parse_size, default=1, help="ignore files smaller than this, e.g. 10M")
+    duplicates.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS)
+    duplicates.set_defaults(handler=cmd_duplicates)
+
+    cache = subparsers.add_parser('cache', help="show hash cache statistics or evict old entries")
+    cache.add_argument('action', nargs='?', choices=['stats', 'evict'], default='stats')
+    cache.add_argument('--max-entries', type=int, default=HASH_CACHE_MAX_ENTRIES)
+    cache.add_argument('--max-age-days', type=int, default=HASH_CACHE_MAX_AGE // (24 * 3600))
+    cache.set_defaults(handler=cmd_cache)
+
+    delete = subparsers.add_parser('delete', help="delete a catalog and remove its rows")
+    delete.add_argument('catalog', help="catalog id or name")
+    delete.add_argument('--no-purge', action='store_true',
+                        help="only hide the catalog; its rows are removed by the next delete, vacuum or GUI start")
+    delete.set_defaults(handler=cmd_delete)
+
+    vacuum = subparsers.add_parser('vacuum', help="remove deleted catalogs and rewrite the database without free space")
+    vacuum.set_defaults(handler=cmd_vacuum)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.profile = Profile.from_environment() if args.profile is None else Profile(args.profile or None)
+    conn = connect(args.db, args.profile)
+    try:
+        init_schema(conn)
+        return args.handler(args, conn)
+    except CatalogNotFound as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_NOT_FOUND
+    except CatalogFormatError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    except (OperationCancelled, KeyboardInterrupt):
+        print("cancelled", file=sys.stderr)
+        return EXIT_CANCELLED
+    except (sqlite3.Error, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        conn.close()
+        if args.profile:
+            print(args.profile.report(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1045 @@
+import os
+import time
+import sqlite3
+import logging
+from collections import Counter, namedtuple
+
+from catalog_scan import TreeScanner, ParallelTreeScanner, ScanEntry, DEFAULT_SCAN_WORKERS, scan_workers_for
+from catalog_hash import (
+    HashPipeline, CachedHasher, DEFAULT_HASH_WORKERS, DEFAULT_ALGORITHM, SAMPLE_ALGORITHM, SAMPLE_SIZE,
+    available_algorithms, fingerprint_algorithms
+)
+from catalog_profile import profiled_scanner, ProfiledHashPipeline
+from catalog_db import (
+    tune_connection, iter_catalog_tree, iter_subtree, find_directory, tree_key, purge_compare_runs,
+    diff_catalogs, evict_hash_cache, catalog_hash_algorithm, checkable_hash_algorithm, shared_hash_algorithm,
+    duplicate_size_groups, count_duplicate_sizes, purge_deleted_catalogs, count_deleted_rows, reclaim_free_pages,
+    BatchWriter, BulkLoad, CatalogWriter, DirectoryTotals, HashCache
+)
+from catalog_transfer import export_catalog
+
+log = logging.getLogger('catalog.core')
+
+INSERT_COMPARE_RESULT_SQL = '''
+    INSERT INTO compare_results (run_id, path, status, detail, is_directory, catalog_size,
+                                 compare_size, catalog_modified_at, compare_modified_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Stored and live mtimes closer than this are equal; see same_mtime()
+MTIME_TOLERANCE_NS = 1000
+
+# Size groups are narrowed in chunks of about this many files
+DUPLICATE_CHUNK_FILES = 5000
+
+# Seconds a purge waits before retrying a batch while another writer holds the database
+PURGE_RETRY_DELAY = 0.5
+
+# Progress callbacks are called at most once per interval (20 times a second)
+PROGRESS_INTERVAL = 0.05
+
+# Throughput passed along with each progress report; rate is in progress units
+# per second and eta in seconds, or None while unknown
+ProgressStats = namedtuple('ProgressStats', ['elapsed', 'bytes_done', 'rate', 'bytes_rate', 'eta'])
+
+
+class ProgressThrottle:
+    """Pass progress reports on to a callback at most once per interval
+
+    Operations report every entry they handle; reports that arrive before
+    the interval is up are dropped, so a fast scan is never held up by its
+    listener or floods a GUI event queue. The callback is called with
+    (value, total, message, stats) where stats is a ProgressStats.
+    """
+
+    def __init__(self, callback, interval=PROGRESS_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self.started = time.monotonic()
+        self.next_report = 0.0
+
+    def start(self):
+        """Measure rates from now on"""
+        self.started = time.monotonic()
+        self.next_report = 0.0
+
+    def is_due(self):
+        return time.monotonic() >= self.next_report
+
+    def __call__(self, value, total, message, bytes_done=0):
+        now = time.monotonic()
+        if now < self.next_report:
+            return
+        self.next_report = now + self.interval
+        elapsed = max(now - self.started, 1e-6)
+        rate = value / elapsed
+        eta = (total - value) / rate if rate and total > value else None
+        self.callback(value, total, message, ProgressStats(elapsed, bytes_done, rate, bytes_done / elapsed, eta))
+
+
+def format_progress(value, total, stats):
+    """Describe a progress report in one line, e.g. '1,200/5,000 · 300/s · 12.5 MB/s · ETA 0:16'"""
+    parts = [f"{value:,}/{total:,}"]
+    if stats is not None:
+        parts.append(f"{stats.rate:,.0f}/s")
+        if stats.bytes_done:
+            parts.append(f"{stats.bytes_rate / (1024 * 1024):,.1f} MB/s")
+        if stats.eta is not None:
+            minutes, seconds = divmod(int(stats.eta), 60)
+            parts.append(f"ETA {minutes // 60}:{minutes % 60:02d}:{seconds:02d}" if minutes >= 60
+                         else f"ETA {minutes}:{seconds:02d}")
+    return " · ".join(parts)
+
+
+class OperationCancelled(Exception):
+    """Raised out of run() when an operation was cancelled"""
+
+
+class CatalogOperation:
+    """Base for long-running catalog operations
+
+    Subclasses implement execute(conn). run(conn) wraps it in a transaction
+    that is committed on success and rolled back on errors or cancellation.
+    Progress is reported through progress(value, total, message, stats),
+    throttled by a ProgressThrottle. Files
+    are hashed through a HashCache, so unchanged files are not read again.
+    With more than one scan worker, trees are walked by a
+    ParallelTreeScanner; scan_workers=None picks by file system. Given a
+    Profile, scanning and hashing are timed into it; SQL is timed when the
+    connection comes from catalog_profile.connect() with the same profile.
+    """
+
+    def __init__(self, hash_workers=DEFAULT_HASH_WORKERS, progress=None, scan_workers=DEFAULT_SCAN_WORKERS,
+                 profile=None):
+        self.hash_workers = hash_workers
+        self.scan_workers = scan_workers
+        self.profile = profile
+        self.progress = ProgressThrottle(progress or (lambda value, total, message, stats: None))
+        self.scanner = None
+        self.hasher = None
+        self.hash_cache = None
+        self.files_processed = 0
+        self.bytes_processed = 0
+        self.is_cancelled = False
+
+    def run(self, conn):
+        if self.profile:
+            self.profile.start()
+        tune_connection(conn)
+        self.progress.start()
+        self.hash_cache = HashCache(conn)
+        try:
+            result = self.execute(conn)
+            if self.is_cancelled:
+                raise OperationCancelled()
+            self.hash_cache.flush()
+            if self.hash_cache.hits or self.hash_cache.misses:
+                evict_hash_cache(conn)
+        except BaseException:
+            # Stop background hashing before rolling back, e.g. on Ctrl-C
+            self.cancel()
+            conn.rollback()
+            raise
+        finally:
+            if self.hasher:
+                self.hasher.close()
+            if self.profile:
+                self.profile.stop()
+        conn.commit()
+        return result
+
+    def execute(self, conn):
+        raise NotImplementedError
+
+    def start_scan(self, root_path):
+        """Create the scanner and the cached hash pipeline for a tree"""
+        workers = self.scan_workers or scan_workers_for(root_path)
+        if workers > 1:
+            self.scanner = self.scanner_class(ParallelTreeScanner)(root_path, workers)
+        else:
+            self.scanner = self.scanner_class(TreeScanner)(root_path)
+        self.hasher = CachedHasher(self.hash_pipeline(), self.hash_cache)
+        return self.scanner
+
+    def scanner_class(self, base):
+        return profiled_scanner(base, self.profile) if self.profile else base
+
+    def hash_pipeline(self):
+        if self.profile:
+            return ProfiledHashPipeline(self.profile, self.hash_workers)
+        return HashPipeline(self.hash_workers)
+
+    def report(self, message, path):
+        """Report progress through the scanned files; the message is only built when it is passed on"""
+        if self.progress.is_due():
+            self.progress(self.files_processed, self.scanner.estimated_total(), f"{message}: {path}",
+                          self.bytes_processed)
+
+    def check_cancelled(self):
+        if self.is_cancelled:
+            raise OperationCancelled()
+
+    def cancel(self):
+        self.is_cancelled = True
+        if self.scanner:
+            self.scanner.cancel()
+        if self.hasher:
+            self.hasher.cancel()
+
+
+class CatalogScan(CatalogOperation):
+    """Scan a folder into a new catalog
+
+    algorithm names the fingerprint stored for every file, or is None to
+    skip hashing. Full hashes are stored together with a sample fingerprint
+    taken from the same read.
+    """
+
+    def __init__(self, root_path, algorithm, name=None, **kwargs):
+        super().__init__(**kwargs)
+        self.root_path = root_path
+        self.algorithm = algorithm
+        self.algorithms = fingerprint_algorithms(algorithm)
+        self.catalog_name = name or os.path.basename(root_path)
+        self.catalog_id = None
+        self.rows = None
+        self.totals = DirectoryTotals()
+
+    def execute(self, conn):
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO catalogs (name, root_path, hash_algorithm) VALUES (?, ?, ?)',
+            (self.catalog_name, self.root_path, self.algorithm)
+        )
+        self.catalog_id = cursor.lastrowid
+
+        # Walk through directory once and save structure in a single bulk load
+        scanner = self.start_scan(self.root_path)
+        with BulkLoad(conn):
+            self.rows = CatalogWriter(conn, self.catalog_id)
+            self.insert_entry(scanner.root_entry())
+            for entry in scanner.scan():
+                self.check_cancelled()
+
+                # Save directories
+                if entry.is_directory:
+                    self.insert_entry(entry)
+                    self.report("Processing directory", entry.path)
+                    continue
+
+                # Save files, hashing them in the background if requested
+                if self.algorithms:
+                    self.hasher.submit(entry, entry, self.algorithms)
+                else:
+                    self.save_file(entry, (None, None))
+                for hashed_entry, digests in self.hasher.completed():
+                    self.save_file(hashed_entry, self.fingerprints(digests))
+
+            # Save the files whose hashes are still in flight
+            for hashed_entry, digests in self.hasher.drain():
+                self.save_file(hashed_entry, self.fingerprints(digests))
+            self.check_cancelled()
+            self.rows.flush()
+            self.totals.write(cursor, self.rows.dir_ids)
+        return self.catalog_id
+
+    def save_file(self, entry, fingerprints):
+        """Store a scanned file and report progress"""
+        self.insert_entry(entry, fingerprints)
+        self.files_processed += 1
+        self.bytes_processed += entry.size
+        self.report("Processing", entry.path)
+
+    def insert_entry(self, entry, fingerprints=(None, None)):
+        """Queue a scanned file or directory row for insertion"""
+        if entry.is_directory:
+            self.rows.add_directory(entry.path, entry.parent, entry.name, entry.mtime_ns, entry.inode)
+        else:
+            md5_hash, sample_hash = fingerprints
+            self.rows.add_file(entry.parent, entry.name, entry.size, entry.mtime_ns, md5_hash, entry.inode,
+                               sample_hash)
+            self.totals.add(entry.parent, entry.size, entry.mtime_ns)
+
+    def fingerprints(self, digests):
+        """Turn the digests of a hash job into (md5_hash, sample_hash) column values"""
+        if digests is None:
+            return None, None
+        by_algorithm = dict(zip(self.algorithms, digests))
+        full = None if self.algorithm == SAMPLE_ALGORITHM else by_algorithm.get(self.algorithm)
+        return full, by_algorithm.get(SAMPLE_ALGORITHM)
+
+
+class CatalogUpdate(CatalogScan):
+    """Update an existing catalog in place, touching only rows that changed"""
+
+    def __init__(self, catalog_id, catalog_name, root_path, algorithm, **kwargs):
+        super().__init__(root_path, algorithm, name=catalog_name, **kwargs)
+        self.catalog_id = catalog_id
+        self.dir_updates = None
+        self.file_updates = None
+        self.dir_deletes = None
+        self.file_deletes = None
+        self.duplicate_deletes = None
+        self.search_deletes = None
+        self.rehash_all = False
+        self.added = 0
+        self.changed = 0
+        self.removed = 0
+
+    def execute(self, conn):
+        cursor = self.begin_update(conn)
+
+        # Stored rows and the scan are merged in tree order like CatalogCompare
+        # does, so memory use does not grow with the catalog
+        scanner = self.start_scan(self.root_path)
+        self.update_root(conn, scanner.root_entry())
+        self.merge(iter_catalog_tree(conn, self.catalog_id), scanner.scan())
+        return self.finish_update(cursor, ())
+
+    def update_root(self, conn, live_root):
+        """Update the stored mtime and inode of the root directory, which no tree walk yields"""
+        stored_root = find_directory(conn, self.catalog_id, '')
+        if self.is_modified(stored_root, live_root):
+            self.dir_updates.add((live_root.mtime_ns, live_root.inode, stored_root.id))
+            self.changed += 1
+
+    def merge(self, stored_entries, live_entries):
+        """Apply a scan to the stored rows of the same part of the tree, both in tree order"""
+        for stored, live in merge_entries(stored_entries, live_entries):
+            self.check_cancelled()
+            if live is None:
+                # Whatever was not seen during the scan no longer exists
+                self.delete_entry(stored)
+            else:
+                self.update_entry(live, stored)
+
+    def begin_update(self, conn):
+        """Take the write lock and set up the row writers; returns the cursor they write through"""
+        cursor = conn.cursor()
+        # Take the write lock up front; CatalogWriter assigns directory ids itself
+        conn.execute('BEGIN IMMEDIATE')
+
+        # Stored fingerprints can only be kept when the algorithm stays the same
+        self.rehash_all = (self.algorithm is not None
+                           and self.algorithm != catalog_hash_algorithm(conn, self.catalog_id))
+        if self.algorithm is not None:
+            cursor.execute('UPDATE catalogs SET hash_algorithm = ? WHERE id = ?', (self.algorithm, self.catalog_id))
+
+        self.rows = CatalogWriter(conn, self.catalog_id)
+        self.dir_updates = BatchWriter(cursor, 'UPDATE directories SET modified_at = ?, inode = ? WHERE id = ?')
+        self.file_updates = BatchWriter(cursor, 'UPDATE files SET size = ?, modified_at = ?, md5_hash = ?, inode = ?, sample_hash = ? WHERE id = ?')
+        self.dir_deletes = BatchWriter(cursor, 'DELETE FROM directories WHERE id = ?')
+        self.file_deletes = BatchWriter(cursor, 'DELETE FROM files WHERE id = ?')
+        self.duplicate_deletes = BatchWriter(cursor, 'DELETE FROM duplicate_files WHERE file_id = ?')
+        self.search_deletes = BatchWriter(cursor, 'DELETE FROM file_search WHERE rowid = ?')
+        return cursor
+
+    def update_entry(self, entry, stored):
+        """Insert, update or keep the row of one scanned entry; stored is its row or None"""
+        # An entry that switched between file and directory is replaced
+        if stored is not None and stored.is_directory != entry.is_directory:
+            self.delete_entry(stored)
+            stored = None
+
+        if entry.is_directory:
+            if stored is None:
+                self.insert_entry(entry)
+                self.added += 1
+            elif self.is_modified(stored, entry):
+                # A changed directory mtime means entries were added, removed or renamed in it
+                self.dir_updates.add((entry.mtime_ns, entry.inode, stored.id))
+                self.changed += 1
+            self.report("Processing directory", entry.path)
+            return
+
+        # Only re-hash new files, files whose metadata changed, or files never hashed
+        is_modified = stored is not None and self.is_modified(stored, entry)
+        if self.algorithms and (stored is None or is_modified or self.rehash_all
+                                or not self.has_fingerprints(stored)):
+            self.hasher.submit(entry, (entry, stored), self.algorithms)
+        elif stored is None or is_modified:
+            self.save_file((entry, stored), (None, None))
+        else:
+            self.save_file((entry, stored), (stored.md5_hash, stored.sample_hash))
+        for job, digests in self.hasher.completed():
+            self.save_file(job, self.fingerprints(digests))
+
+    def finish_update(self, cursor, removed):
+        """Save the files still being hashed, delete the removed rows and write all changes"""
+        for job, digests in self.hasher.drain():
+            self.save_file(job, self.fingerprints(digests))
+        self.check_cancelled()
+
+        for stored in removed:
+            self.delete_entry(stored)
+        self.rows.flush()
+        for writer in (self.dir_updates, self.file_updates, self.dir_deletes, self.file_deletes,
+                       self.duplicate_deletes, self.search_deletes):
+            writer.flush()
+        self.totals.write(cursor, self.rows.dir_ids)
+        return self.added, self.changed, self.removed
+
+    def save_file(self, job, fingerprints):
+        """Insert a new file row or update a stored one if anything changed"""
+        entry, stored = job
+        if stored is None:
+            self.insert_entry(entry, fingerprints)
+            self.added += 1
+        elif self.is_modified(stored, entry) or fingerprints != (stored.md5_hash, stored.sample_hash):
+            md5_hash, sample_hash = fingerprints
+            self.file_updates.add((entry.size, entry.mtime_ns, md5_hash, entry.inode, sample_hash, stored.id))
+            self.totals.change(entry.parent, stored.size or 0, entry.size, stored.modified_at, entry.mtime_ns)
+            self.changed += 1
+        self.files_processed += 1
+        self.bytes_processed += entry.size
+        self.report("Processing", entry.path)
+
+    def delete_entry(self, stored):
+        """Queue a stored directory or file row for deletion"""
+        writer = self.dir_deletes if stored.is_directory else self.file_deletes
+        writer.add((stored.id,))
+        if not stored.is_directory:
+            self.duplicate_deletes.add((stored.id,))
+            self.search_deletes.add((stored.id,))
+            self.totals.remove(os.path.dirname(stored.path), stored.size or 0)
+        self.removed += 1
+
+    def has_fingerprints(self, stored):
+        """Check whether a stored file has every fingerprint the update stores"""
+        if stored.sample_hash is None:
+            return False
+        return self.algorithm == SAMPLE_ALGORITHM or stored.md5_hash is not None
+
+    def is_modified(self, stored, entry):
+        """Check whether a stored row's size, mtime or inode differ from a scanned entry"""
+        if stored.inode is not None and stored.inode != entry.inode:
+            return True
+        if not entry.is_directory and stored.size != entry.size:
+            return True
+        return not same_mtime(stored.modified_at, entry.mtime_ns)
+
+
+class CatalogRefresh(CatalogUpdate):
+    """Update only the directories of a catalog that are known to have changed
+
+    dirs are relative paths of directories whose own entries changed; only
+    their listings are merged with the stored rows, and subdirectories
+    that are new there are scanned in full. subtrees are rescanned
+    completely, for parts of the tree whose changes were not followed.
+    Directory totals are adjusted by the same deltas as a full update, and
+    nothing outside the given paths is read. Paths that are no longer
+    stored or no longer on disk are handled through their parent.
+    """
+
+    def __init__(self, catalog_id, catalog_name, root_path, algorithm, dirs=(), subtrees=(), **kwargs):
+        # Single directories are listed in place, which the parallel scanner can't do
+        kwargs['scan_workers'] = 1
+        super().__init__(catalog_id, catalog_name, root_path, algorithm, **kwargs)
+        self.dirs = set(dirs)
+        self.subtrees = set(subtrees)
+        self.conn = None
+        self.cascade = False
+        self.recursive = True
+
+    def execute(self, conn):
+        if not os.path.isdir(self.root_path):
+            raise FileNotFoundError(f"catalog folder '{self.root_path}' is not available")
+        cursor = self.begin_update(conn)
+        self.conn = conn
+        scanner = self.start_scan(self.root_path)
+        for path, recursive in self.scopes(conn, scanner):
+            self.check_cancelled()
+            # Listed directories lose whole subtrees when a subdirectory is gone
+            self.cascade = not recursive
+            self.recursive = recursive
+            stored_dir = find_directory(conn, self.catalog_id, path)
+            live_dir = scanner.entry_at(path)
+            if path:
+                self.update_entry(live_dir, stored_dir)
+            else:
+                self.update_root(conn, live_dir)
+            self.merge(iter_subtree(conn, stored_dir.id, path, recursive), scanner.scan_directory(path, recursive))
+        return self.finish_update(cursor, ())
+
+    def update_entry(self, entry, stored):
+        """Update one listed entry, scanning directories that are new in a listing in full"""
+        super().update_entry(entry, stored)
+        if not self.recursive and entry.is_directory and (stored is None or not stored.is_directory):
+            # Its rows all lie below the listing the merge reads, so they are never met
+            for child in self.scanner.scan_directory(entry.path):
+                super().update_entry(child, None)
+
+    def scopes(self, conn, scanner):
+        """Return (path, recursive) for every directory to refresh, parents first
+
+        Paths that are not stored as directories, or are gone from disk, are
+        replaced by a listing of their parent, and paths inside a rescanned
+        subtree are dropped.
+        """
+        subtrees, dirs = set(), set()
+        for path, recursive in [(path, True) for path in self.subtrees] + [(path, False) for path in self.dirs]:
+            while path:
+                live = scanner.entry_at(path)
+                if live is not None and live.is_directory and find_directory(conn, self.catalog_id, path):
+                    break
+                # The parent's listing picks up what happened to the path itself
+                path = os.path.dirname(path)
+                recursive = False
+            (subtrees if recursive else dirs).add(path)
+
+        subtrees = {path for path in subtrees
+                    if not any(other != path and is_within(path, other) for other in subtrees)}
+        dirs = {path for path in dirs if not any(is_within(path, subtree) for subtree in subtrees)}
+        return sorted([(path, True) for path in subtrees] + [(path, False) for path in dirs],
+                      key=lambda scope: tree_key(scope[0]))
+
+    def delete_entry(self, stored):
+        """Queue a stored row for deletion, with everything below it while directories are listed"""
+        if self.cascade and stored.is_directory:
+            for child in iter_subtree(self.conn, stored.id, stored.path):
+                super().delete_entry(child)
+        super().delete_entry(stored)
+
+
+class CatalogExport(CatalogOperation):
+    """Write a catalog to a file, or to standard output, with catalog_transfer.export_catalog()
+
+    Nothing is written to the database; the export can run on a read-only
+    connection.
+    """
+
+    def __init__(self, catalog_id, path=None, file_format=None, compression=None, **kwargs):
+        super().__init__(**kwargs)
+        self.catalog_id = catalog_id
+        self.path = path
+        self.file_format = file_format
+        self.compression = compression
+        self.entries_written = 0
+
+    def execute(self, conn):
+        self.entries_written = export_catalog(conn, self.catalog_id, self.path, self.file_format, self.compression,
+                                              self.report_entry)
+        return self.entries_written
+
+    def run(self, conn):
+        # Skip the WAL switch and the hash cache of run(), which would both need a writable connection
+        if self.profile:
+            self.profile.start()
+        self.progress.start()
+        try:
+            return self.execute(conn)
+        finally:
+            if self.profile:
+                self.profile.stop()
+
+    def report_entry(self, value, total, message):
+        """Report progress through the exported entries, and stop the export once cancelled"""
+        self.check_cancelled()
+        if self.progress.is_due():
+            self.progress(value, total, message)
+
+
+class CatalogImport(CatalogScan):
+    """Load an exported catalog into a new catalog
+
+    source is a catalog_transfer.CatalogReader. Its entries go through the
+    same bulk load as a scan, so nothing is read from disk and fingerprints
+    are kept as exported. name, root_path and algorithm default to the
+    fields stored with the export. Directories missing from the export are
+    created from the paths of their entries.
+    """
+
+    def __init__(self, source, name=None, root_path=None, algorithm=None, **kwargs):
+        root_path = root_path or source.header.get('root_path') or ''
+        super().__init__(root_path, algorithm or source.header.get('hash_algorithm'),
+                         name=name or source.header.get('name') or os.path.basename(root_path), **kwargs)
+        self.source = source
+        self.entries_read = 0
+
+    def execute(self, conn):
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO catalogs (name, root_path, hash_algorithm) VALUES (?, ?, ?)',
+            (self.catalog_name, self.root_path, self.algorithm)
+        )
+        self.catalog_id = cursor.lastrowid
+
+        with BulkLoad(conn):
+            self.rows = CatalogWriter(conn, self.catalog_id)
+            self.insert_directory('')
+            for entry in self.source:
+                self.check_cancelled()
+                self.entries_read += 1
+                parent = os.path.dirname(entry.path)
+                if parent not in self.rows.dir_ids:
+                    self.insert_directory(parent)
+                if entry.is_directory:
+                    # Directories created for earlier entries already have their row
+                    if entry.path not in self.rows.dir_ids:
+                        self.insert_entry(ScanEntry(entry.path, parent, None, entry.name, True, 0,
+                                                    entry.modified_at, entry.inode, None))
+                    continue
+                self.insert_entry(ScanEntry(entry.path, parent, None, entry.name, False, entry.size,
+                                            entry.modified_at, entry.inode, None),
+                                  (entry.md5_hash, entry.sample_hash))
+                self.files_processed += 1
+                self.bytes_processed += entry.size
+                self.report("Importing", entry.path)
+
+            self.check_cancelled()
+            self.rows.flush()
+            self.totals.write(cursor, self.rows.dir_ids)
+        return self.catalog_id
+
+    def insert_directory(self, path):
+        """Queue a directory without stored details, and its missing parents"""
+        missing = []
+        while path not in self.rows.dir_ids:
+            missing.append(path)
+            if not path:
+                break
+            path = os.path.dirname(path)
+        for path in reversed(missing):
+            if path:
+                name = os.path.basename(path)
+            else:
+                name = os.path.basename(os.path.normpath(self.root_path)) if self.root_path else self.catalog_name
+            self.insert_entry(ScanEntry(path, os.path.dirname(path) if path else None, None, name, True, 0,
+                                        None, None, None))
+
+    def report(self, message, path):
+        """Report progress through the source file; the total is estimated from how much of it was read"""
+        if self.progress.is_due():
+            self.progress(self.entries_read, self.source.estimated_total(self.entries_read), f"{message}: {path}",
+                          self.source.bytes_read())
+
+
+class CatalogCompare(CatalogOperation):
+    """Compare a stored catalog against a live folder
+
+    Catalog rows and the live scan are both read in tree order and merged
+    like a sorted merge-join, so memory use does not grow with the size of
+    the tree. Differences are streamed into compare_results and run()
+    returns the id of the compare run.
+
+    options['content'] selects the content check: None, 'sample', 'full'
+    or 'tiered', which hashes a file in full only when its sample matches.
+    When the catalog has no full hashes that can be taken here, the full
+    tier is dropped with a warning and full_hash_skipped is set.
+    """
+
+    def __init__(self, catalog_id, compare_path, options, **kwargs):
+        super().__init__(**kwargs)
+        self.catalog_id = catalog_id
+        self.compare_path = compare_path
+        self.options = options
+        self.run_id = None
+        self.results = None
+        self.differences = 0
+        self.algorithm = None
+        self.full_hash_skipped = False
+
+    def execute(self, conn):
+        cursor = conn.cursor()
+        self.algorithm = checkable_hash_algorithm(conn, self.catalog_id)
+        if self.options.get('content') in ('full', 'tiered') and self.algorithm is None:
+            self.full_hash_skipped = True
+            log.warning("catalog %s has no full hashes that can be checked here (%s), comparing %s",
+                        self.catalog_id, catalog_hash_algorithm(conn, self.catalog_id) or 'not hashed',
+                        'sample fingerprints only' if self.options['content'] == 'tiered' else 'without contents')
+        # Only the latest compare run of a catalog is kept
+        purge_compare_runs(conn, self.catalog_id)
+        cursor.execute(
+            'INSERT INTO compare_runs (catalog_id, compare_path) VALUES (?, ?)',
+            (self.catalog_id, self.compare_path)
+        )
+        self.run_id = cursor.lastrowid
+        self.results = BatchWriter(cursor, INSERT_COMPARE_RESULT_SQL)
+
+        scanner = self.start_scan(self.compare_path)
+        for stored, live in merge_entries(iter_catalog_tree(conn, self.catalog_id), scanner.scan()):
+            self.check_cancelled()
+            if live is None:
+                self.record(stored.path, 'missing', None, stored, None)
+                self.report("Missing file", stored.path)
+            elif stored is None:
+                self.record(live.path, 'new', None, None, live)
+                self.processed(live, "New file")
+            else:
+                self.compare_entry(stored, live)
+
+            for (stored_file, live_file, tiers), digests in self.hasher.completed():
+                self.check_fingerprint(stored_file, live_file, tiers, digests)
+
+        # Wait for the hashes still in flight
+        for (stored_file, live_file, tiers), digests in self.hasher.drain():
+            self.check_fingerprint(stored_file, live_file, tiers, digests)
+        self.check_cancelled()
+        self.results.flush()
+        return self.run_id
+
+    def compare_entry(self, stored, live):
+        """Compare a catalog entry with the live entry at the same path"""
+        if stored.is_directory != live.is_directory:
+            self.record(live.path, 'modified', 'type', stored, live)
+        elif live.is_directory:
+            self.report("Processing directory", live.path)
+            return
+        elif self.options['check_size'] and live.size != stored.size:
+            self.record(live.path, 'modified', 'size', stored, live)
+            self.report("Size difference", live.path)
+        else:
+            tiers = self.content_tiers(stored)
+            if tiers:
+                self.hasher.submit(live, (stored, live, tiers), tiers[:1])
+        self.processed(live, "Processing")
+
+    def content_tiers(self, stored):
+        """Return the fingerprint algorithms to check a file with, cheapest first"""
+        content = self.options.get('content')
+        tiers = []
+        if content in ('sample', 'tiered') and stored.sample_hash:
+            tiers.append(SAMPLE_ALGORITHM)
+        if content in ('full', 'tiered') and stored.md5_hash and self.algorithm:
+            tiers.append(self.algorithm)
+        return tiers
+
+    def processed(self, live, message):
+        """Count a live file as processed and report progress"""
+        if not live.is_directory:
+            self.files_processed += 1
+            self.bytes_processed += live.size
+        self.report(message, live.path)
+
+    def check_fingerprint(self, stored, live, tiers, digests):
+        """Record a difference when a fingerprint doesn't match, or go on to the next tier"""
+        # Files that could not be read are left unjudged
+        if digests is None:
+            return
+        is_sample = tiers[0] == SAMPLE_ALGORITHM
+        if digests[0] != (stored.sample_hash if is_sample else stored.md5_hash):
+            self.record(live.path, 'modified', 'sample' if is_sample else 'hash', stored, live)
+            self.report("Content difference", live.path)
+        elif len(tiers) > 1:
+            self.hasher.submit(live, (stored, live, tiers[1:]), tiers[1:2])
+
+    def record(self, path, status, detail, stored, live):
+        """Queue one difference for the compare_results table"""
+        entry = live or stored
+        self.results.add((
+            self.run_id, path, status, detail, entry.is_directory,
+            stored.size if stored else None,
+            live.size if live else None,
+            stored.modified_at if stored else None,
+            live.mtime_ns if live else None,
+        ))
+        self.differences += 1
+
+
+class CatalogDiff(CatalogOperation):
+    """Compare two stored catalogs without touching the filesystem
+
+    The catalog is the left side and the other catalog takes the place of
+    the live folder, so results read like a folder compare. run() returns
+    the id of the compare run. Full hashes are only compared when both
+    catalogs use the same algorithm; otherwise the full tier is dropped
+    with a warning and full_hash_skipped is set.
+    """
+
+    def __init__(self, catalog_id, other_catalog_id, options, **kwargs):
+        super().__init__(**kwargs)
+        self.catalog_id = catalog_id
+        self.other_catalog_id = other_catalog_id
+        self.options = options
+        self.run_id = None
+        self.differences = 0
+        self.full_hash_skipped = False
+
+    def execute(self, conn):
+        cursor = conn.cursor()
+        content = self.options.get('content')
+        if content in ('full', 'tiered') and shared_hash_algorithm(conn, self.catalog_id, self.other_catalog_id) is None:
+            self.full_hash_skipped = True
+            log.warning("catalogs %s and %s have no full hashes of the same algorithm, comparing %s",
+                        self.catalog_id, self.other_catalog_id,
+                        'sample fingerprints only' if content == 'tiered' else 'without contents')
+        purge_compare_runs(conn, self.catalog_id)
+        cursor.execute('SELECT root_path FROM catalogs WHERE id = ?', (self.other_catalog_id,))
+        other_root_path, = cursor.fetchone()
+        cursor.execute(
+            'INSERT INTO compare_runs (catalog_id, compare_path, other_catalog_id) VALUES (?, ?, ?)',
+            (self.catalog_id, other_root_path, self.other_catalog_id)
+        )
+        self.run_id = cursor.lastrowid
+        self.progress(0, 1, "Comparing catalogs...")
+        self.differences = diff_catalogs(conn, self.run_id, self.catalog_id, self.other_catalog_id,
+                                         self.options['check_size'], self.options.get('content'))
+        self.progress(1, 1, f"{self.differences} differences")
+        return self.run_id
+
+
+class DuplicateSearch(CatalogOperation):
+    """Find files with the same contents across all catalogs
+
+    Candidates are narrowed in tiers: files are grouped by size through the
+    size index, split by stored or freshly taken sample fingerprints, and
+    only files whose samples tie are compared by full hash. A file is only
+    read when its catalog folder is available and it still has its
+    cataloged size and mtime. Size groups are handled a chunk at a time, so
+    memory use does not grow with the number of cataloged files. Sets are
+    stored in duplicate_files and run() returns how many were found.
+    """
+
+    def __init__(self, min_size=1, **kwargs):
+        super().__init__(**kwargs)
+        self.min_size = min_size
+        self.catalogs = {}
+        self.results = None
+        self.sets_found = 0
+        self.unverified = 0
+        self.groups_processed = 0
+        self.total_groups = 0
+
+    def execute(self, conn):
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM duplicate_files')
+        self.results = BatchWriter(cursor, 'INSERT INTO duplicate_files (set_id, file_id) VALUES (?, ?)')
+        self.hasher = CachedHasher(self.hash_pipeline(), self.hash_cache)
+
+        # Offline catalogs are only matched by their stored fingerprints
+        cursor.execute('SELECT id, root_path, hash_algorithm FROM catalogs')
+        self.catalogs = {
+            catalog_id: (root_path, algorithm, os.path.isdir(root_path))
+            for catalog_id, root_path, algorithm in cursor.fetchall()
+        }
+        self.total_groups = count_duplicate_sizes(conn, self.min_size)
+
+        chunk = []
+        chunk_files = 0
+        for size, candidates in duplicate_size_groups(conn, self.min_size):
+            self.check_cancelled()
+            chunk.append(candidates)
+            chunk_files += len(candidates)
+            if chunk_files >= DUPLICATE_CHUNK_FILES:
+                self.process_chunk(chunk)
+                chunk = []
+                chunk_files = 0
+        self.process_chunk(chunk)
+        self.results.flush()
+        return self.sets_found
+
+    def process_chunk(self, groups):
+        """Narrow a chunk of same-size groups down to duplicate sets"""
+        live = {}
+
+        # Take sample fingerprints of available files that have none stored
+        samples = {candidate.id: candidate.sample_hash
+                   for candidates in groups for candidate in candidates if candidate.sample_hash}
+        samples.update(self.fingerprint(
+            [candidate for candidates in groups for candidate in candidates if not candidate.sample_hash],
+            SAMPLE_ALGORITHM, live
+        ))
+
+        # Work out a content key per file, fully hashing only files whose sample ties
+        keys = {}
+        pending = {}
+        for candidates in groups:
+            sample_counts = Counter(samples.get(candidate.id) for candidate in candidates)
+            algorithm = self.group_algorithm(candidates)
+            for candidate in candidates:
+                sample = samples.get(candidate.id)
+                stored = self.stored_key(candidate)
+                if sample and candidate.size <= 3 * SAMPLE_SIZE:
+                    # The sample of a small file covers all of it
+                    keys[candidate.id] = (SAMPLE_ALGORITHM, sample)
+                elif sample and sample_counts[sample] == 1:
+                    # A unique sample rules out the other files, even one whose stored hash matches
+                    keys[candidate.id] = None
+                elif stored and stored[0] == algorithm:
+                    keys[candidate.id] = stored
+                elif self.live_entry(candidate, live):
+                    pending.setdefault(algorithm, []).append(candidate)
+                else:
+                    keys[candidate.id] = stored
+                    if stored is None:
+                        self.unverified += 1
+        for algorithm, candidates in pending.items():
+            digests = self.fingerprint(candidates, algorithm, live)
+            for candidate in candidates:
+                if candidate.id in digests:
+                    keys[candidate.id] = (algorithm, digests[candidate.id])
+                else:
+                    self.unverified += 1
+
+        for candidates in groups:
+            sets = {}
+            for candidate in candidates:
+                key = keys.get(candidate.id)
+                if key is not None:
+                    sets.setdefault(key, []).append(candidate.id)
+            for file_ids in sets.values():
+                if len(file_ids) > 1:
+                    self.sets_found += 1
+                    for file_id in file_ids:
+                        self.results.add((self.sets_found, file_id))
+            self.groups_processed += 1
+            self.progress(self.groups_processed, self.total_groups,
+                          f"Checking {len(candidates)} files of {candidates[0].size} bytes")
+
+    def group_algorithm(self, candidates):
+        """Pick the full hash algorithm most of a size group already has stored"""
+        counts = Counter(
+            self.catalogs[candidate.catalog_id][1] for candidate in candidates
+            if candidate.md5_hash and self.catalogs[candidate.catalog_id][1] in available_algorithms()
+        )
+        counts.pop(SAMPLE_ALGORITHM, None)
+        return counts.most_common(1)[0][0] if counts else DEFAULT_ALGORITHM
+
+    def stored_key(self, candidate):
+        """Return the (algorithm, digest) full hash stored for a file, or None"""
+        algorithm = self.catalogs[candidate.catalog_id][1]
+        if candidate.md5_hash and algorithm not in (None, SAMPLE_ALGORITHM):
+            return algorithm, candidate.md5_hash
+        return None
+
+    def live_entry(self, candidate, live):
+        """Return a ScanEntry for a file that is available and unchanged, or None"""
+        if candidate.id not in live:
+            live[candidate.id] = None
+            root_path, _, available = self.catalogs[candidate.catalog_id]
+            full_path = os.path.join(root_path, candidate.path)
+            try:
+                st = os.stat(full_path) if available else None
+            except OSError:
+                st = None
+            if st is not None and st.st_size == candidate.size and same_mtime(candidate.modified_at, st.st_mtime_ns):
+                live[candidate.id] = ScanEntry(candidate.path, None, full_path, os.path.basename(full_path), False,
+                                               st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)
+        return live[candidate.id]
+
+    def fingerprint(self, candidates, algorithm, live):
+        """Hash the available files among candidates; returns file id -> digest"""
+        for candidate in candidates:
+            entry = self.live_entry(candidate, live)
+            if entry is not None:
+                self.hasher.submit(entry, candidate.id, (algorithm,))
+        digests = {}
+        for file_id, result in self.hasher.drain():
+            if result is not None:
+                digests[file_id] = result[0]
+        self.check_cancelled()
+        return digests
+
+
+class CatalogPurge:
+    """Remove the rows of deleted catalogs in the background and give the space back
+
+    Unlike a CatalogOperation this commits after every batch of
+    purge_deleted_catalogs(), so catalog scans and searches in other
+    connections only ever wait for one small batch. run() does the whole
+    purge; step() and reclaim() do one batch each, so a caller can queue
+    them between other writes on a shared connection. A batch that finds
+    the database locked is retried after PURGE_RETRY_DELAY. Once the rows
+    are gone, free pages are handed back to the file system a step at a
+    time when the database uses incremental auto-vacuum. Cancelling stops
+    after the current batch; the next purge carries on from there.
+    """
+
+    def __init__(self, progress=None):
+        self.progress = ProgressThrottle(progress or (lambda value, total, message, stats: None))
+        self.rows_removed = 0
+        self.total = None
+        self.is_cancelled = False
+        self._batches = None
+
+    def run(self, conn):
+        while self.step(conn):
+            pass
+        while self.reclaim(conn):
+            pass
+        return self.rows_removed
+
+    def step(self, conn):
+        """Remove one batch of rows; returns False once none are left or the purge was cancelled"""
+        if self.is_cancelled:
+            return False
+        if self._batches is None:
+            self.progress.start()
+            self.total = count_deleted_rows(conn)
+            self._batches = purge_deleted_catalogs(conn)
+        try:
+            removed = next(self._batches, None)
+            if removed is None:
+                return False
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            # The batch is rolled back and read again on the next step
+            conn.rollback()
+            self._batches = purge_deleted_catalogs(conn)
+            time.sleep(PURGE_RETRY_DELAY)
+            return True
+        self.rows_removed += removed
+        self.progress(self.rows_removed, self.total, "Removing deleted catalogs")
+        return True
+
+    def reclaim(self, conn):
+        """Hand one step of free pages back to the file system; returns False when done"""
+        if self.is_cancelled or conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return False
+        try:
+            return reclaim_free_pages(conn) > 0
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            time.sleep(PURGE_RETRY_DELAY)
+            return True
+
+    def cancel(self):
+        self.is_cancelled = True
+
+
+def same_mtime(modified_at, mtime_ns):
+    """Check a stored modified_at against a live st_mtime_ns
+
+    Catalogs from before schema version 10 kept microseconds, so mtimes
+    less than a microsecond apart count as the same.
+    """
+    return modified_at is not None and abs(modified_at - mtime_ns) < MTIME_TOLERANCE_NS
+
+
+def is_within(path, parent):
+    """Check whether a relative path is parent itself or below it; '' is the root"""
+    return not parent or path == parent or path.startswith(parent + os.sep)
+
+
+def keyed_entries(entries):
+    """Pair entries with their tree-order sort key for merging"""
+    for entry in entries:
+        yield tree_key(entry.path), entry
+
+
+def merge_entries(stored_entries, live_entries):
+    """Merge stored rows and scanned entries, both in tree order, into (stored, live) pairs by path
+
+    Either side is None where the path only exists on the other one. Like a
+    sorted merge-join, only the next entry of each side is held. Each side
+    is read one entry ahead, so rows written at paths that have already
+    been yielded are never met by the stored side's open cursors.
+    """
+    stored_entries = keyed_entries(stored_entries)
+    live_entries = keyed_entries(live_entries)
+    stored_key, stored = next(stored_entries, (None, None))
+    live_key, live = next(live_entries, (None, None))
+    while stored is not None or live is not None:
+        if live is None or (stored is not None and stored_key < live_key):
+            yield stored, None
+            stored_key, stored = next(stored_entries, (None, None))
+        elif stored is None or live_key < stored_key:
+            yield None, live
+            live_key, live = next(live_entries, (None, None))
+        else:
+            yield stored, live
+            stored_key, stored = next(stored_entries, (None, None))
+            live_key, live = next(live_entries, (None, None))
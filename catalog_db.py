@@ -0,0 +1,1336 @@
+import os
+import time
+import heapq
+import itertools
+from datetime import datetime
+from collections import namedtuple
+
+from catalog_hash import SAMPLE_ALGORITHM, available_algorithms
+
+DEFAULT_DB_PATH = 'folder_catalog.db'
+
+# Rows removed per write transaction when purging deleted catalogs
+PURGE_BATCH = 2000
+# Free pages returned to the file system per incremental vacuum step (4 MiB)
+VACUUM_STEP_PAGES = 1024
+
+# Current schema, created as-is for new databases. Directories live in their
+# own table and files only store their name and the id of their directory.
+# files.md5_hash holds full-content digests in the catalog's hash_algorithm
+# (the column predates the other algorithms); sample_hash holds the sample
+# fingerprint. Directories carry the recursive size, file count and newest
+# file mtime of everything below them. file_search is a trigram index over
+# file names and directory paths whose rowids are file ids. Timestamps of
+# files and directories are integer st_mtime_ns values and digests are raw
+# bytes; modified_at columns are named for what they hold, not their type.
+# Deleted catalogs keep their rows, hidden by catalogs.deleted_at, until
+# purge_deleted_catalogs() removes them in the background.
+SCHEMA = [
+    '''
+    CREATE TABLE catalogs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        root_path TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        hash_algorithm TEXT,
+        deleted_at TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE directories (
+        id INTEGER PRIMARY KEY,
+        catalog_id INTEGER NOT NULL,
+        parent_id INTEGER,
+        path TEXT NOT NULL,
+        name TEXT NOT NULL,
+        modified_at INTEGER,
+        inode INTEGER,
+        total_size INTEGER NOT NULL DEFAULT 0,
+        total_files INTEGER NOT NULL DEFAULT 0,
+        newest_modified_at INTEGER,
+        FOREIGN KEY (catalog_id) REFERENCES catalogs (id),
+        FOREIGN KEY (parent_id) REFERENCES directories (id)
+    )
+    ''',
+    '''
+    CREATE TABLE files (
+        id INTEGER PRIMARY KEY,
+        catalog_id INTEGER NOT NULL,
+        dir_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        size INTEGER,
+        modified_at INTEGER,
+        md5_hash BLOB,
+        inode INTEGER,
+        sample_hash BLOB,
+        FOREIGN KEY (catalog_id) REFERENCES catalogs (id),
+        FOREIGN KEY (dir_id) REFERENCES directories (id)
+    )
+    ''',
+    'CREATE UNIQUE INDEX idx_directories_path ON directories (catalog_id, path)',
+    'CREATE INDEX idx_directories_parent ON directories (parent_id, name)',
+    'CREATE INDEX idx_files_dir ON files (dir_id, name)',
+    'CREATE INDEX idx_files_catalog ON files (catalog_id)',
+    '''
+    CREATE TABLE compare_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        catalog_id INTEGER NOT NULL,
+        compare_path TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        other_catalog_id INTEGER,
+        FOREIGN KEY (catalog_id) REFERENCES catalogs (id),
+        FOREIGN KEY (other_catalog_id) REFERENCES catalogs (id)
+    )
+    ''',
+    '''
+    CREATE TABLE compare_results (
+        run_id INTEGER NOT NULL,
+        path TEXT NOT NULL,
+        status TEXT NOT NULL,
+        detail TEXT,
+        is_directory BOOLEAN,
+        catalog_size INTEGER,
+        compare_size INTEGER,
+        catalog_modified_at INTEGER,
+        compare_modified_at INTEGER,
+        FOREIGN KEY (run_id) REFERENCES compare_runs (id)
+    )
+    ''',
+    'CREATE INDEX idx_compare_results_run ON compare_results (run_id, path)',
+    '''
+    CREATE TABLE hash_cache (
+        device INTEGER NOT NULL,
+        inode INTEGER NOT NULL,
+        algorithm TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        digest BLOB NOT NULL,
+        used_at INTEGER NOT NULL,
+        PRIMARY KEY (device, inode, algorithm)
+    )
+    ''',
+    'CREATE INDEX idx_hash_cache_used ON hash_cache (used_at)',
+    '''
+    CREATE TABLE hash_cache_stats (
+        algorithm TEXT PRIMARY KEY,
+        hits INTEGER NOT NULL DEFAULT 0,
+        misses INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    'CREATE INDEX idx_files_size ON files (size)',
+    '''
+    CREATE TABLE duplicate_files (
+        set_id INTEGER NOT NULL,
+        file_id INTEGER NOT NULL,
+        FOREIGN KEY (file_id) REFERENCES files (id)
+    )
+    ''',
+    'CREATE INDEX idx_duplicate_files_set ON duplicate_files (set_id)',
+    'CREATE INDEX idx_duplicate_files_file ON duplicate_files (file_id)',
+    "CREATE VIRTUAL TABLE file_search USING fts5 (name, path, tokenize = 'trigram')",
+]
+
+
+def init_schema(conn):
+    """Create tables if needed and upgrade older databases to the current schema"""
+    cursor = conn.cursor()
+    # Run creation and migrations atomically so a failed upgrade leaves the old schema
+    if not conn.in_transaction:
+        cursor.execute('BEGIN')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalogs'")
+    if cursor.fetchone() is None:
+        # Only takes effect before the first table is created; see reclaim_free_pages()
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        for statement in SCHEMA:
+            cursor.execute(statement)
+    else:
+        # Apply every migration newer than the version stored in the database
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        for target, migrate in MIGRATIONS:
+            if version < target:
+                migrate(cursor)
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    conn.commit()
+
+
+def _add_file_identity(cursor):
+    """Version 1: record inodes so updates can tell replaced files apart"""
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(files)')}
+    if 'inode' not in columns:
+        cursor.execute('ALTER TABLE files ADD COLUMN inode INTEGER')
+
+
+def _normalize_directories(cursor):
+    """Version 2: move directories into their own table and index both tables
+
+    Version 1 stored every entry, directories included, as one files row with
+    its full relative path. Each catalog now gets a root directory row, other
+    directories reference their parent, and files reference their directory.
+    """
+    cursor.execute('ALTER TABLE files RENAME TO files_v1')
+    cursor.execute('''
+        CREATE TABLE directories (
+            id INTEGER PRIMARY KEY,
+            catalog_id INTEGER NOT NULL,
+            parent_id INTEGER,
+            path TEXT NOT NULL,
+            name TEXT NOT NULL,
+            modified_at TIMESTAMP,
+            inode INTEGER,
+            FOREIGN KEY (catalog_id) REFERENCES catalogs (id),
+            FOREIGN KEY (parent_id) REFERENCES directories (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE files (
+            id INTEGER PRIMARY KEY,
+            catalog_id INTEGER NOT NULL,
+            dir_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            size INTEGER,
+            modified_at TIMESTAMP,
+            md5_hash TEXT,
+            inode INTEGER,
+            FOREIGN KEY (catalog_id) REFERENCES catalogs (id),
+            FOREIGN KEY (dir_id) REFERENCES directories (id)
+        )
+    ''')
+
+    # Parents sort before their children, so each parent id is known when needed
+    dir_ids = {}
+    cursor.execute('SELECT id, root_path FROM catalogs ORDER BY id')
+    for catalog_id, root_path in cursor.fetchall():
+        cursor.execute(
+            'INSERT INTO directories (catalog_id, parent_id, path, name) VALUES (?, NULL, ?, ?)',
+            (catalog_id, '', os.path.basename(root_path))
+        )
+        dir_ids[catalog_id, ''] = cursor.lastrowid
+
+    rows = cursor.connection.cursor()
+    rows.execute('''
+        SELECT catalog_id, path, name, modified_at, inode FROM files_v1
+        WHERE is_directory AND catalog_id IN (SELECT id FROM catalogs)
+        ORDER BY catalog_id, path
+    ''')
+    for catalog_id, path, name, modified_at, inode in rows:
+        parent_id = dir_ids.get((catalog_id, os.path.dirname(path)), dir_ids[catalog_id, ''])
+        cursor.execute(
+            'INSERT INTO directories (catalog_id, parent_id, path, name, modified_at, inode) VALUES (?, ?, ?, ?, ?, ?)',
+            (catalog_id, parent_id, path, name, modified_at, inode)
+        )
+        dir_ids[catalog_id, path] = cursor.lastrowid
+
+    files = BatchWriter(cursor, '''
+        INSERT INTO files (catalog_id, dir_id, name, size, modified_at, md5_hash, inode)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''')
+    rows.execute('''
+        SELECT catalog_id, path, name, size, modified_at, md5_hash, inode FROM files_v1
+        WHERE NOT is_directory AND catalog_id IN (SELECT id FROM catalogs)
+    ''')
+    for catalog_id, path, name, size, modified_at, md5_hash, inode in rows:
+        dir_id = dir_ids.get((catalog_id, os.path.dirname(path)), dir_ids[catalog_id, ''])
+        files.add((catalog_id, dir_id, name, size, modified_at, md5_hash, inode))
+    files.flush()
+    cursor.execute('DROP TABLE files_v1')
+    cursor.execute('CREATE UNIQUE INDEX idx_directories_path ON directories (catalog_id, path)')
+    cursor.execute('CREATE INDEX idx_directories_parent ON directories (parent_id, name)')
+    cursor.execute('CREATE INDEX idx_files_dir ON files (dir_id, name)')
+    cursor.execute('CREATE INDEX idx_files_catalog ON files (catalog_id)')
+
+
+def _add_compare_results(cursor):
+    """Version 3: store compare differences in tables instead of in memory"""
+    for statement in [
+        '''
+        CREATE TABLE compare_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            catalog_id INTEGER NOT NULL,
+            compare_path TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (catalog_id) REFERENCES catalogs (id)
+        )
+        ''',
+        '''
+        CREATE TABLE compare_results (
+            run_id INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            status TEXT NOT NULL,
+            detail TEXT,
+            is_directory BOOLEAN,
+            catalog_size INTEGER,
+            compare_size INTEGER,
+            catalog_modified_at TIMESTAMP,
+            compare_modified_at TIMESTAMP,
+            FOREIGN KEY (run_id) REFERENCES compare_runs (id)
+        )
+        ''',
+        'CREATE INDEX idx_compare_results_run ON compare_results (run_id, path)',
+    ]:
+        cursor.execute(statement)
+
+
+def _add_catalog_diffs(cursor):
+    """Version 4: compare runs can diff two stored catalogs"""
+    cursor.execute('ALTER TABLE compare_runs ADD COLUMN other_catalog_id INTEGER REFERENCES catalogs (id)')
+
+
+def _add_hash_cache(cursor):
+    """Version 5: keep file digests across catalogs and compare runs"""
+    for statement in [
+        '''
+        CREATE TABLE hash_cache (
+            device INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            algorithm TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            digest TEXT NOT NULL,
+            used_at INTEGER NOT NULL,
+            PRIMARY KEY (device, inode, algorithm)
+        )
+        ''',
+        'CREATE INDEX idx_hash_cache_used ON hash_cache (used_at)',
+        '''
+        CREATE TABLE hash_cache_stats (
+            algorithm TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+    ]:
+        cursor.execute(statement)
+
+
+def _add_fingerprints(cursor):
+    """Version 6: record the hash algorithm per catalog and sample fingerprints per file"""
+    cursor.execute('ALTER TABLE catalogs ADD COLUMN hash_algorithm TEXT')
+    cursor.execute('ALTER TABLE files ADD COLUMN sample_hash TEXT')
+    # Every hash stored so far is an MD5
+    cursor.execute('''
+        UPDATE catalogs SET hash_algorithm = 'md5'
+        WHERE EXISTS (SELECT 1 FROM files WHERE files.catalog_id = catalogs.id AND md5_hash IS NOT NULL)
+    ''')
+
+
+def _add_duplicates(cursor):
+    """Version 7: index file sizes and store the sets found by the duplicate finder"""
+    for statement in [
+        'CREATE INDEX idx_files_size ON files (size)',
+        '''
+        CREATE TABLE duplicate_files (
+            set_id INTEGER NOT NULL,
+            file_id INTEGER NOT NULL,
+            FOREIGN KEY (file_id) REFERENCES files (id)
+        )
+        ''',
+        'CREATE INDEX idx_duplicate_files_set ON duplicate_files (set_id)',
+        'CREATE INDEX idx_duplicate_files_file ON duplicate_files (file_id)',
+    ]:
+        cursor.execute(statement)
+
+
+def _add_file_search(cursor):
+    """Version 8: index file names and directory paths for substring search"""
+    cursor.execute("CREATE VIRTUAL TABLE file_search USING fts5 (name, path, tokenize = 'trigram')")
+    cursor.execute('''
+        INSERT INTO file_search (rowid, name, path)
+        SELECT f.id, f.name, d.path FROM files f JOIN directories d ON d.id = f.dir_id
+    ''')
+
+
+def _add_directory_totals(cursor):
+    """Version 9: store recursive size, file count and newest file mtime per directory"""
+    cursor.execute('ALTER TABLE directories ADD COLUMN total_size INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('ALTER TABLE directories ADD COLUMN total_files INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('ALTER TABLE directories ADD COLUMN newest_modified_at TIMESTAMP')
+    # Start from the files of each directory and roll them up, one catalog at a time
+    for catalog_id, in cursor.execute('SELECT id FROM catalogs').fetchall():
+        totals = DirectoryTotals()
+        cursor.execute('''
+            SELECT d.path, SUM(f.size), COUNT(*), MAX(f.modified_at)
+            FROM files f JOIN directories d ON d.id = f.dir_id
+            WHERE f.catalog_id = ?
+            GROUP BY f.dir_id
+        ''', (catalog_id,))
+        for dir_path, size, count, newest in cursor.fetchall():
+            totals.add(dir_path, size or 0, newest, count)
+        cursor.execute('SELECT path, id FROM directories WHERE catalog_id = ?', (catalog_id,))
+        totals.write(cursor, dict(cursor.fetchall()))
+
+
+def _compact_encoding(cursor):
+    """Version 10: store mtimes as integer nanoseconds and digests as bytes
+
+    Earlier versions stored mtimes as local-time ISO text and digests as hex.
+    The directories and files tables are rebuilt so their columns declare
+    the new types; ids are kept, so search and duplicate rows stay valid.
+    """
+    conn = cursor.connection
+    conn.create_function('iso_to_mtime_ns', 1, _iso_to_mtime_ns, deterministic=True)
+    conn.create_function('hex_to_bytes', 1, _hex_to_bytes, deterministic=True)
+    for statement in [
+        '''
+        CREATE TABLE directories_v10 (
+            id INTEGER PRIMARY KEY,
+            catalog_id INTEGER NOT NULL,
+            parent_id INTEGER,
+            path TEXT NOT NULL,
+            name TEXT NOT NULL,
+            modified_at INTEGER,
+            inode INTEGER,
+            total_size INTEGER NOT NULL DEFAULT 0,
+            total_files INTEGER NOT NULL DEFAULT 0,
+            newest_modified_at INTEGER,
+            FOREIGN KEY (catalog_id) REFERENCES catalogs (id),
+            FOREIGN KEY (parent_id) REFERENCES directories (id)
+        )
+        ''',
+        '''
+        INSERT INTO directories_v10
+        SELECT id, catalog_id, parent_id, path, name, iso_to_mtime_ns(modified_at), inode, total_size,
+               total_files, iso_to_mtime_ns(newest_modified_at)
+        FROM directories
+        ''',
+        'DROP TABLE directories',
+        'ALTER TABLE directories_v10 RENAME TO directories',
+        '''
+        CREATE TABLE files_v10 (
+            id INTEGER PRIMARY KEY,
+            catalog_id INTEGER NOT NULL,
+            dir_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            size INTEGER,
+            modified_at INTEGER,
+            md5_hash BLOB,
+            inode INTEGER,
+            sample_hash BLOB,
+            FOREIGN KEY (catalog_id) REFERENCES catalogs (id),
+            FOREIGN KEY (dir_id) REFERENCES directories (id)
+        )
+        ''',
+        '''
+        INSERT INTO files_v10
+        SELECT id, catalog_id, dir_id, name, size, iso_to_mtime_ns(modified_at), hex_to_bytes(md5_hash), inode,
+               hex_to_bytes(sample_hash)
+        FROM files
+        ''',
+        'DROP TABLE files',
+        'ALTER TABLE files_v10 RENAME TO files',
+        'CREATE UNIQUE INDEX idx_directories_path ON directories (catalog_id, path)',
+        'CREATE INDEX idx_directories_parent ON directories (parent_id, name)',
+        'CREATE INDEX idx_files_dir ON files (dir_id, name)',
+        'CREATE INDEX idx_files_catalog ON files (catalog_id)',
+        'CREATE INDEX idx_files_size ON files (size)',
+        '''
+        UPDATE compare_results SET catalog_modified_at = iso_to_mtime_ns(catalog_modified_at),
+                                   compare_modified_at = iso_to_mtime_ns(compare_modified_at)
+        ''',
+        'UPDATE hash_cache SET digest = hex_to_bytes(digest)',
+    ]:
+        cursor.execute(statement)
+
+
+def _iso_to_mtime_ns(value):
+    """Convert a local-time ISO timestamp as stored before version 10 to nanoseconds"""
+    if not isinstance(value, str):
+        return value
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return datetime_to_mtime_ns(moment)
+
+
+def _hex_to_bytes(value):
+    return bytes.fromhex(value) if isinstance(value, str) else value
+
+
+def _add_catalog_tombstones(cursor):
+    """Version 11: mark deleted catalogs so their rows can be purged in the background"""
+    cursor.execute('ALTER TABLE catalogs ADD COLUMN deleted_at TIMESTAMP')
+
+
+MIGRATIONS = [
+    (1, _add_file_identity),
+    (2, _normalize_directories),
+    (3, _add_compare_results),
+    (4, _add_catalog_diffs),
+    (5, _add_hash_cache),
+    (6, _add_fingerprints),
+    (7, _add_duplicates),
+    (8, _add_file_search),
+    (9, _add_directory_totals),
+    (10, _compact_encoding),
+    (11, _add_catalog_tombstones),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+INSERT_DIRECTORY_SQL = 'INSERT INTO directories (id, catalog_id, parent_id, path, name, modified_at, inode) VALUES (?, ?, ?, ?, ?, ?, ?)'
+INSERT_FILE_SQL = 'INSERT INTO files (id, catalog_id, dir_id, name, size, modified_at, md5_hash, inode, sample_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+INSERT_FILE_SEARCH_SQL = 'INSERT INTO file_search (rowid, name, path) VALUES (?, ?, ?)'
+# Search rows for a range of file ids, taken from the rows already written
+INDEX_FILE_RANGE_SQL = '''
+    INSERT INTO file_search (rowid, name, path)
+    SELECT f.id, f.name, d.path FROM files f JOIN directories d ON d.id = f.dir_id
+    WHERE f.id >= ? AND f.id < ?
+'''
+
+# A stored directory or file with its path rebuilt relative to the catalog root
+CatalogEntry = namedtuple('CatalogEntry', [
+    'path', 'name', 'is_directory', 'size', 'modified_at', 'md5_hash', 'inode', 'id', 'sample_hash'
+])
+
+
+# One difference found by a compare run
+CompareResult = namedtuple('CompareResult', [
+    'path', 'status', 'detail', 'is_directory', 'catalog_size', 'compare_size',
+    'catalog_modified_at', 'compare_modified_at'
+])
+
+
+def catalog_entries(conn, catalog_id):
+    """Yield a CatalogEntry for every directory, parents first, then every file of a catalog"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT path, name, modified_at, inode, id FROM directories
+        WHERE catalog_id = ? AND parent_id IS NOT NULL
+        ORDER BY path
+    ''', (catalog_id,))
+    for path, name, modified_at, inode, row_id in cursor:
+        yield CatalogEntry(path, name, True, 0, modified_at, None, inode, row_id, None)
+
+    cursor.execute('''
+        SELECT d.path, f.name, f.size, f.modified_at, f.md5_hash, f.inode, f.id, f.sample_hash
+        FROM files f JOIN directories d ON d.id = f.dir_id
+        WHERE f.catalog_id = ?
+    ''', (catalog_id,))
+    for dir_path, name, size, modified_at, md5_hash, inode, row_id, sample_hash in cursor:
+        path = os.path.join(dir_path, name) if dir_path else name
+        yield CatalogEntry(path, name, False, size, modified_at, md5_hash, inode, row_id, sample_hash)
+
+
+def rename_catalog(conn, catalog_id, name):
+    """Give a catalog a new name"""
+    conn.execute('UPDATE catalogs SET name = ? WHERE id = ?', (name, catalog_id))
+
+
+def delete_catalog(conn, catalog_id):
+    """Mark a catalog as deleted; its rows are left for purge_deleted_catalogs()"""
+    conn.execute('UPDATE catalogs SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?', (catalog_id,))
+    purge_compare_runs(conn, catalog_id)
+
+
+def has_deleted_catalogs(conn):
+    """Check whether any deleted catalog still has rows to purge"""
+    return conn.execute('SELECT 1 FROM catalogs WHERE deleted_at IS NOT NULL LIMIT 1').fetchone() is not None
+
+
+def count_deleted_rows(conn):
+    """Count the directories and files purge_deleted_catalogs() still has to remove"""
+    return conn.execute('''
+        SELECT (SELECT COUNT(*) FROM files WHERE catalog_id IN (SELECT id FROM catalogs WHERE deleted_at IS NOT NULL))
+             + (SELECT COUNT(*) FROM directories
+                WHERE catalog_id IN (SELECT id FROM catalogs WHERE deleted_at IS NOT NULL))
+    ''').fetchone()[0]
+
+
+def purge_deleted_catalogs(conn, batch_size=PURGE_BATCH):
+    """Remove the rows of deleted catalogs, batch_size rows at a time
+
+    Yields the number of rows removed after every batch, so the caller can
+    commit in between and other writers never wait long, or stop at any
+    point. The catalog row goes last, so an interrupted purge picks up
+    where it stopped the next time.
+    """
+    cursor = conn.cursor()
+    # Catalogs deleted while the purge runs are picked up too
+    while True:
+        row = cursor.execute('SELECT id FROM catalogs WHERE deleted_at IS NOT NULL LIMIT 1').fetchone()
+        if row is None:
+            break
+        catalog_id = row[0]
+        while True:
+            cursor.execute('SELECT id FROM files WHERE catalog_id = ? LIMIT ?', (catalog_id, batch_size))
+            ids = cursor.fetchall()
+            if not ids:
+                break
+            cursor.executemany('DELETE FROM duplicate_files WHERE file_id = ?', ids)
+            cursor.executemany('DELETE FROM file_search WHERE rowid = ?', ids)
+            cursor.executemany('DELETE FROM files WHERE id = ?', ids)
+            yield len(ids)
+        while True:
+            cursor.execute('SELECT id FROM directories WHERE catalog_id = ? LIMIT ?', (catalog_id, batch_size))
+            ids = cursor.fetchall()
+            if not ids:
+                break
+            cursor.executemany('DELETE FROM directories WHERE id = ?', ids)
+            yield len(ids)
+        purge_catalog(conn, catalog_id)
+        yield 0
+
+
+def reclaim_free_pages(conn, pages=VACUUM_STEP_PAGES):
+    """Return up to pages unused pages to the file system and return how many are left
+
+    Only databases created with auto_vacuum = INCREMENTAL can shrink this
+    way; older ones need compact_database() once. Commits first.
+    """
+    # execute() would only step the pragma once, freeing a single page
+    conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def compact_database(conn):
+    """Switch the database to incremental auto-vacuum and rewrite it without free pages
+
+    Rewrites the whole file while holding the write lock, so it is only
+    run on request. Commits first.
+    """
+    conn.commit()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    # In WAL mode the file only shrinks once the rewritten pages are checkpointed
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def purge_catalog(conn, catalog_id):
+    """Delete a catalog with all of its directories, files, compare results and duplicates"""
+    cursor = conn.cursor()
+    purge_compare_runs(conn, catalog_id)
+    cursor.execute('''
+        DELETE FROM duplicate_files WHERE file_id IN (SELECT id FROM files WHERE catalog_id = ?)
+    ''', (catalog_id,))
+    cursor.execute('DELETE FROM file_search WHERE rowid IN (SELECT id FROM files WHERE catalog_id = ?)', (catalog_id,))
+    cursor.execute('DELETE FROM files WHERE catalog_id = ?', (catalog_id,))
+    cursor.execute('DELETE FROM directories WHERE catalog_id = ?', (catalog_id,))
+    cursor.execute('DELETE FROM catalogs WHERE id = ?', (catalog_id,))
+
+
+# Rows buffered per executemany() call during bulk writes
+BATCH_SIZE = 5000
+
+
+def iter_catalog_tree(conn, catalog_id):
+    """Yield a CatalogEntry for every directory and file of a catalog in tree order
+
+    Tree order is the order TreeScanner.scan() produces: depth-first with each
+    directory's entries sorted by name. Children are read through the
+    (parent_id, name) and (dir_id, name) indexes, one pair of open cursors per
+    directory level, so nothing is sorted or buffered in memory.
+    """
+    row = conn.execute(
+        'SELECT id FROM directories WHERE catalog_id = ? AND parent_id IS NULL', (catalog_id,)
+    ).fetchone()
+    if row is None:
+        return
+    yield from iter_subtree(conn, row[0], '')
+
+
+def iter_subtree(conn, dir_id, dir_path, recursive=True):
+    """Yield a CatalogEntry for everything below one directory in tree order, or only for its own entries"""
+    levels = [_directory_children(conn, dir_id, dir_path)]
+    while levels:
+        entry = next(levels[-1], None)
+        if entry is None:
+            levels.pop()
+            continue
+        yield entry
+        if entry.is_directory and recursive:
+            levels.append(_directory_children(conn, entry.id, entry.path))
+
+
+def find_directory(conn, catalog_id, path):
+    """Return the CatalogEntry of a catalog's directory by relative path, or None"""
+    row = conn.execute(
+        'SELECT name, modified_at, inode, id FROM directories WHERE catalog_id = ? AND path = ?', (catalog_id, path)
+    ).fetchone()
+    if row is None:
+        return None
+    name, modified_at, inode, row_id = row
+    return CatalogEntry(path, name, True, 0, modified_at, None, inode, row_id, None)
+
+
+def _directory_children(conn, dir_id, dir_path):
+    """Merge the subdirectories and files of one directory by name"""
+    directories = (
+        CatalogEntry(path, name, True, 0, modified_at, None, inode, row_id, None)
+        for name, path, modified_at, inode, row_id in conn.execute(
+            'SELECT name, path, modified_at, inode, id FROM directories WHERE parent_id = ? ORDER BY name',
+            (dir_id,)
+        )
+    )
+    files = (
+        CatalogEntry(os.path.join(dir_path, name) if dir_path else name, name, False,
+                     size, modified_at, md5_hash, inode, row_id, sample_hash)
+        for name, size, modified_at, md5_hash, inode, row_id, sample_hash in conn.execute(
+            'SELECT name, size, modified_at, md5_hash, inode, id, sample_hash FROM files WHERE dir_id = ? ORDER BY name',
+            (dir_id,)
+        )
+    )
+    return heapq.merge(directories, files, key=lambda entry: entry.name)
+
+
+def tree_key(path):
+    """Sort key matching tree order: the tuple of path components"""
+    return tuple(path.split(os.sep))
+
+
+def datetime_to_mtime_ns(moment):
+    """Convert a naive local datetime to the integer nanoseconds stored in modified_at columns"""
+    return int(moment.replace(microsecond=0).timestamp()) * 1_000_000_000 + moment.microsecond * 1000
+
+
+def mtime_to_datetime(mtime_ns):
+    """Convert a stored modified_at value to a naive local datetime, or None"""
+    if mtime_ns is None:
+        return None
+    return datetime.fromtimestamp(mtime_ns // 1_000_000_000).replace(microsecond=mtime_ns % 1_000_000_000 // 1000)
+
+
+def format_mtime(mtime_ns, timespec='auto'):
+    """Format a stored modified_at value as local ISO text, or return None"""
+    moment = mtime_to_datetime(mtime_ns)
+    return None if moment is None else moment.isoformat(' ', timespec)
+
+
+def purge_compare_runs(conn, catalog_id):
+    """Delete the stored compare results involving a catalog on either side"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM compare_results
+        WHERE run_id IN (SELECT id FROM compare_runs WHERE catalog_id = ? OR other_catalog_id = ?)
+    ''', (catalog_id, catalog_id))
+    cursor.execute('DELETE FROM compare_runs WHERE catalog_id = ? OR other_catalog_id = ?',
+                   (catalog_id, catalog_id))
+
+
+# Files of one catalog with no file at the same path in the other. Formatted
+# with the result columns the unmatched side is stored in.
+_DIFF_UNMATCHED_FILES_SQL = '''
+    INSERT INTO compare_results (run_id, path, status, is_directory, {size_column}, {modified_column})
+    SELECT ?, CASE da.path WHEN '' THEN fa.name ELSE da.path || ? || fa.name END, ?, 0, fa.size, fa.modified_at
+    FROM directories da
+    JOIN files fa ON fa.dir_id = da.id
+    LEFT JOIN directories db ON db.catalog_id = ? AND db.path = da.path
+    LEFT JOIN files fb ON fb.dir_id = db.id AND fb.name = fa.name
+    WHERE da.catalog_id = ? AND fb.id IS NULL
+'''
+
+_DIFF_UNMATCHED_DIRECTORIES_SQL = '''
+    INSERT INTO compare_results (run_id, path, status, is_directory, {modified_column})
+    SELECT ?, da.path, ?, 1, da.modified_at
+    FROM directories da
+    LEFT JOIN directories db ON db.catalog_id = ? AND db.path = da.path
+    WHERE da.catalog_id = ? AND da.parent_id IS NOT NULL AND db.id IS NULL
+'''
+
+_DIFF_MODIFIED_FILES_SQL = '''
+    INSERT INTO compare_results (run_id, path, status, detail, is_directory, catalog_size,
+                                 compare_size, catalog_modified_at, compare_modified_at)
+    SELECT ?, CASE da.path WHEN '' THEN fa.name ELSE da.path || ? || fa.name END, 'modified',
+           CASE WHEN ? AND fa.size != fb.size THEN 'size'
+                WHEN ? AND fa.sample_hash != fb.sample_hash THEN 'sample'
+                ELSE 'hash' END,
+           0, fa.size, fb.size, fa.modified_at, fb.modified_at
+    FROM directories da
+    JOIN directories db ON db.catalog_id = ? AND db.path = da.path
+    JOIN files fa ON fa.dir_id = da.id
+    JOIN files fb ON fb.dir_id = db.id AND fb.name = fa.name
+    WHERE da.catalog_id = ?
+      AND ((? AND fa.size != fb.size)
+           OR (? AND fa.sample_hash != fb.sample_hash)
+           OR (? AND fa.md5_hash != fb.md5_hash))
+'''
+
+
+def diff_catalogs(conn, run_id, catalog_id, other_catalog_id, check_size, content):
+    """Store the differences between two catalogs as results of a compare run
+
+    Entries are matched by path with joins on the directory path and file
+    name indexes, so no file is read. content is None, 'sample', 'full' or
+    'tiered'; fingerprints are only compared where both files have one, and
+    full hashes only when both catalogs use the same algorithm. Returns the
+    number of differences.
+    """
+    cursor = conn.cursor()
+    check_sample = content in ('sample', 'tiered')
+    check_full = content in ('full', 'tiered') and shared_hash_algorithm(conn, catalog_id, other_catalog_id) is not None
+    differences = 0
+    for status, side, other_side, size_column, modified_column in [
+        ('missing', catalog_id, other_catalog_id, 'catalog_size', 'catalog_modified_at'),
+        ('new', other_catalog_id, catalog_id, 'compare_size', 'compare_modified_at'),
+    ]:
+        cursor.execute(_DIFF_UNMATCHED_DIRECTORIES_SQL.format(modified_column=modified_column),
+                       (run_id, status, other_side, side))
+        differences += cursor.rowcount
+        cursor.execute(_DIFF_UNMATCHED_FILES_SQL.format(size_column=size_column, modified_column=modified_column),
+                       (run_id, os.sep, status, other_side, side))
+        differences += cursor.rowcount
+    cursor.execute(_DIFF_MODIFIED_FILES_SQL, (run_id, os.sep, check_size, check_sample, other_catalog_id,
+                                              catalog_id, check_size, check_sample, check_full))
+    differences += cursor.rowcount
+    return differences
+
+
+def compare_results(conn, run_id):
+    """Yield the stored differences of a compare run ordered by path"""
+    cursor = conn.execute('''
+        SELECT path, status, detail, is_directory, catalog_size, compare_size,
+               catalog_modified_at, compare_modified_at
+        FROM compare_results
+        WHERE run_id = ?
+        ORDER BY path
+    ''', (run_id,))
+    for row in cursor:
+        yield CompareResult(*row)
+
+
+def tune_connection(conn):
+    """Switch a connection to WAL with relaxed syncing and a larger page cache"""
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA cache_size = -65536')  # 64 MiB
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+
+class BatchWriter:
+    """Buffer rows for one statement and write them with executemany in chunks"""
+
+    def __init__(self, cursor, sql, batch_size=BATCH_SIZE):
+        self.cursor = cursor
+        self.sql = sql
+        self.batch_size = batch_size
+        self.rows = []
+        self.rows_written = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.cursor.executemany(self.sql, self.rows)
+            self.rows_written += len(self.rows)
+            self.rows = []
+
+
+class BulkLoad:
+    """Context manager for loading a catalog in one transaction
+
+    When no catalog is stored yet the secondary indexes are dropped for the
+    duration of the load and rebuilt once afterwards, which is much cheaper
+    than maintaining them row by row. The search index stops merging its
+    segments during such a load and is optimized once at the end. With
+    other catalogs already stored the indexes are kept, since rebuilding
+    them would cost more than the load.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.deferred_indexes = []
+
+    def __enter__(self):
+        # Drop indexes inside the transaction so a rollback restores them
+        if not self.conn.in_transaction:
+            self.conn.execute('BEGIN')
+        cursor = self.conn.cursor()
+        if cursor.execute('SELECT 1 FROM directories LIMIT 1').fetchone() is None:
+            cursor.execute('''
+                SELECT name, sql FROM sqlite_master
+                WHERE type = 'index' AND tbl_name IN ('directories', 'files') AND sql IS NOT NULL
+            ''')
+            self.deferred_indexes = cursor.fetchall()
+            for name, _ in self.deferred_indexes:
+                cursor.execute(f'DROP INDEX {name}')
+            cursor.execute("INSERT INTO file_search (file_search, rank) VALUES ('automerge', 0)")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # After a rollback the dropped indexes are already back
+        if exc_type is None and self.conn.in_transaction:
+            cursor = self.conn.cursor()
+            for _, sql in self.deferred_indexes:
+                cursor.execute(sql)
+            if self.deferred_indexes:
+                cursor.execute("INSERT INTO file_search (file_search, rank) VALUES ('automerge', 4)")
+                cursor.execute("INSERT INTO file_search (file_search) VALUES ('optimize')")
+        self.deferred_indexes = []
+        return False
+
+
+class CatalogWriter:
+    """Buffer the directory and file rows of one catalog for bulk insertion
+
+    Directory and file ids are assigned here rather than by SQLite, so files
+    can reference their directory before the directory row has been flushed.
+    New file ids form one range, so flush() fills the search index for all
+    of them with a single INSERT ... SELECT instead of a row per file. The
+    connection must already hold the write lock.
+    """
+
+    def __init__(self, conn, catalog_id):
+        self.catalog_id = catalog_id
+        cursor = conn.cursor()
+        self.next_dir_id = cursor.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM directories').fetchone()[0]
+        self.next_file_id = cursor.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM files').fetchone()[0]
+        self.indexed_file_id = self.next_file_id
+        cursor.execute('SELECT path, id FROM directories WHERE catalog_id = ?', (catalog_id,))
+        self.dir_ids = dict(cursor.fetchall())
+        self.directories = BatchWriter(cursor, INSERT_DIRECTORY_SQL)
+        self.files = BatchWriter(cursor, INSERT_FILE_SQL)
+        self.cursor = cursor
+
+    def add_directory(self, path, parent, name, modified_at, inode):
+        """Queue a directory row and return its id; the root has path '' and parent None"""
+        dir_id = self.next_dir_id
+        self.next_dir_id += 1
+        parent_id = None if parent is None else self.dir_ids[parent]
+        self.directories.add((dir_id, self.catalog_id, parent_id, path, name, modified_at, inode))
+        self.dir_ids[path] = dir_id
+        return dir_id
+
+    def add_file(self, parent, name, size, modified_at, md5_hash, inode, sample_hash=None):
+        """Queue a file row inside the directory with relative path parent and return its id"""
+        file_id = self.next_file_id
+        self.next_file_id += 1
+        self.files.add((file_id, self.catalog_id, self.dir_ids[parent], name, size, modified_at, md5_hash, inode,
+                        sample_hash))
+        return file_id
+
+    def flush(self):
+        """Write the queued rows and index the files added since the last flush"""
+        self.directories.flush()
+        self.files.flush()
+        if self.indexed_file_id < self.next_file_id:
+            self.cursor.execute(INDEX_FILE_RANGE_SQL, (self.indexed_file_id, self.next_file_id))
+            self.indexed_file_id = self.next_file_id
+
+
+class DirectoryTotals:
+    """Collect file changes per directory and apply them to the recursive totals
+
+    Changes are kept per directory path and only rolled up into the
+    ancestors when written, so each touched directory row is updated once.
+    Sizes and counts are adjusted by their delta. The newest mtime only
+    grows with added files; directories that lost their newest file are
+    recomputed from their files and subdirectories, deepest first.
+    """
+
+    def __init__(self):
+        self.deltas = {}
+
+    def add(self, dir_path, size, modified_at, count=1):
+        """Count files added to a directory"""
+        delta = self.deltas.setdefault(dir_path, [0, 0, None, False])
+        delta[0] += size
+        delta[1] += count
+        if modified_at is not None and (delta[2] is None or modified_at > delta[2]):
+            delta[2] = modified_at
+
+    def remove(self, dir_path, size):
+        """Count a file removed from a directory"""
+        delta = self.deltas.setdefault(dir_path, [0, 0, None, False])
+        delta[0] -= size
+        delta[1] -= 1
+        delta[3] = True
+
+    def change(self, dir_path, old_size, new_size, old_modified_at, new_modified_at):
+        """Count a file of a directory whose size or mtime changed"""
+        self.add(dir_path, new_size - old_size, new_modified_at, 0)
+        if old_modified_at is not None and old_modified_at > new_modified_at:
+            self.deltas[dir_path][3] = True
+
+    def write(self, cursor, dir_ids):
+        """Roll the changes up to the root and update the directory rows with ids from dir_ids"""
+        # Every change counts for its own directory and each of its ancestors
+        rolled = {}
+        for path, (size, count, newest, stale) in self.deltas.items():
+            while True:
+                total = rolled.setdefault(path, [0, 0, None, False])
+                total[0] += size
+                total[1] += count
+                if newest is not None and (total[2] is None or newest > total[2]):
+                    total[2] = newest
+                total[3] = total[3] or stale
+                if not path:
+                    break
+                path = os.path.dirname(path)
+        cursor.executemany('''
+            UPDATE directories SET
+                total_size = total_size + ?,
+                total_files = total_files + ?,
+                newest_modified_at = COALESCE(MAX(newest_modified_at, ?), newest_modified_at, ?)
+            WHERE id = ?
+        ''', [(size, count, newest, newest, dir_ids[path])
+              for path, (size, count, newest, _) in rolled.items() if path in dir_ids])
+
+        # Recompute the newest mtime where it may have gone down, deepest first
+        stale = [path for path, total in rolled.items() if total[3] and path in dir_ids]
+        stale.sort(key=lambda path: len(tree_key(path)) if path else 0, reverse=True)
+        for path in stale:
+            dir_id = dir_ids[path]
+            cursor.execute('''
+                UPDATE directories SET newest_modified_at = (
+                    SELECT MAX(modified_at) FROM (
+                        SELECT MAX(modified_at) AS modified_at FROM files WHERE dir_id = ?
+                        UNION ALL
+                        SELECT MAX(newest_modified_at) FROM directories WHERE parent_id = ?
+                    )
+                )
+                WHERE id = ?
+            ''', (dir_id, dir_id, dir_id))
+        self.deltas = {}
+
+
+# Cache entries unused for this long, or beyond this count, are evicted
+HASH_CACHE_MAX_ENTRIES = 2_000_000
+HASH_CACHE_MAX_AGE = 180 * 24 * 3600
+# Hits only refresh used_at once it is older than this, so most lookups stay reads
+HASH_CACHE_TOUCH_INTERVAL = 24 * 3600
+
+
+class HashCache:
+    """Digests of previously hashed files, keyed by (device, inode, size, mtime_ns)
+
+    A file whose inode, size and nanosecond mtime are unchanged is taken to
+    have unchanged contents, so its digest is reused instead of reading the
+    file again. Each inode keeps only its latest digest per algorithm.
+    Hit and miss counts per algorithm are added to hash_cache_stats on flush().
+    """
+
+    def __init__(self, conn):
+        self.now = int(time.time())
+        self.cursor = conn.cursor()
+        self.stores = BatchWriter(conn.cursor(), '''
+            INSERT OR REPLACE INTO hash_cache (device, inode, algorithm, size, mtime_ns, digest, used_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''')
+        self.touches = BatchWriter(conn.cursor(), '''
+            UPDATE hash_cache SET used_at = ? WHERE device = ? AND inode = ? AND algorithm = ?
+        ''')
+        # algorithm -> [hits, misses] not yet added to hash_cache_stats
+        self.unrecorded = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, device, inode, size, mtime_ns, algorithm):
+        """Return the cached digest of an unchanged file, or None"""
+        self.cursor.execute(
+            'SELECT size, mtime_ns, digest, used_at FROM hash_cache WHERE device = ? AND inode = ? AND algorithm = ?',
+            (device, inode, algorithm)
+        )
+        row = self.cursor.fetchone()
+        counts = self.unrecorded.setdefault(algorithm, [0, 0])
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            counts[1] += 1
+            self.misses += 1
+            return None
+        counts[0] += 1
+        self.hits += 1
+        if self.now - row[3] > HASH_CACHE_TOUCH_INTERVAL:
+            self.touches.add((self.now, device, inode, algorithm))
+        return row[2]
+
+    def store(self, device, inode, size, mtime_ns, algorithm, digest):
+        self.stores.add((device, inode, algorithm, size, mtime_ns, digest, self.now))
+
+    def flush(self):
+        self.stores.flush()
+        self.touches.flush()
+        self.cursor.executemany('''
+            INSERT INTO hash_cache_stats (algorithm, hits, misses) VALUES (?, ?, ?)
+            ON CONFLICT (algorithm) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses
+        ''', [(algorithm, hits, misses) for algorithm, (hits, misses) in self.unrecorded.items()])
+        self.unrecorded = {}
+
+    def hit_rate(self):
+        """Fraction of lookups answered from the cache, or None before any lookup"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def summary(self):
+        return f"hash cache: {self.hits} hits, {self.misses} misses ({self.hit_rate():.0%} hit rate)"
+
+
+def evict_hash_cache(conn, max_entries=HASH_CACHE_MAX_ENTRIES, max_age=HASH_CACHE_MAX_AGE):
+    """Drop cache entries unused for max_age seconds, then the least recently used beyond max_entries"""
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM hash_cache WHERE used_at < ?', (int(time.time()) - max_age,))
+    evicted = cursor.rowcount
+    count, = cursor.execute('SELECT COUNT(*) FROM hash_cache').fetchone()
+    if count > max_entries:
+        cursor.execute('''
+            DELETE FROM hash_cache WHERE rowid IN (
+                SELECT rowid FROM hash_cache ORDER BY used_at LIMIT ?
+            )
+        ''', (count - max_entries,))
+        evicted += cursor.rowcount
+    return evicted
+
+
+def hash_cache_stats(conn):
+    """Return (algorithm, entries, hits, misses) for every algorithm that was looked up"""
+    cursor = conn.execute('''
+        SELECT s.algorithm, (SELECT COUNT(*) FROM hash_cache c WHERE c.algorithm = s.algorithm),
+               s.hits, s.misses
+        FROM hash_cache_stats s
+        ORDER BY s.algorithm
+    ''')
+    return cursor.fetchall()
+
+
+# A file that shares its size with at least one other cataloged file
+DuplicateCandidate = namedtuple('DuplicateCandidate', [
+    'id', 'catalog_id', 'path', 'size', 'modified_at', 'md5_hash', 'sample_hash'
+])
+
+# A set of files with the same contents; files are (catalog name, root path, relative path)
+DuplicateSet = namedtuple('DuplicateSet', ['id', 'size', 'files', 'reclaimable'])
+
+
+# Leaves out the files of deleted catalogs that have not been purged yet
+_LIVE_FILE_CONDITION = 'catalog_id NOT IN (SELECT id FROM catalogs WHERE deleted_at IS NOT NULL)'
+
+
+def duplicate_size_groups(conn, min_size=1):
+    """Yield (size, candidates) for every file size shared by two or more files, largest first
+
+    Sizes are read from the size index and each group is fetched on its own,
+    so only one group is held in memory at a time. Files of deleted catalogs
+    are left out of both, so no size is fetched only to be dropped.
+    """
+    sizes = conn.execute(f'''
+        SELECT size FROM files WHERE size >= ? AND {_LIVE_FILE_CONDITION}
+        GROUP BY size HAVING COUNT(*) > 1
+        ORDER BY size DESC
+    ''', (min_size,))
+    cursor = conn.cursor()
+    for size, in sizes:
+        cursor.execute(f'''
+            SELECT f.id, f.catalog_id, d.path, f.name, f.modified_at, f.md5_hash, f.sample_hash
+            FROM files f JOIN directories d ON d.id = f.dir_id
+            WHERE f.size = ? AND f.{_LIVE_FILE_CONDITION}
+        ''', (size,))
+        candidates = [
+            DuplicateCandidate(row_id, catalog_id, os.path.join(dir_path, name) if dir_path else name,
+                               size, modified_at, md5_hash, sample_hash)
+            for row_id, catalog_id, dir_path, name, modified_at, md5_hash, sample_hash in cursor
+        ]
+        if len(candidates) > 1:
+            yield size, candidates
+
+
+def count_duplicate_sizes(conn, min_size=1):
+    """Count the file sizes duplicate_size_groups() will yield"""
+    return conn.execute(f'''
+        SELECT COUNT(*) FROM (
+            SELECT size FROM files WHERE size >= ? AND {_LIVE_FILE_CONDITION}
+            GROUP BY size HAVING COUNT(*) > 1
+        )
+    ''', (min_size,)).fetchone()[0]
+
+
+def duplicate_summary(conn):
+    """Return (sets, files, reclaimable bytes) for the stored duplicate sets"""
+    sets, files, reclaimable = conn.execute('''
+        SELECT COUNT(*), SUM(copies), SUM(size * (copies - 1)) FROM (
+            SELECT COUNT(*) AS copies, MAX(f.size) AS size
+            FROM duplicate_files dup
+            JOIN files f ON f.id = dup.file_id
+            JOIN catalogs c ON c.id = f.catalog_id
+            WHERE c.deleted_at IS NULL
+            GROUP BY dup.set_id HAVING COUNT(*) > 1
+        )
+    ''').fetchone()
+    return sets, files or 0, reclaimable or 0
+
+
+def duplicate_sets(conn):
+    """Yield the stored duplicate sets with their files, largest files first"""
+    cursor = conn.execute('''
+        SELECT dup.set_id, f.size, c.name, c.root_path, d.path, f.name
+        FROM duplicate_files dup
+        JOIN files f ON f.id = dup.file_id
+        JOIN directories d ON d.id = f.dir_id
+        JOIN catalogs c ON c.id = f.catalog_id
+        WHERE c.deleted_at IS NULL
+        ORDER BY dup.set_id
+    ''')
+    for set_id, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+        rows = list(rows)
+        files = [(catalog_name, root_path, os.path.join(dir_path, name) if dir_path else name)
+                 for _, _, catalog_name, root_path, dir_path, name in rows]
+        # Files deleted since the search drop out of their set
+        if len(files) > 1:
+            size = rows[0][1]
+            yield DuplicateSet(set_id, size, files, size * (len(files) - 1))
+
+
+# Search results returned at most, so broad searches stay fast
+SEARCH_LIMIT = 1000
+
+# A file found by search_files(); path is relative to the catalog root
+SearchResult = namedtuple('SearchResult', [
+    'catalog_id', 'catalog_name', 'root_path', 'path', 'size', 'modified_at'
+])
+
+
+def _like_pattern(text):
+    """Escape LIKE wildcards in text; patterns use backslash as the escape character"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_files(conn, text='', catalog_id=None, min_size=None, max_size=None, modified_after=None,
+                 modified_before=None, extensions=(), limit=SEARCH_LIMIT):
+    """Return files whose name or directory path contains every word of text
+
+    Words of three or more characters are looked up in the trigram index;
+    shorter words can't use it and are matched with LIKE on the remaining
+    rows. Matching ignores case. modified_after and modified_before are
+    naive local datetimes. Results are not sorted: they come in whatever
+    order the query plan finds them, so the limit can stop the search early.
+    """
+    words = text.split()
+    indexed = [word for word in words if len(word) >= 3]
+    conditions = ['c.deleted_at IS NULL']
+    params = []
+    if indexed:
+        # Each word is a quoted phrase, which the trigram tokenizer matches as a substring
+        source = 'file_search s JOIN files f ON f.id = s.rowid'
+        conditions.append('file_search MATCH ?')
+        params.append(' AND '.join('"' + word.replace('"', '""') + '"' for word in indexed))
+    else:
+        source = 'files f'
+    for word in words:
+        if len(word) < 3:
+            conditions.append("(f.name LIKE ? ESCAPE '\\' OR d.path LIKE ? ESCAPE '\\')")
+            params += ['%' + _like_pattern(word) + '%'] * 2
+    if extensions:
+        conditions.append('(' + ' OR '.join(["f.name LIKE ? ESCAPE '\\'"] * len(extensions)) + ')')
+        params += ['%.' + _like_pattern(extension.lstrip('.')) for extension in extensions]
+    for condition, value in [
+        ('f.catalog_id = ?', catalog_id),
+        ('f.size >= ?', min_size),
+        ('f.size <= ?', max_size),
+        ('f.modified_at >= ?', None if modified_after is None else datetime_to_mtime_ns(modified_after)),
+        ('f.modified_at < ?', None if modified_before is None else datetime_to_mtime_ns(modified_before)),
+    ]:
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+
+    where = 'WHERE ' + ' AND '.join(conditions)
+    cursor = conn.execute(f'''
+        SELECT c.id, c.name, c.root_path, d.path, f.name, f.size, f.modified_at
+        FROM {source}
+        JOIN directories d ON d.id = f.dir_id
+        JOIN catalogs c ON c.id = f.catalog_id
+        {where}
+        LIMIT ?
+    ''', params + [limit])
+    return [
+        SearchResult(row_id, catalog_name, root_path, os.path.join(dir_path, name) if dir_path else name,
+                     size, modified_at)
+        for row_id, catalog_name, root_path, dir_path, name, size, modified_at in cursor
+    ]
+
+
+def largest_directories(conn, catalog_id, limit):
+    """Return (path, total_size, total_files, newest_modified_at) of a catalog's largest directories"""
+    cursor = conn.execute('''
+        SELECT path, total_size, total_files, newest_modified_at FROM directories
+        WHERE catalog_id = ?
+        ORDER BY total_size DESC, path
+        LIMIT ?
+    ''', (catalog_id, limit))
+    return cursor.fetchall()
+
+
+# Subdirectories and files shown per directory by the treemap; the rest is one item
+USAGE_ITEMS = 200
+
+# A block of disk usage: a subdirectory (dir_id set), a file, or the rest of a directory
+UsageItem = namedtuple('UsageItem', ['dir_id', 'name', 'size', 'file_count', 'is_rest'])
+
+
+def directory_usage(conn, dir_id, limit=USAGE_ITEMS):
+    """Return (path, parent_id, items) for one directory, its largest entries first
+
+    Only the largest subdirectories and files are read; everything else is
+    summed up from the stored totals into a single remainder item, so the
+    cost does not depend on how much is below the directory.
+    """
+    row = conn.execute(
+        'SELECT path, parent_id, total_size, total_files FROM directories WHERE id = ?', (dir_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    path, parent_id, total_size, total_files = row
+    items = [
+        UsageItem(child_id, name, size, file_count, False)
+        for child_id, name, size, file_count in conn.execute('''
+            SELECT id, name, total_size, total_files FROM directories
+            WHERE parent_id = ?
+            ORDER BY total_size DESC LIMIT ?
+        ''', (dir_id, limit))
+    ]
+    items += [
+        UsageItem(None, name, size or 0, 1, False)
+        for name, size in conn.execute(
+            'SELECT name, size FROM files WHERE dir_id = ? ORDER BY size DESC LIMIT ?', (dir_id, limit)
+        )
+    ]
+    items.sort(key=lambda item: item.size, reverse=True)
+    items = items[:limit]
+    rest_size = total_size - sum(item.size for item in items)
+    rest_files = total_files - sum(item.file_count for item in items)
+    if rest_size > 0:
+        items.append(UsageItem(None, f"{rest_files:,} more files", rest_size, rest_files, True))
+    return path, parent_id, items
+
+
+def catalog_hash_algorithm(conn, catalog_id):
+    """Return the fingerprint algorithm a catalog was hashed with, or None"""
+    row = conn.execute('SELECT hash_algorithm FROM catalogs WHERE id = ?', (catalog_id,)).fetchone()
+    return row[0] if row else None
+
+
+def checkable_hash_algorithm(conn, catalog_id):
+    """Return the full-hash algorithm of a catalog if files can be hashed with it here, or None"""
+    algorithm = catalog_hash_algorithm(conn, catalog_id)
+    if algorithm in (None, SAMPLE_ALGORITHM) or algorithm not in available_algorithms():
+        return None
+    return algorithm
+
+
+def shared_hash_algorithm(conn, catalog_id, other_catalog_id):
+    """Return the full-hash algorithm both catalogs were hashed with, or None if their full hashes can't be compared"""
+    algorithm = catalog_hash_algorithm(conn, catalog_id)
+    if algorithm in (None, SAMPLE_ALGORITHM) or algorithm != catalog_hash_algorithm(conn, other_catalog_id):
+        return None
+    return algorithm
+
+
+def list_catalogs(conn):
+    """Return (id, name, root_path, created_at) for every catalog, newest first"""
+    cursor = conn.execute(
+        'SELECT id, name, root_path, created_at FROM catalogs WHERE deleted_at IS NULL '
+        'ORDER BY created_at DESC, id DESC'
+    )
+    return cursor.fetchall()
+
+
+def find_catalog(conn, reference):
+    """Look up (id, name, root_path) of a catalog by id or by name"""
+    cursor = conn.cursor()
+    if str(reference).isdigit():
+        cursor.execute('SELECT id, name, root_path FROM catalogs WHERE id = ? AND deleted_at IS NULL',
+                       (int(reference),))
+        row = cursor.fetchone()
+        if row:
+            return row
+    cursor.execute('SELECT id, name, root_path FROM catalogs WHERE name = ? AND deleted_at IS NULL ORDER BY id DESC',
+                   (str(reference),))
+    return cursor.fetchone()
@@ -0,0 +1,282 @@
+import os
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# hashlib releases the GIL for large updates, so threads scale with cores and disks
+DEFAULT_HASH_WORKERS = min(8, (os.cpu_count() or 1) + 1)
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+DEFAULT_ALGORITHM = 'md5'
+# A sample fingerprint covers the size and the first, middle and last SAMPLE_SIZE bytes
+SAMPLE_ALGORITHM = 'sample'
+SAMPLE_SIZE = 64 * 1024
+
+# Full-content hashes, with the optional ones only when their module is installed
+_HASHERS = {
+    'md5': hashlib.md5,
+    'blake2b': hashlib.blake2b,
+}
+if xxhash is not None:
+    _HASHERS['xxh3'] = xxhash.xxh3_128
+if blake3 is not None:
+    _HASHERS['blake3'] = blake3.blake3
+
+_local = threading.local()
+
+
+def available_algorithms():
+    """Return the fingerprint algorithms that can be used here, sample last"""
+    return list(_HASHERS) + [SAMPLE_ALGORITHM]
+
+
+def fingerprint_algorithms(algorithm):
+    """Return the fingerprints stored for a catalog hashed with algorithm
+
+    Full hashes are paired with a sample, which comes from the same read.
+    """
+    if algorithm is None:
+        return ()
+    if algorithm == SAMPLE_ALGORITHM:
+        return (SAMPLE_ALGORITHM,)
+    return (algorithm, SAMPLE_ALGORITHM)
+
+
+def sample_ranges(size, sample_size=SAMPLE_SIZE):
+    """Return the (start, end) byte ranges a sample fingerprint covers"""
+    if size <= 3 * sample_size:
+        return [(0, size)]
+    middle = (size - sample_size) // 2
+    return [(0, sample_size), (middle, middle + sample_size), (size - sample_size, size)]
+
+
+def _new_digest(algorithm, size):
+    if algorithm == SAMPLE_ALGORITHM:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(size.to_bytes(8, 'little'))
+        return digest
+    return _HASHERS[algorithm]()
+
+
+def hash_file(file_path, algorithm=DEFAULT_ALGORITHM, buffer_size=DEFAULT_BUFFER_SIZE, is_cancelled=None):
+    """Hash a file by reading into a reused per-thread buffer"""
+    digests = fingerprint_file(file_path, (algorithm,), buffer_size, is_cancelled)
+    return digests[0] if digests else None
+
+
+def fingerprint_file(file_path, algorithms, buffer_size=DEFAULT_BUFFER_SIZE, is_cancelled=None):
+    """Compute several fingerprints of a file from one pass over it
+
+    Returns a tuple of raw digests in the order of algorithms, or None when
+    cancelled. When only a sample is asked for, just the sampled ranges are
+    read; otherwise the sample is taken from the full sequential read.
+    """
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None or len(buffer) != buffer_size:
+        buffer = _local.buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(file_path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        digests = [_new_digest(algorithm, size) for algorithm in algorithms]
+        full = [digest for algorithm, digest in zip(algorithms, digests) if algorithm != SAMPLE_ALGORITHM]
+        sample = digests[algorithms.index(SAMPLE_ALGORITHM)] if SAMPLE_ALGORITHM in algorithms else None
+        ranges = sample_ranges(size) if sample else []
+
+        # Only the sampled ranges are needed when no full hash is computed
+        reads = [(0, None)] if full else ranges
+        for start, end in reads:
+            offset = f.seek(start)
+            while end is None or offset < end:
+                if is_cancelled and is_cancelled():
+                    return None
+                wanted = buffer_size if end is None else min(buffer_size, end - offset)
+                count = f.readinto(view[:wanted])
+                if not count:
+                    break
+                for digest in full:
+                    digest.update(view[:count])
+                # Ranges are in file order and don't overlap, so sequential updates keep their order
+                for range_start, range_end in ranges:
+                    low, high = max(range_start, offset), min(range_end, offset + count)
+                    if low < high:
+                        sample.update(view[low - offset:high - offset])
+                offset += count
+    return tuple(digest.digest() for digest in digests)
+
+
+def is_rotational(device):
+    """Check whether a device number belongs to a spinning disk (Linux only)"""
+    try:
+        block = f'/sys/dev/block/{os.major(device)}:{os.minor(device)}'
+        # Partitions keep their queue settings on the parent disk
+        for queue in (os.path.join(block, 'queue'), os.path.join(block, '..', 'queue')):
+            rotational = os.path.join(queue, 'rotational')
+            if os.path.exists(rotational):
+                with open(rotational) as f:
+                    return f.read().strip() == '1'
+    except (AttributeError, OSError, ValueError):
+        pass
+    return False
+
+
+class HashPipeline:
+    """Hash files on a thread pool behind the scanner, ordered per device
+
+    Jobs are collected in small batches and sorted by (device, inode) so each
+    disk is read roughly in on-disk order. Spinning disks are limited to one
+    reader at a time to avoid seek thrashing; other devices get the whole pool.
+    The limit is kept when jobs are handed to the pool: jobs for a busy device
+    wait in its backlog, so pool threads never block and other devices are
+    not held up behind it.
+    """
+
+    def __init__(self, workers=DEFAULT_HASH_WORKERS, algorithms=(DEFAULT_ALGORITHM,),
+                 buffer_size=DEFAULT_BUFFER_SIZE, batch_size=64):
+        self.workers = max(1, workers)
+        self.algorithms = algorithms
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.max_pending = self.workers * 16
+        self.is_cancelled = False
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hash')
+        self._batch = []
+        # Running jobs with their device, and per device the jobs waiting for a free slot
+        self._futures = {}
+        self._backlog = {}
+        self._free_slots = {}
+        self._backlogged = 0
+
+    def submit(self, file_path, device, inode, payload, algorithms=None):
+        """Queue a file for hashing; payload is returned with its tuple of digests"""
+        self._batch.append((device, inode, file_path, payload, algorithms or self.algorithms))
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def completed(self):
+        """Yield (payload, digests) for finished jobs, waiting only when the queue is full"""
+        if len(self._futures) + self._backlogged >= self.max_pending:
+            done, _ = wait(self._futures, return_when=FIRST_COMPLETED)
+        else:
+            done = [future for future in self._futures if future.done()]
+        yield from self._finish(done)
+
+    def drain(self):
+        """Yield (payload, digests) for every remaining job as it finishes
+
+        Jobs submitted while draining are waited for as well.
+        """
+        while self.pending() and not self.is_cancelled:
+            self._flush()
+            done, _ = wait(self._futures, return_when=FIRST_COMPLETED)
+            yield from self._finish(done)
+
+    def pending(self):
+        return bool(self._batch or self._futures or self._backlogged)
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def close(self):
+        """Stop the pool, dropping queued jobs if the pipeline was cancelled"""
+        self._executor.shutdown(wait=True, cancel_futures=self.is_cancelled)
+
+    def _flush(self):
+        # Sort by device and inode so each disk is read roughly in on-disk order
+        self._batch.sort(key=lambda job: job[:2])
+        for device, inode, file_path, payload, algorithms in self._batch:
+            if device not in self._backlog:
+                self._backlog[device] = deque()
+                self._free_slots[device] = 1 if is_rotational(device) else self.workers
+            self._backlog[device].append((file_path, payload, algorithms))
+        self._backlogged += len(self._batch)
+        self._batch = []
+        for device in self._backlog:
+            self._start(device)
+
+    def _start(self, device):
+        # Hand a device's waiting jobs to the pool while it has free slots
+        backlog = self._backlog[device]
+        while backlog and self._free_slots[device]:
+            self._free_slots[device] -= 1
+            self._backlogged -= 1
+            self._futures[self._executor.submit(self._hash, *backlog.popleft())] = device
+
+    def _finish(self, done):
+        # Results are taken in the caller's thread, which then fills the freed slots
+        for future in done:
+            device = self._futures.pop(future)
+            self._free_slots[device] += 1
+            self._start(device)
+            yield future.result()
+
+    def _hash(self, file_path, payload, algorithms):
+        try:
+            digests = fingerprint_file(file_path, algorithms, self.buffer_size, lambda: self.is_cancelled)
+        except OSError:
+            digests = None
+        return payload, digests
+
+
+class CachedHasher:
+    """Front a HashPipeline with a digest cache so unchanged files are not read again
+
+    The cache provides lookup(device, inode, size, mtime_ns, algorithm) and
+    store(device, inode, size, mtime_ns, algorithm, digest). Files whose
+    digests are all cached are handed back from completed() like finished
+    jobs.
+    """
+
+    def __init__(self, pipeline, cache):
+        self.pipeline = pipeline
+        self.cache = cache
+        self._ready = []
+
+    def submit(self, entry, payload, algorithms=None):
+        """Queue a scanned file for hashing; payload is returned with its tuple of digests"""
+        algorithms = algorithms or self.pipeline.algorithms
+        digests = []
+        for algorithm in algorithms:
+            digest = self.cache.lookup(entry.device, entry.inode, entry.size, entry.mtime_ns, algorithm)
+            if digest is None:
+                self.pipeline.submit(entry.full_path, entry.device, entry.inode,
+                                     (entry, payload, algorithms), algorithms)
+                return
+            digests.append(digest)
+        self._ready.append((payload, tuple(digests)))
+
+    def completed(self):
+        """Yield (payload, digests) for cache hits and finished jobs"""
+        ready, self._ready = self._ready, []
+        yield from ready
+        yield from self._store(self.pipeline.completed())
+
+    def drain(self):
+        """Yield (payload, digests) for every remaining hit and job, including ones queued meanwhile"""
+        while (self._ready or self.pipeline.pending()) and not self.pipeline.is_cancelled:
+            ready, self._ready = self._ready, []
+            yield from ready
+            yield from self._store(self.pipeline.drain())
+
+    def cancel(self):
+        self.pipeline.cancel()
+
+    def close(self):
+        self.pipeline.close()
+
+    def _store(self, results):
+        for (entry, payload, algorithms), digests in results:
+            if digests is not None:
+                for algorithm, digest in zip(algorithms, digests):
+                    self.cache.store(entry.device, entry.inode, entry.size, entry.mtime_ns, algorithm, digest)
+            yield payload, digests
@@ -0,0 +1,214 @@
+import os
+import time
+import sqlite3
+import cProfile
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+from catalog_hash import HashPipeline, SAMPLE_ALGORITHM, sample_ranges
+
+# Profiling is off unless this is set: to 1 for stage timers and counters, or
+# to a file name to also write a cProfile dump of each operation there
+PROFILE_ENV = 'DISK_CATALOG_PROFILE'
+
+log = logging.getLogger('catalog.profile')
+
+# Stages in report order, with the unit each counter is shown in
+STAGES = ('scan', 'hash', 'sql', 'ui')
+COUNTER_UNITS = {'bytes': 'MB'}
+
+
+class Profile:
+    """Per-stage timers and counters of one catalog operation
+
+    Each stage adds up wall time over the threads doing its work, so
+    parallel scanning and hashing can take longer in total than the run
+    itself. Counters are kept per stage: listings and stats for scan,
+    files and bytes for hash, statements and rows for sql and signals for
+    ui. Stages are filled in from several threads.
+    """
+
+    def __init__(self, dump_path=None):
+        self.dump_path = dump_path
+        self.stages = {}
+        self.started = None
+        self.elapsed = None
+        self._lock = threading.Lock()
+        self._profiler = None
+
+    @classmethod
+    def from_environment(cls):
+        """Return a Profile when profiling is switched on through PROFILE_ENV, otherwise None"""
+        value = os.environ.get(PROFILE_ENV, '')
+        if value in ('', '0'):
+            return None
+        return cls(None if value == '1' else value)
+
+    def add(self, stage, seconds, **counts):
+        """Add time and counts to a stage"""
+        with self._lock:
+            totals = self.stages.setdefault(stage, {'seconds': 0.0})
+            totals['seconds'] += seconds
+            for name, count in counts.items():
+                totals[name] = totals.get(name, 0) + count
+
+    @contextmanager
+    def timed(self, stage, **counts):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, **counts)
+
+    def start(self):
+        """Start the clock, and cProfile in the calling thread when dumping"""
+        self.started = time.perf_counter()
+        if self.dump_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        """Stop the clock, write the cProfile dump and log the report"""
+        if self._profiler:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.dump_path)
+            self._profiler = None
+        self.elapsed = time.perf_counter() - self.started
+        log.info("%s", self.report())
+
+    def summary(self):
+        """Describe the time per stage on one line"""
+        parts = []
+        for stage, totals in self._ordered():
+            counters = ', '.join(self._format_counter(name, value) for name, value in totals.items()
+                                 if name != 'seconds')
+            parts.append(f"{stage} {totals['seconds']:.2f}s" + (f" ({counters})" if counters else ""))
+        return " · ".join(parts) or "nothing timed"
+
+    def report(self):
+        """Describe the time and counters per stage as a small table"""
+        lines = ["profile:" + (f" {self.elapsed:.2f}s elapsed" if self.elapsed is not None else "")
+                 + (f", cProfile dump in {self.dump_path}" if self.dump_path and self.elapsed is not None else "")]
+        for stage, totals in self._ordered():
+            counters = '  '.join(self._format_counter(name, value) for name, value in totals.items()
+                                 if name != 'seconds')
+            lines.append(f"  {stage:<5} {totals['seconds']:>9.3f}s  {counters}")
+        return '\n'.join(lines)
+
+    def _ordered(self):
+        with self._lock:
+            stages = {stage: dict(totals) for stage, totals in self.stages.items()}
+        order = [stage for stage in STAGES if stage in stages] + sorted(set(stages) - set(STAGES))
+        return [(stage, stages[stage]) for stage in order]
+
+    def _format_counter(self, name, value):
+        if COUNTER_UNITS.get(name) == 'MB':
+            return f"{value / 1e6:,.1f} MB"
+        return f"{value:,} {name}"
+
+
+def timed(profile, stage, **counts):
+    """Time a block into profile, or do nothing when profile is None"""
+    return profile.timed(stage, **counts) if profile else nullcontext()
+
+
+def profiled_scanner(scanner_class, profile):
+    """Subclass a scanner so directory listings and stats are timed and counted"""
+    class ProfiledScanner(scanner_class):
+        def _open_directory(self, dir_path, rel_dir):
+            with profile.timed('scan', listings=1):
+                return super()._open_directory(dir_path, rel_dir)
+
+        def _scan_entry(self, entry, rel_dir):
+            with profile.timed('scan', stats=1):
+                return super()._scan_entry(entry, rel_dir)
+    return ProfiledScanner
+
+
+class ProfiledHashPipeline(HashPipeline):
+    """HashPipeline that times every job and counts the bytes it reads"""
+
+    def __init__(self, profile, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profile = profile
+
+    def _hash(self, file_path, payload, algorithms):
+        start = time.perf_counter()
+        result = super()._hash(file_path, payload, algorithms)
+        seconds = time.perf_counter() - start
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            size = 0
+        # Sample-only fingerprints read just the sampled ranges
+        if SAMPLE_ALGORITHM in algorithms and len(algorithms) == 1:
+            size = sum(high - low for low, high in sample_ranges(size))
+        self.profile.add('hash', seconds, files=1, bytes=size)
+        return result
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times execute calls and row fetches and counts rows written
+
+    Nothing is timed while its connection has no profile.
+    """
+
+    def execute(self, sql, parameters=()):
+        with timed(self.connection.profile, 'sql', statements=1):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        if self.connection.profile:
+            self.connection.profile.add('sql', time.perf_counter() - start, statements=1,
+                                        rows=max(self.rowcount, 0))
+        return result
+
+    def executescript(self, sql_script):
+        with timed(self.connection.profile, 'sql', statements=1):
+            return super().executescript(sql_script)
+
+    def __next__(self):
+        with timed(self.connection.profile, 'sql'):
+            return super().__next__()
+
+    def fetchone(self):
+        with timed(self.connection.profile, 'sql'):
+            return super().fetchone()
+
+    def fetchmany(self, size=None):
+        with timed(self.connection.profile, 'sql'):
+            return super().fetchmany(self.arraysize if size is None else size)
+
+    def fetchall(self):
+        with timed(self.connection.profile, 'sql'):
+            return super().fetchall()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors, including those of the execute shortcuts, are ProfiledCursors"""
+
+    profile = None
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connect(database, profile=None, **kwargs):
+    """Open a database connection, with its SQL timed into profile when one is given"""
+    if profile is None:
+        return sqlite3.connect(database, **kwargs)
+    conn = sqlite3.connect(database, factory=ProfiledConnection, **kwargs)
+    conn.profile = profile
+    return conn
@@ -0,0 +1,303 @@
+import os
+import stat
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# By default local trees are walked on one thread, where more gain little, and
+# trees on network file systems on several
+DEFAULT_SCAN_WORKERS = None
+NETWORK_SCAN_WORKERS = 8
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', '9p', 'ceph', 'glusterfs', 'afs'}
+# Parallel scans hand entries over in chunks, buffering a few chunks per subtree
+SCAN_CHUNK_SIZE = 256
+SCAN_QUEUE_CHUNKS = 16
+# The top levels are split until there are this many subtrees per worker
+SUBTREES_PER_WORKER = 4
+MAX_SPLIT_DEPTH = 3
+
+# A single directory or file found while scanning a tree. `path` and `parent`
+# are relative to the scanned root ('' is the root itself), times are
+# nanosecond st_mtime values.
+ScanEntry = namedtuple('ScanEntry', [
+    'path', 'parent', 'full_path', 'name', 'is_directory', 'size', 'mtime_ns', 'inode', 'device'
+])
+
+
+def is_network_path(path):
+    """Check whether a path is on a network file system, by the longest matching mount (Linux only)"""
+    path = os.path.realpath(path)
+    best_mount, best_type = '', None
+    try:
+        with open('/proc/mounts') as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # Mount points escape spaces as octal sequences
+                mount_point = fields[1].replace('\\040', ' ')
+                inside = path == mount_point or path.startswith(mount_point.rstrip('/') + '/')
+                if inside and len(mount_point) >= len(best_mount):
+                    best_mount, best_type = mount_point, fields[2]
+    except OSError:
+        return False
+    return best_type in NETWORK_FILESYSTEMS
+
+
+def scan_workers_for(path):
+    """Pick the number of scan threads for a tree when none was given"""
+    return NETWORK_SCAN_WORKERS if is_network_path(path) else 1
+
+
+class TreeScanner:
+    """Walk a directory tree once with os.scandir, reusing DirEntry.stat() results
+
+    Entries come out in tree order: depth-first, with each directory's
+    entries sorted by name and a directory's contents right after it. That
+    is the order of the path components, so a scan can be merged against
+    catalog rows read in the same order without holding either in memory.
+    """
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.is_cancelled = False
+        self.is_finished = False
+        self.files_seen = 0
+        self.dirs_seen = 0
+        self.dirs_queued = 0
+        self.dirs_scanned = 0
+
+    def scan(self):
+        """Yield a ScanEntry for every directory and file below root_path"""
+        self.dirs_queued = 1
+        for entry in self._walk(self.root_path, ''):
+            self._count(entry)
+            yield entry
+        if not self.is_cancelled:
+            self.is_finished = True
+
+    def scan_directory(self, rel_dir, recursive=True):
+        """Yield the entries below one directory of the tree in tree order, or only its own entries"""
+        dir_path = os.path.join(self.root_path, rel_dir) if rel_dir else self.root_path
+        if recursive:
+            entries = self._walk(dir_path, rel_dir)
+        else:
+            _, listing = self._open_directory(dir_path, rel_dir)
+            entries = (self._scan_entry(entry, rel_dir) for entry in listing)
+        for entry in entries:
+            if entry is not None:
+                self._count(entry)
+                yield entry
+
+    def entry_at(self, rel_path):
+        """Return the ScanEntry of one path below the root, or None when it is gone"""
+        if not rel_path:
+            try:
+                return self.root_entry()
+            except OSError:
+                return None
+        full_path = os.path.join(self.root_path, rel_path)
+        try:
+            # Followed like DirEntry.stat() in a scan
+            st = os.stat(full_path)
+        except OSError:
+            return None
+        is_directory = stat.S_ISDIR(st.st_mode)
+        return ScanEntry(rel_path, os.path.dirname(rel_path), full_path, os.path.basename(rel_path), is_directory,
+                         0 if is_directory else st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)
+
+    def _walk(self, dir_path, rel_dir):
+        """Yield the entries below one directory in tree order"""
+        levels = [self._open_directory(dir_path, rel_dir)]
+        while levels:
+            if self.is_cancelled:
+                return
+            rel_dir, entries = levels[-1]
+            entry = next(entries, None)
+            if entry is None:
+                levels.pop()
+                continue
+
+            scan_entry = self._scan_entry(entry, rel_dir)
+            if scan_entry is None:
+                continue
+            yield scan_entry
+            # Symlinked directories are listed but not followed, like os.walk
+            if scan_entry.is_directory and not entry.is_symlink():
+                levels.append(self._open_directory(entry.path, scan_entry.path))
+
+    def _scan_entry(self, entry, rel_dir):
+        """Build the ScanEntry of a DirEntry, or None if it can't be stat'ed"""
+        rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+        try:
+            is_directory = entry.is_dir()
+            st = entry.stat()
+        except OSError:
+            return None
+        return ScanEntry(rel_path, rel_dir, entry.path, entry.name, is_directory, 0 if is_directory else st.st_size,
+                         st.st_mtime_ns, st.st_ino, st.st_dev)
+
+    def _count(self, entry):
+        if entry.is_directory:
+            self.dirs_seen += 1
+        else:
+            self.files_seen += 1
+
+    def root_entry(self):
+        """Return a ScanEntry describing the root directory itself"""
+        st = os.stat(self.root_path)
+        name = os.path.basename(os.path.normpath(self.root_path))
+        return ScanEntry('', None, self.root_path, name, True, 0,
+                         st.st_mtime_ns, st.st_ino, st.st_dev)
+
+    def _open_directory(self, dir_path, rel_dir):
+        """List a directory sorted by name; unreadable directories are empty"""
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            entries = []
+        # Count subdirectories now so progress can estimate the work still queued
+        subdirectories = 0
+        for entry in entries:
+            try:
+                if entry.is_dir() and not entry.is_symlink():
+                    subdirectories += 1
+            except OSError:
+                pass
+        self._count_listing(subdirectories)
+        return rel_dir, iter(entries)
+
+    def _count_listing(self, subdirectories):
+        self.dirs_scanned += 1
+        self.dirs_queued += subdirectories
+
+    def estimated_total(self):
+        """Estimate the total file count from what has been scanned so far"""
+        if self.is_finished:
+            return self.files_seen
+        files_per_dir = self.files_seen / max(self.dirs_scanned, 1)
+        estimate = self.files_seen + int((self.dirs_queued - self.dirs_scanned) * files_per_dir)
+        # Never report completion while there is still work in flight
+        return max(estimate, self.files_seen + 1)
+
+    def cancel(self):
+        self.is_cancelled = True
+
+
+class ParallelTreeScanner(TreeScanner):
+    """TreeScanner that walks independent subtrees on a thread pool
+
+    The first directory levels are listed up front and split into subtrees.
+    Worker threads walk the subtrees in tree order, each into its own
+    bounded queue, and scan() drains the queues one subtree after another,
+    so entries come out exactly as TreeScanner yields them and a single
+    consumer can keep writing to the database. os.scandir() and stat()
+    release the GIL, so the threads overlap the round trips of network file
+    systems. Subtrees start in tree order, so the one being drained always
+    has a worker, and workers never run more than a few chunks ahead.
+    """
+
+    def __init__(self, root_path, workers):
+        super().__init__(root_path)
+        self.workers = workers
+        self.is_stopping = False
+        self.count_lock = threading.Lock()
+
+    def scan(self):
+        """Yield a ScanEntry for every directory and file below root_path"""
+        self.dirs_queued = 1
+        listings, subtrees = self._split()
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix='scan')
+        completed = False
+        try:
+            queues = {}
+            for entry in subtrees:
+                queues[entry.path] = queue.Queue(SCAN_QUEUE_CHUNKS)
+                executor.submit(self._walk_subtree, entry, queues[entry.path])
+            for entry in self._merge('', listings, queues):
+                self._count(entry)
+                yield entry
+            completed = not self.is_cancelled
+        finally:
+            # Stop workers whose subtree will not be drained, e.g. when the consumer gave up
+            self.is_stopping = True
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.is_finished = completed
+
+    def _count_listing(self, subdirectories):
+        # Workers list directories concurrently
+        with self.count_lock:
+            super()._count_listing(subdirectories)
+
+    def _split(self):
+        """List the top levels; return their ScanEntry listings and the subtrees below them in tree order"""
+        listings = {}
+        frontier = [self.root_entry()]
+        for _ in range(MAX_SPLIT_DEPTH):
+            subtrees = []
+            for directory in frontier:
+                _, entries = self._open_directory(directory.full_path, directory.path)
+                listings[directory.path] = []
+                for entry in entries:
+                    scan_entry = self._scan_entry(entry, directory.path)
+                    if scan_entry is None:
+                        continue
+                    listings[directory.path].append(scan_entry)
+                    if scan_entry.is_directory and not entry.is_symlink():
+                        subtrees.append(scan_entry)
+            frontier = subtrees
+            if len(frontier) >= self.workers * SUBTREES_PER_WORKER:
+                break
+        return listings, frontier
+
+    def _merge(self, rel_dir, listings, queues):
+        """Yield a listed directory in tree order, draining each subtree where it starts"""
+        for scan_entry in listings[rel_dir]:
+            if self.is_cancelled:
+                return
+            yield scan_entry
+            if scan_entry.path in listings:
+                yield from self._merge(scan_entry.path, listings, queues)
+            elif scan_entry.path in queues:
+                yield from self._drain(queues.pop(scan_entry.path))
+
+    def _drain(self, chunks):
+        """Yield the entries of one subtree as its worker produces them"""
+        while not self.is_cancelled:
+            try:
+                chunk = chunks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                return
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield from chunk
+
+    def _walk_subtree(self, directory, chunks):
+        """Walk one subtree on a worker thread, passing its entries on in chunks"""
+        chunk = []
+        try:
+            for entry in self._walk(directory.full_path, directory.path):
+                chunk.append(entry)
+                if len(chunk) >= SCAN_CHUNK_SIZE:
+                    if not self._put(chunks, chunk):
+                        return
+                    chunk = []
+            if chunk and not self._put(chunks, chunk):
+                return
+            self._put(chunks, None)
+        except Exception as e:
+            self._put(chunks, e)
+
+    def _put(self, chunks, item):
+        """Queue an item for the consumer; returns False once the scan is abandoned"""
+        while not (self.is_cancelled or self.is_stopping):
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
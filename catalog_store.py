@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from catalog_db import DEFAULT_DB_PATH, init_schema, tune_connection
+from catalog_profile import ProfiledConnection
+
+# Where the catalog database lives unless a path is given; overrides DEFAULT_DB_PATH
+DB_PATH_ENV = 'DISK_CATALOG_DB'
+
+# Idle read-only connections kept open for reuse
+DEFAULT_READERS = 4
+
+# Compiled statements kept per connection; the scan, update and lazy tree
+# queries are run over and over, so they are prepared once per connection
+STATEMENT_CACHE_SIZE = 256
+
+
+def default_db_path():
+    """Return the database path from DB_PATH_ENV, or DEFAULT_DB_PATH"""
+    return os.environ.get(DB_PATH_ENV) or DEFAULT_DB_PATH
+
+
+class CatalogStore:
+    """Shared access to one catalog database for a multi-threaded application
+
+    All writes run on a single writer thread that owns the only read-write
+    connection, so writers queue up in order instead of failing on a busy
+    database. Reads borrow read-only connections from a small pool; in WAL
+    mode they see the last committed state and never wait for a scan or
+    purge in progress. Connections stay open, so their prepared statements
+    are reused. With profiled=True connections time their SQL into the
+    Profile passed to write() or acquire().
+    """
+
+    def __init__(self, path=None, readers=DEFAULT_READERS, profiled=False):
+        self.path = path or default_db_path()
+        self.readers = readers
+        self.profiled = profiled
+        self._uri = Path(os.path.abspath(self.path)).as_uri() + '?mode=ro'
+        self._idle = []
+        self._lock = threading.Lock()
+        self._writer = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog-writer')
+        # Create or upgrade the schema before any reader opens the file
+        self.write(self._initialize).result()
+
+    def write(self, function, *args, profile=None):
+        """Run function(conn, *args) on the writer thread and return a Future of its result
+
+        The connection is committed when function returns and rolled back
+        when it raises.
+        """
+        return self._executor.submit(self._run_write, function, args, profile)
+
+    def acquire(self, profile=None):
+        """Borrow a read-only connection; give it back with release()"""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect(self._uri, uri=True, check_same_thread=False)
+        if self.profiled:
+            conn.profile = profile
+        return conn
+
+    def release(self, conn):
+        """Return a connection from acquire() to the pool, or close it when the pool is full"""
+        with self._lock:
+            if len(self._idle) < self.readers:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def reader(self, profile=None):
+        """Borrow a read-only connection for the duration of a with block"""
+        conn = self.acquire(profile)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Finish queued writes and close all connections"""
+        self._executor.submit(self._close_writer)
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _connect(self, database, **kwargs):
+        factory = ProfiledConnection if self.profiled else sqlite3.Connection
+        return sqlite3.connect(database, factory=factory, cached_statements=STATEMENT_CACHE_SIZE, **kwargs)
+
+    def _run_write(self, function, args, profile):
+        if self._writer is None:
+            self._writer = self._connect(self.path)
+        conn = self._writer
+        if self.profiled:
+            conn.profile = profile
+        try:
+            result = function(conn, *args)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            if self.profiled:
+                conn.profile = None
+
+    def _initialize(self, conn):
+        # New databases only take auto_vacuum before anything is written, so WAL comes second
+        init_schema(conn)
+        tune_connection(conn)
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,389 @@
+import io
+import os
+import sys
+import csv
+import gzip
+import json
+import itertools
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from catalog_db import CatalogEntry, catalog_entries, datetime_to_mtime_ns, format_mtime
+
+# Exported catalogs are streamed one entry at a time; Parquet files are
+# written and read in row groups of this many entries
+TRANSFER_CHUNK_ROWS = 50_000
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Columns of JSONL and CSV exports. modified_at is local time for people to
+# read; mtime_ns is the exact stored value and wins on import
+EXPORT_COLUMNS = ['path', 'is_directory', 'size', 'modified_at', 'md5_hash', 'sample_hash', 'mtime_ns', 'inode']
+
+# File name suffixes, matched after a compression suffix is taken off
+_FORMAT_SUFFIXES = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl', '.csv': 'csv',
+                    '.parquet': 'parquet', '.pq': 'parquet'}
+_COMPRESSION_SUFFIXES = {'.gz': 'gz', '.zst': 'zst', '.zstd': 'zst'}
+
+# Exported paths always use '/', whatever the separator of the exporting machine
+_SEPARATOR = '/'
+
+
+class CatalogFormatError(ValueError):
+    """Raised when a catalog file can't be written or read in the requested format"""
+
+
+def available_formats():
+    """Return the export formats that can be used here"""
+    return ['jsonl', 'csv'] + (['parquet'] if pyarrow is not None else [])
+
+
+def available_compressions():
+    """Return the stream compressions that can be used here for JSONL and CSV"""
+    return ['gz'] + (['zst'] if zstandard is not None else [])
+
+
+def detect_format(path, file_format=None, compression=None):
+    """Return (file_format, compression) from the file name where they are not given
+
+    Unknown names and standard input or output default to uncompressed JSONL.
+    """
+    name = os.path.basename(path or '').lower()
+    stem, suffix = os.path.splitext(name)
+    if suffix in _COMPRESSION_SUFFIXES:
+        compression = compression or _COMPRESSION_SUFFIXES[suffix]
+        stem, suffix = os.path.splitext(stem)
+    file_format = file_format or _FORMAT_SUFFIXES.get(suffix, 'jsonl')
+    if compression == 'none':
+        compression = None
+    if file_format == 'parquet':
+        if pyarrow is None:
+            raise CatalogFormatError("Parquet needs the pyarrow package")
+        if compression:
+            raise CatalogFormatError("Parquet files are compressed internally; leave out the compression")
+        if not path or path == '-':
+            raise CatalogFormatError("Parquet needs a file name, not standard input or output")
+    if compression == 'zst' and zstandard is None:
+        raise CatalogFormatError("zstd compression needs the zstandard package")
+    return file_format, compression
+
+
+def export_row(entry):
+    """Return the EXPORT_COLUMNS values of a catalog entry, with text timestamps and hex digests"""
+    return [entry.path.replace(os.sep, _SEPARATOR), entry.is_directory, entry.size, format_mtime(entry.modified_at),
+            entry.md5_hash.hex() if entry.md5_hash else None, entry.sample_hash.hex() if entry.sample_hash else None,
+            entry.modified_at, entry.inode]
+
+
+def catalog_header(conn, catalog_id):
+    """Return the catalog fields stored with an export: name, root path and fingerprint algorithm"""
+    name, root_path, hash_algorithm, created_at = conn.execute(
+        'SELECT name, root_path, hash_algorithm, created_at FROM catalogs WHERE id = ?', (catalog_id,)
+    ).fetchone()
+    return {'name': name, 'root_path': root_path, 'hash_algorithm': hash_algorithm, 'created_at': created_at}
+
+
+def count_catalog_entries(conn, catalog_id):
+    """Return how many entries catalog_entries() yields for a catalog"""
+    return conn.execute('''
+        SELECT (SELECT COUNT(*) FROM directories WHERE catalog_id = ? AND parent_id IS NOT NULL)
+             + (SELECT COUNT(*) FROM files WHERE catalog_id = ?)
+    ''', (catalog_id, catalog_id)).fetchone()[0]
+
+
+def export_catalog(conn, catalog_id, path=None, file_format=None, compression=None, progress=None):
+    """Write a catalog to path, or to standard output, and return the number of entries written
+
+    Entries are streamed from the database straight into the output, so
+    memory use does not grow with the catalog. JSONL starts with a header
+    line holding the catalog fields and Parquet keeps them in its schema
+    metadata; CSV has rows only. progress(value, total, message) is called
+    for every entry; the file is removed again when writing fails or
+    progress raises.
+    """
+    file_format, compression = detect_format(path, file_format, compression)
+    header = catalog_header(conn, catalog_id)
+    total = count_catalog_entries(conn, catalog_id) if progress else 0
+    entries = catalog_entries(conn, catalog_id)
+    try:
+        if file_format == 'parquet':
+            return _write_parquet(path, header, entries, total, progress)
+        return _write_text(path, file_format, compression, header, entries, total, progress)
+    except BaseException:
+        # Don't leave a truncated export behind, e.g. after Ctrl-C
+        if path and path != '-' and os.path.isfile(path):
+            os.remove(path)
+        raise
+
+
+def _write_text(path, file_format, compression, header, entries, total, progress):
+    stream = _TextStream.open_write(path, compression)
+    output = stream.text
+    try:
+        count = 0
+        if file_format == 'csv':
+            writer = csv.writer(output)
+            writer.writerow(EXPORT_COLUMNS)
+        else:
+            output.write(json.dumps({'catalog': header}) + "\n")
+        for entry in entries:
+            row = export_row(entry)
+            if file_format == 'csv':
+                writer.writerow(row)
+            else:
+                output.write(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n")
+            count += 1
+            if progress:
+                progress(count, total, f"Exporting: {entry.path}")
+    finally:
+        stream.close()
+    return count
+
+
+def _write_parquet(path, header, entries, total, progress):
+    schema = pyarrow.schema([
+        ('path', pyarrow.string()),
+        ('is_directory', pyarrow.bool_()),
+        ('size', pyarrow.int64()),
+        ('modified_at', pyarrow.timestamp('ns', tz='UTC')),
+        ('md5_hash', pyarrow.binary()),
+        ('sample_hash', pyarrow.binary()),
+        ('inode', pyarrow.int64()),
+    ], metadata={b'disk_catalog': json.dumps(header).encode()})
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema, compression='zstd') as writer:
+        while True:
+            columns = [[] for _ in schema.names]
+            for entry in entries:
+                for column, value in zip(columns, (entry.path.replace(os.sep, _SEPARATOR), entry.is_directory,
+                                                   entry.size, entry.modified_at, entry.md5_hash,
+                                                   entry.sample_hash, entry.inode)):
+                    column.append(value)
+                if len(columns[0]) >= TRANSFER_CHUNK_ROWS:
+                    break
+            if not columns[0]:
+                break
+            writer.write_batch(pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            count += len(columns[0])
+            if progress:
+                progress(count, total, f"Exporting: {columns[0][-1]}")
+    return count
+
+
+class CatalogReader:
+    """Read an exported catalog one entry at a time
+
+    header holds the catalog fields stored with the export, with the file
+    name standing in for a missing catalog name. Iterating yields a
+    CatalogEntry per directory and file, with paths in the local separator
+    and id set to None. Only one chunk of the file is held in memory.
+    """
+
+    def __init__(self, path=None, file_format=None, compression=None):
+        self.path = path
+        self.file_format, self.compression = detect_format(path, file_format, compression)
+        self.header = {}
+        self.line = 0
+        self._stream = None
+        self._parquet = None
+        self._first_line = None
+        if self.file_format == 'parquet':
+            self._parquet = pyarrow.parquet.ParquetFile(path)
+            metadata = self._parquet.schema_arrow.metadata or {}
+            if b'disk_catalog' in metadata:
+                self.header = json.loads(metadata[b'disk_catalog'])
+        else:
+            self._stream = _TextStream.open_read(path, self.compression)
+            if self.file_format == 'jsonl':
+                self._read_header()
+        if not self.header.get('name') and path and path != '-':
+            self.header['name'] = os.path.basename(path).split('.')[0]
+
+    def __iter__(self):
+        if self._parquet is not None:
+            return self._read_parquet()
+        if self.file_format == 'csv':
+            return self._read_csv()
+        return self._read_jsonl()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def bytes_read(self):
+        """Return how far into the file reading has got, in bytes of the file as stored"""
+        return self._stream.position() if self._stream is not None else 0
+
+    def estimated_total(self, entries_read):
+        """Estimate the number of entries in the file from how far reading has got"""
+        if self._parquet is not None:
+            return self._parquet.metadata.num_rows
+        size = self._stream.size if self._stream is not None else 0
+        position = self.bytes_read()
+        if not size or not position:
+            return entries_read
+        return max(entries_read, int(entries_read * size / position))
+
+    def _read_header(self):
+        """Take the catalog fields from the first JSONL line; exports without one start with an entry"""
+        line = self._stream.text.readline()
+        try:
+            record = json.loads(line) if line.strip() else None
+        except ValueError:
+            record = None
+        if isinstance(record, dict) and isinstance(record.get('catalog'), dict):
+            self.header.update(record['catalog'])
+            self.line = 1
+        else:
+            self._first_line = line
+
+    def _read_jsonl(self):
+        lines = self._stream.text
+        if self._first_line is not None:
+            lines = itertools.chain([self._first_line], lines)
+        for line in lines:
+            self.line += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise CatalogFormatError(f"line {self.line}: {e}")
+            yield self._entry(record)
+
+    def _read_csv(self):
+        reader = csv.DictReader(self._stream.text)
+        for record in reader:
+            self.line = reader.line_num
+            yield self._entry({name: value if value != '' else None for name, value in record.items()})
+
+    def _read_parquet(self):
+        names = self._parquet.schema_arrow.names
+        for batch in self._parquet.iter_batches(batch_size=TRANSFER_CHUNK_ROWS):
+            columns = {}
+            for name in names:
+                column = batch.column(names.index(name))
+                if pyarrow.types.is_timestamp(column.type):
+                    column = column.cast(pyarrow.int64())
+                columns[name] = column.to_pylist()
+            if 'modified_at' in columns:
+                columns['mtime_ns'] = columns.pop('modified_at')
+            for values in zip(*columns.values()):
+                self.line += 1
+                yield self._entry(dict(zip(columns, values)))
+
+    def _entry(self, record):
+        """Turn one exported record into a CatalogEntry"""
+        try:
+            path = record['path'].replace(_SEPARATOR, os.sep).strip(os.sep)
+            is_directory = _parse_bool(record.get('is_directory'))
+            mtime_ns = record.get('mtime_ns')
+            if mtime_ns is not None:
+                mtime_ns = int(mtime_ns)
+            elif record.get('modified_at'):
+                mtime_ns = datetime_to_mtime_ns(datetime.fromisoformat(record['modified_at']))
+            return CatalogEntry(
+                path, os.path.basename(path), is_directory, 0 if is_directory else int(record.get('size') or 0),
+                mtime_ns, _parse_digest(record.get('md5_hash')), _parse_int(record.get('inode')), None,
+                _parse_digest(record.get('sample_hash'))
+            )
+        except (KeyError, AttributeError, TypeError, ValueError) as e:
+            raise CatalogFormatError(f"entry {self.line}: invalid record ({e})")
+
+
+def _parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def _parse_int(value):
+    return None if value is None else int(value)
+
+
+def _parse_digest(value):
+    if value is None or isinstance(value, bytes):
+        return value
+    return bytes.fromhex(value)
+
+
+class _TextStream:
+    """A text stream over a file or standard input or output, through gzip or zstd when compressed
+
+    Closing it ends the compressed stream but leaves standard input and
+    output open.
+    """
+
+    def __init__(self, raw, owned, compressed, text, size=0):
+        self.raw = raw
+        self.owned = owned
+        self.compressed = compressed
+        self.text = text
+        self.size = size
+
+    @classmethod
+    def open_write(cls, path, compression):
+        owned = bool(path) and path != '-'
+        raw = open(path, 'wb') if owned else sys.stdout.buffer
+        if compression == 'gz':
+            compressed = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=GZIP_LEVEL)
+        elif compression == 'zst':
+            compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1).stream_writer(raw, closefd=False)
+        else:
+            compressed = raw
+        return cls(raw, owned, compressed, io.TextIOWrapper(compressed, encoding='utf-8', newline=''))
+
+    @classmethod
+    def open_read(cls, path, compression):
+        owned = bool(path) and path != '-'
+        raw = open(path, 'rb') if owned else sys.stdin.buffer
+        if compression == 'gz':
+            compressed = gzip.GzipFile(fileobj=raw, mode='rb')
+        elif compression == 'zst':
+            compressed = zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+        else:
+            compressed = raw
+        size = os.fstat(raw.fileno()).st_size if owned else 0
+        # The zstd reader can't read ahead on its own, so the text layer buffers it
+        buffered = io.BufferedReader(compressed) if compression == 'zst' else compressed
+        return cls(raw, owned, compressed, io.TextIOWrapper(buffered, encoding='utf-8', newline=''), size)
+
+    def position(self):
+        return self.raw.tell() if self.owned else 0
+
+    def close(self):
+        if self.text is None:
+            return
+        try:
+            if self.text.writable():
+                self.text.flush()
+            self.text.detach()
+            if self.compressed is not self.raw:
+                self.compressed.close()
+            elif not self.owned and self.raw.writable():
+                self.raw.flush()
+        finally:
+            self.text = None
+            if self.owned:
+                self.raw.close()
@@ -0,0 +1,56 @@
+# Squarified treemap layout (Bruls, Huizing and van Wijk). Items are placed
+# in rows along the shorter side of the space left, and a row only grows
+# while that keeps its rectangles closer to squares.
+
+
+def squarify(sizes, x, y, width, height):
+    """Lay out sizes, largest first, as (x, y, width, height) rectangles filling the given area
+
+    Returns one rectangle per size in the same order; sizes of 0 or less get
+    an empty rectangle.
+    """
+    rects = [(x, y, 0, 0)] * len(sizes)
+    order = [i for i in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True) if sizes[i] > 0]
+    total = sum(sizes[i] for i in order)
+    if not order or width <= 0 or height <= 0:
+        return rects
+
+    scale = width * height / total
+    position = 0
+    while position < len(order):
+        short_side = min(width, height)
+        row = [order[position]]
+        row_areas = [sizes[order[position]] * scale]
+        position += 1
+        while position < len(order):
+            area = sizes[order[position]] * scale
+            if _worst_ratio(row_areas + [area], short_side) > _worst_ratio(row_areas, short_side):
+                break
+            row.append(order[position])
+            row_areas.append(area)
+            position += 1
+
+        # Place the row as a strip along the short side
+        thickness = sum(row_areas) / short_side
+        offset = 0
+        for i, area in zip(row, row_areas):
+            length = area / thickness
+            if width >= height:
+                rects[i] = (x, y + offset, thickness, length)
+            else:
+                rects[i] = (x + offset, y, length, thickness)
+            offset += length
+        if width >= height:
+            x += thickness
+            width -= thickness
+        else:
+            y += thickness
+            height -= thickness
+    return rects
+
+
+def _worst_ratio(areas, short_side):
+    """Highest aspect ratio among rectangles of the given areas stacked along short_side"""
+    total = sum(areas)
+    side_squared = short_side * short_side
+    return max(max(areas) * side_squared / (total * total), total * total / (side_squared * min(areas)))
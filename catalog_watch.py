@@ -0,0 +1,244 @@
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import time
+from collections import namedtuple
+
+# Linux inotify event bits, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+
+# Everything that changes a directory listing or a file's size or mtime
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+_EVENT = struct.Struct('iIII')
+
+# Changes are applied once no event came for WATCH_DEBOUNCE seconds, and at
+# the latest WATCH_MAX_DELAY seconds after the first one, so a file written
+# continuously still shows up
+WATCH_DEBOUNCE = 1.0
+WATCH_MAX_DELAY = 10.0
+# Subtrees that could not be watched, e.g. beyond fs.inotify.max_user_watches, are rescanned this often
+UNWATCHED_RESCAN_INTERVAL = 300.0
+
+log = logging.getLogger('catalog.watch')
+
+# Coalesced changes to apply with CatalogRefresh: directories whose own
+# entries changed, and subtrees to rescan in full
+WatchChanges = namedtuple('WatchChanges', ['dirs', 'subtrees'])
+
+_libc = None
+
+
+def _inotify_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return _libc
+
+
+def watch_supported():
+    """Check whether folders can be watched here (Linux with inotify)"""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        return hasattr(_inotify_libc(), 'inotify_init1')
+    except OSError:
+        return False
+
+
+class Inotify:
+    """Minimal ctypes binding of the Linux inotify API"""
+
+    def __init__(self):
+        libc = _inotify_libc()
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1: {os.strerror(error)}")
+        self._libc = libc
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """Watch a directory and return the watch descriptor; raises OSError, ENOSPC at the watch limit"""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def remove_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Return the (wd, mask, name) events that arrive within timeout seconds"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class CatalogWatcher:
+    """Follow changes below a cataloged folder and hand them out in coalesced batches
+
+    Every directory gets an inotify watch. Events only mark the directory
+    they happened in as changed; poll() returns the marked directories
+    once events have settled, for CatalogRefresh to list again. New
+    directories are watched as they appear. Directories that can't be
+    watched, when the kernel's watch limit is reached, are rescanned every
+    UNWATCHED_RESCAN_INTERVAL instead, and a queue overflow, where events
+    were lost, rescans the whole tree.
+    """
+
+    def __init__(self, root_path, debounce=WATCH_DEBOUNCE, max_delay=WATCH_MAX_DELAY,
+                 rescan_interval=UNWATCHED_RESCAN_INTERVAL):
+        self.root_path = root_path
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.rescan_interval = rescan_interval
+        self.inotify = None
+        self.paths = {}
+        self.unwatched = set()
+        self.dirs = set()
+        self.subtrees = set()
+        self.first_event = None
+        self.last_event = None
+        self.last_rescan = time.monotonic()
+        self.events_seen = 0
+
+    def start(self):
+        """Watch the whole tree; raises OSError when inotify is not available"""
+        self.inotify = Inotify()
+        self.watch_tree('')
+        if self.unwatched:
+            log.warning("%d directories below %s could not be watched and are rescanned every %.0f s",
+                        len(self.unwatched), self.root_path, self.rescan_interval)
+
+    def watch_tree(self, rel_dir, watched=()):
+        """Add watches for a directory and everything below it, skipping the paths in watched"""
+        pending = [rel_dir]
+        while pending:
+            rel_dir = pending.pop()
+            full_path = os.path.join(self.root_path, rel_dir) if rel_dir else self.root_path
+            if rel_dir in watched:
+                # Still walked, directories below it may be new
+                pending.extend(self.subdirectories(rel_dir, full_path))
+                continue
+            try:
+                wd = self.inotify.add_watch(full_path)
+            except OSError as e:
+                if e.errno in (errno.ENOSPC, errno.ENOMEM):
+                    # At the watch limit; the subtree is rescanned from time to time instead
+                    self.unwatched.add(rel_dir)
+                    continue
+                # Gone or unreadable; its parent's listing takes care of it
+                continue
+            self.paths[wd] = rel_dir
+            pending.extend(self.subdirectories(rel_dir, full_path))
+
+    def subdirectories(self, rel_dir, full_path):
+        """Return the relative paths of the directories in a directory"""
+        try:
+            with os.scandir(full_path) as entries:
+                return [os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                        for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return []
+
+    def forget_tree(self, rel_dir):
+        """Drop the watches of a directory moved away and of everything below it"""
+        prefix = rel_dir + os.sep
+        for wd, path in list(self.paths.items()):
+            if path == rel_dir or path.startswith(prefix):
+                del self.paths[wd]
+                self.inotify.remove_watch(wd)
+
+    def poll(self, timeout=0.5):
+        """Wait up to timeout seconds for events; returns WatchChanges once they settled, else None"""
+        for wd, mask, name in self.inotify.read(timeout):
+            self.handle(wd, mask, name)
+
+        now = time.monotonic()
+        if self.unwatched and now - self.last_rescan >= self.rescan_interval:
+            self.subtrees |= self.unwatched
+            self.last_rescan = now
+            self.first_event = self.first_event or now
+            self.last_event = self.last_event or now
+        if self.first_event is None:
+            return None
+        if now - self.last_event < self.debounce and now - self.first_event < self.max_delay:
+            return None
+        changes = WatchChanges(self.dirs, self.subtrees)
+        self.dirs, self.subtrees = set(), set()
+        self.first_event = self.last_event = None
+        return changes
+
+    def handle(self, wd, mask, name):
+        """Record one inotify event"""
+        now = time.monotonic()
+        self.events_seen += 1
+        self.first_event = self.first_event or now
+        self.last_event = now
+        if mask & IN_Q_OVERFLOW:
+            log.warning("inotify queue overflowed, rescanning %s", self.root_path)
+            self.subtrees.add('')
+            # Directories created meanwhile may have lost their events, so they get watches now
+            self.watch_tree('', set(self.paths.values()))
+            return
+        rel_dir = self.paths.get(wd)
+        if rel_dir is None:
+            # A watch removed meanwhile
+            return
+        if mask & IN_IGNORED:
+            del self.paths[wd]
+            return
+        if mask & IN_DELETE_SELF:
+            # The parent's event updates the catalog
+            return
+        self.dirs.add(rel_dir)
+        if mask & IN_ISDIR:
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            if mask & IN_MOVED_FROM:
+                self.forget_tree(rel_path)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                self.watch_tree(rel_path)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
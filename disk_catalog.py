@@ -1,17 +1,67 @@
 import sys
 import os
 import sqlite3
-import hashlib
+import logging
 import asyncio
+import zlib
 from datetime import datetime
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # Subcommands run headless through the CLI, without importing PyQt5
+    from catalog_cli import main
+    sys.exit(main())
+
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QFileDialog, QTreeView, QVBoxLayout, QWidget,
     QMessageBox, QListWidget, QHBoxLayout, QTreeWidget, QTreeWidgetItem,
     QLabel, QStatusBar, QStyleFactory, QMenu, QInputDialog, QMenuBar,
-    QProgressDialog, QCheckBox, QDialog, QDialogButtonBox, QFormLayout, QListWidgetItem
+    QProgressDialog, QCheckBox, QDialog, QDialogButtonBox, QFormLayout, QListWidgetItem,
+    QComboBox, QLineEdit, QPushButton, QSpinBox, QDateEdit
+)
+from PyQt5.QtCore import Qt, QSize, QThread, pyqtSignal, QAbstractItemModel, QModelIndex, QDate, QRectF
+from PyQt5.QtGui import QIcon, QPalette, QColor, QFont, QPainter
+from catalog_scan import DEFAULT_SCAN_WORKERS
+from catalog_hash import DEFAULT_HASH_WORKERS, available_algorithms
+from catalog_db import (
+    rename_catalog, delete_catalog, has_deleted_catalogs, compare_results, list_catalogs, catalog_hash_algorithm,
+    checkable_hash_algorithm, shared_hash_algorithm, duplicate_sets, duplicate_summary, search_files, directory_usage,
+    format_mtime, SEARCH_LIMIT
+)
+from catalog_treemap import squarify
+from catalog_profile import Profile, PROFILE_ENV, timed
+from catalog_store import CatalogStore
+from catalog_core import (
+    CatalogScan, CatalogUpdate, CatalogRefresh, CatalogExport, CatalogImport, CatalogCompare, CatalogDiff,
+    DuplicateSearch, CatalogPurge, OperationCancelled, format_progress
 )
-from PyQt5.QtCore import Qt, QSize, QThread, pyqtSignal
-from PyQt5.QtGui import QIcon, QPalette, QColor, QFont
+from catalog_watch import CatalogWatcher, watch_supported
+from catalog_transfer import CatalogReader, CatalogFormatError, available_formats, available_compressions
+
+# Fingerprint algorithms offered when cataloging, in menu order
+ALGORITHM_LABELS = {
+    None: "No fingerprints",
+    'md5': "MD5",
+    'blake2b': "BLAKE2b (faster)",
+    'blake3': "BLAKE3 (fastest)",
+    'xxh3': "xxHash XXH3 (fastest, non-cryptographic)",
+    'sample': "Sample only (size + first/middle/last 64 KiB)",
+}
+
+# Content checks offered when comparing
+CONTENT_LABELS = {
+    None: "Don't compare contents",
+    'sample': "Sample fingerprint",
+    'full': "Full hash",
+    'tiered': "Sample first, full hash only when the sample matches",
+}
+
+def format_size(size):
+    """Format file size in human readable format"""
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size < 1024.0:
+            return f"{size:.1f} {unit}"
+        size /= 1024.0
+    return f"{size:.1f} PB"
 
 class CompareOptionsDialog(QDialog):
     def __init__(self, parent=None):
@@ -26,8 +76,10 @@ class CompareOptionsDialog(QDialog):
         self.check_size.setChecked(True)
         layout.addRow(self.check_size)
         
-        self.check_md5 = QCheckBox("Compare MD5 hashes")
-        layout.addRow(self.check_md5)
+        self.content = QComboBox()
+        for content, label in CONTENT_LABELS.items():
+            self.content.addItem(label, content)
+        layout.addRow("Compare contents:", self.content)
         
         buttons = QDialogButtonBox(
             QDialogButtonBox.Ok | QDialogButtonBox.Cancel,
@@ -39,18 +91,185 @@ class CompareOptionsDialog(QDialog):
     def get_options(self):
         return {
             'check_size': self.check_size.isChecked(),
-            'check_md5': self.check_md5.isChecked()
+            'content': self.content.currentData()
         }
 
+class CatalogNode:
+    """A directory or file row that has been fetched into a CatalogTreeModel"""
+    __slots__ = ('parent', 'row', 'dir_id', 'name', 'size', 'file_count', 'modified_at', 'newest_modified_at',
+                 'children', 'fetch_phase', 'last_key')
+
+    def __init__(self, parent, row, dir_id, name, size=0, file_count=None, modified_at=None,
+                 newest_modified_at=None):
+        self.parent = parent
+        self.row = row
+        self.dir_id = dir_id  # None for files
+        self.name = name
+        self.size = size  # Recursive total for directories
+        self.file_count = file_count
+        self.modified_at = modified_at
+        self.newest_modified_at = newest_modified_at
+        self.children = []
+        # Directories fetch their subdirectories, then their files, in sort order
+        self.fetch_phase = 'directories' if dir_id is not None else 'done'
+        self.last_key = None
+
+    @property
+    def is_directory(self):
+        return self.dir_id is not None
+
+class CatalogTreeModel(QAbstractItemModel):
+    """Tree model that loads catalog rows from SQLite only when a directory is expanded
+
+    Directories show the recursive totals stored with them. Sorting changes
+    the ORDER BY of the batches fetched from then on; each batch continues
+    after the (sort value, name) of the previous one, so no directory is
+    ever read in full. Subdirectories are always listed before files.
+    """
+
+    FETCH_BATCH = 1000
+    HEADERS = ["Name", "Size", "Files", "Modified", "Newest File"]
+    # Sort expressions per column; NULLs are coalesced so keyset comparisons stay defined
+    DIRECTORY_SORT = ['name', 'total_size', 'total_files', 'COALESCE(modified_at, 0)',
+                      'COALESCE(newest_modified_at, 0)']
+    FILE_SORT = ['name', 'COALESCE(size, 0)', 'name', 'COALESCE(modified_at, 0)', 'COALESCE(modified_at, 0)']
+
+    def __init__(self, store, catalog_id, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.conn = store.acquire()
+        cursor = self.conn.execute(
+            'SELECT id, name FROM directories WHERE catalog_id = ? AND parent_id IS NULL',
+            (catalog_id,)
+        )
+        root_id, root_name = cursor.fetchone()
+        self.catalog_id = catalog_id
+        self.root = CatalogNode(None, 0, root_id, root_name)
+        self.sort_column = 0
+        self.sort_order = Qt.AscendingOrder
+
+    def close(self):
+        self.store.release(self.conn)
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node(parent)
+        if 0 <= row < len(node.children) and 0 <= column < len(self.HEADERS):
+            return self.createIndex(row, column, node.children[row])
+        return QModelIndex()
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self.node(parent).children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node(parent)
+        return bool(node.children) or node.fetch_phase != 'done'
+
+    def canFetchMore(self, parent):
+        return self.node(parent).fetch_phase != 'done'
+
+    def fetchMore(self, parent):
+        """Append the next batch of children of a directory"""
+        node = self.node(parent)
+        descending = self.sort_order == Qt.DescendingOrder
+        direction = 'DESC' if descending else 'ASC'
+        rows = []
+        while not rows and node.fetch_phase != 'done':
+            if node.fetch_phase == 'directories':
+                key = self.DIRECTORY_SORT[self.sort_column]
+                sql = f'''
+                    SELECT id, name, total_size, total_files, modified_at, newest_modified_at, {key} FROM directories
+                    WHERE parent_id = ? {{after}}
+                    ORDER BY {key} {direction}, name {direction} LIMIT ?
+                '''
+            else:
+                key = self.FILE_SORT[self.sort_column]
+                sql = f'''
+                    SELECT NULL, name, size, NULL, modified_at, NULL, {key} FROM files
+                    WHERE dir_id = ? {{after}}
+                    ORDER BY {key} {direction}, name {direction} LIMIT ?
+                '''
+            if node.last_key is None:
+                cursor = self.conn.execute(sql.format(after=''), (node.dir_id, self.FETCH_BATCH))
+            else:
+                after = f"AND ({key}, name) {'<' if descending else '>'} (?, ?)"
+                cursor = self.conn.execute(sql.format(after=after), (node.dir_id, *node.last_key, self.FETCH_BATCH))
+            rows = cursor.fetchall()
+            if rows:
+                node.last_key = (rows[-1][6], rows[-1][1])
+            if len(rows) < self.FETCH_BATCH:
+                node.fetch_phase = 'files' if node.fetch_phase == 'directories' else 'done'
+                node.last_key = None
+
+        if rows:
+            first = len(node.children)
+            self.beginInsertRows(parent, first, first + len(rows) - 1)
+            for offset, row in enumerate(rows):
+                node.children.append(CatalogNode(node, first + offset, *row[:2], row[2] or 0, *row[3:6]))
+            self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Reload the tree in a new order; rows are fetched again as directories are expanded"""
+        if (column, order) == (self.sort_column, self.sort_order) and self.root.children:
+            return
+        self.beginResetModel()
+        self.sort_column = column
+        self.sort_order = order
+        self.root.children = []
+        self.root.fetch_phase = 'directories'
+        self.root.last_key = None
+        self.endResetModel()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.TextAlignmentRole and index.column() in (1, 2):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role != Qt.DisplayRole:
+            return None
+        node = index.internalPointer()
+        column = index.column()
+        # Size and date strings are only formatted for rows the view paints
+        if column == 0:
+            return node.name
+        if column == 1:
+            return format_size(node.size)
+        if column == 2 and node.is_directory:
+            return f"{node.file_count:,}"
+        if column == 3 and node.modified_at:
+            return format_mtime(node.modified_at, 'seconds')
+        if column == 4 and node.newest_modified_at:
+            return format_mtime(node.newest_modified_at, 'seconds')
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
 class ComparisonResultsWindow(QMainWindow):
-    def __init__(self, catalog_name, compare_path, differences, parent=None):
+    def __init__(self, catalog_name, compare_path, parent=None, compare_title=None):
         super().__init__(parent)
         self.setWindowTitle(f"Comparison Results: {catalog_name}")
         self.resize(1200, 800)
         
         # Define colors for different states
         self.colors = {
-            'same': QColor('#4caf50'),      # Green
             'modified': QColor('#ff9800'),   # Orange
             'missing': QColor('#f44336'),    # Red
             'new': QColor('#2196f3'),        # Blue
@@ -109,7 +328,7 @@ class ComparisonResultsWindow(QMainWindow):
         # Right panel (Comparison)
         right_panel = QWidget()
         right_layout = QVBoxLayout(right_panel)
-        compare_label = QLabel(f"Comparison Folder: {os.path.basename(compare_path)}")
+        compare_label = QLabel(compare_title or f"Comparison Folder: {os.path.basename(compare_path)}")
         compare_label.setStyleSheet("""
             QLabel {
                 background-color: #2d2d2d;
@@ -130,10 +349,12 @@ class ComparisonResultsWindow(QMainWindow):
         layout.addWidget(left_panel)
         layout.addWidget(right_panel)
         
-        # Store differences for highlighting
-        self.differences = differences
         self.compare_path = compare_path
         
+        # Path -> item indexes so lookups don't have to search the trees
+        self.catalog_path_to_item = {}
+        self.compare_path_to_item = {}
+        
         # Connect tree selection
         self.catalog_tree.itemSelectionChanged.connect(self.on_catalog_selection_changed)
         self.compare_tree.itemSelectionChanged.connect(self.on_compare_selection_changed)
@@ -153,172 +374,81 @@ class ComparisonResultsWindow(QMainWindow):
             }
         """)
     
-    def add_items_to_trees(self, catalog_items, compare_items):
-        """Add items to both trees and highlight differences"""
-        # Create a dictionary to store path -> item mapping for catalog tree
-        catalog_path_to_item = {}
-        
-        # Create a set of paths that have differences in their contents
-        content_differences = set()
-        for path in self.differences:
-            parent_path = os.path.dirname(path)
-            while parent_path:
-                content_differences.add(parent_path)
-                parent_path = os.path.dirname(parent_path)
-        
-        # First, create all catalog items with proper hierarchy
-        for path, item_data in catalog_items.items():
-            item = QTreeWidgetItem()
-            item.setText(0, item_data['name'])
-            if not item_data['is_directory']:
-                item.setText(1, self.format_size(item_data['size']))
-            item.setText(2, item_data['modified'].strftime('%Y-%m-%d %H:%M:%S'))
-            item.setData(0, Qt.UserRole, path)
+    def add_items_to_trees(self, results):
+        """Add the differing items to both trees, under their parent folders"""
+        status_text = {'new': "New", 'missing': "Missing", 'modified': "Modified"}
+        
+        for result in results:
+            name = os.path.basename(result.path)
             
-            # Color the item in catalog tree if it has differences
-            if path in self.differences:
-                if item_data['is_directory']:
+            # The catalog side only has entries that were in the catalog
+            if result.status != 'new':
+                item = self.create_item(name, result.path, result.is_directory,
+                                        result.catalog_size, result.catalog_modified_at)
+                if result.status == 'missing':
+                    color = self.colors['missing']
+                elif result.is_directory:
                     color = self.colors['different']
                 else:
                     color = self.colors['modified']
                 for i in range(3):
                     item.setBackground(i, color)
-            elif path in content_differences:
-                # This is a parent folder of a different item
-                color = self.colors['different']
-                for i in range(3):
-                    item.setBackground(i, color)
-            
-            # Store the item in the mapping
-            catalog_path_to_item[path] = item
-            
-            # Find parent path
-            parent_path = os.path.dirname(path)
-            if parent_path in catalog_path_to_item:
-                # Add as child to parent
-                catalog_path_to_item[parent_path].addChild(item)
-            else:
-                # Add as top-level item
-                self.catalog_tree.addTopLevelItem(item)
-        
-        # Now create comparison items following the same structure
-        for path, item_data in catalog_items.items():
-            # Create corresponding item in compare tree
-            compare_item = QTreeWidgetItem()
-            compare_item.setData(0, Qt.UserRole, path)
-            
-            if path in compare_items:
-                # File exists in comparison folder
-                compare_data = compare_items[path]
-                compare_item.setText(0, compare_data['name'])
-                if not compare_data['is_directory']:
-                    compare_item.setText(1, self.format_size(compare_data['size']))
-                compare_item.setText(2, compare_data['modified'].strftime('%Y-%m-%d %H:%M:%S'))
-                
-                # Check for differences
-                if path in self.differences:
-                    if item_data['is_directory']:
-                        compare_item.setText(3, "Different Contents")
-                        color = self.colors['different']
-                    else:
-                        compare_item.setText(3, "Modified")
-                        color = self.colors['modified']
-                    
-                    # Apply color to all columns
-                    for i in range(4):
-                        compare_item.setBackground(i, color)
-                elif path in content_differences:
-                    # This is a parent folder of a different item
-                    compare_item.setText(3, "Different Contents")
-                    color = self.colors['different']
-                    for i in range(4):
-                        compare_item.setBackground(i, color)
-                else:
-                    compare_item.setText(3, "Same")
-                    color = self.colors['same']
-                    compare_item.setBackground(3, color)
-            else:
-                # File doesn't exist in comparison folder
-                compare_item.setText(0, item_data['name'])
-                if not item_data['is_directory']:
-                    compare_item.setText(1, self.format_size(item_data['size']))
-                compare_item.setText(2, item_data['modified'].strftime('%Y-%m-%d %H:%M:%S'))
-                compare_item.setText(3, "Missing")
-                color = self.colors['missing']
-                
-                # Apply color to all columns
-                for i in range(4):
-                    compare_item.setBackground(i, color)
+                self.add_item(self.catalog_tree, self.catalog_path_to_item, result.path, item)
             
-            # Find parent path
-            parent_path = os.path.dirname(path)
-            if parent_path in catalog_path_to_item:
-                # Add as child to parent's corresponding item in compare tree
-                parent_compare_item = self.find_item_by_path(self.compare_tree, parent_path)
-                if parent_compare_item:
-                    parent_compare_item.addChild(compare_item)
-                else:
-                    self.compare_tree.addTopLevelItem(compare_item)
+            # Missing entries are shown with their catalog details
+            if result.status == 'missing':
+                compare_item = self.create_item(name, result.path, result.is_directory,
+                                                result.catalog_size, result.catalog_modified_at)
             else:
-                # Add as top-level item
-                self.compare_tree.addTopLevelItem(compare_item)
-        
-        # Add new files from comparison folder
-        for path, item_data in compare_items.items():
-            if path not in catalog_items:
-                compare_item = QTreeWidgetItem()
-                compare_item.setText(0, item_data['name'])
-                if not item_data['is_directory']:
-                    compare_item.setText(1, self.format_size(item_data['size']))
-                compare_item.setText(2, item_data['modified'].strftime('%Y-%m-%d %H:%M:%S'))
-                compare_item.setText(3, "New")
-                color = self.colors['new']
-                
-                # Apply color to all columns
-                for i in range(4):
-                    compare_item.setBackground(i, color)
-                
-                compare_item.setData(0, Qt.UserRole, path)
-                
-                # Find parent path
-                parent_path = os.path.dirname(path)
-                parent_compare_item = self.find_item_by_path(self.compare_tree, parent_path)
-                if parent_compare_item:
-                    parent_compare_item.addChild(compare_item)
-                else:
-                    self.compare_tree.addTopLevelItem(compare_item)
+                compare_item = self.create_item(name, result.path, result.is_directory,
+                                                result.compare_size, result.compare_modified_at)
+            compare_item.setText(3, status_text[result.status])
+            for i in range(4):
+                compare_item.setBackground(i, self.colors[result.status])
+            self.add_item(self.compare_tree, self.compare_path_to_item, result.path, compare_item)
     
-    def find_item_by_path(self, tree, path):
-        """Find an item in the tree by its path"""
-        for i in range(tree.topLevelItemCount()):
-            item = tree.topLevelItem(i)
-            if item.data(0, Qt.UserRole) == path:
-                return item
-            # Check children
-            child = self.find_item_in_children(item, path)
-            if child:
-                return child
-        return None
+    def create_item(self, name, path, is_directory, size, modified_at):
+        """Create a tree item for one compared entry"""
+        item = QTreeWidgetItem()
+        item.setText(0, name)
+        if not is_directory and size is not None:
+            item.setText(1, format_size(size))
+        if modified_at:
+            item.setText(2, format_mtime(modified_at, 'seconds'))
+        item.setData(0, Qt.UserRole, path)
+        return item
     
-    def find_item_in_children(self, parent_item, path):
-        """Find an item in the children of a parent item"""
-        for i in range(parent_item.childCount()):
-            child = parent_item.child(i)
-            if child.data(0, Qt.UserRole) == path:
-                return child
-            # Check grandchildren
-            grandchild = self.find_item_in_children(child, path)
-            if grandchild:
-                return grandchild
-        return None
+    def add_item(self, tree, path_to_item, path, item):
+        """Add an item under its parent folder's item, creating the parent if needed"""
+        parent_item = self.parent_item(tree, path_to_item, os.path.dirname(path))
+        if parent_item:
+            parent_item.addChild(item)
+        else:
+            tree.addTopLevelItem(item)
+        path_to_item[path] = item
+    
+    def parent_item(self, tree, path_to_item, path):
+        """Return the item for a folder that contains differences"""
+        if not path:
+            return None
+        item = path_to_item.get(path)
+        if item is None:
+            # A folder that is the same itself but has different contents
+            item = QTreeWidgetItem()
+            item.setText(0, os.path.basename(path))
+            item.setData(0, Qt.UserRole, path)
+            if tree is self.compare_tree:
+                item.setText(3, "Different Contents")
+            for i in range(tree.columnCount()):
+                item.setBackground(i, self.colors['different'])
+            self.add_item(tree, path_to_item, path, item)
+        return item
     
-    def format_size(self, size):
-        """Format file size in human readable format"""
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if size < 1024.0:
-                return f"{size:.1f} {unit}"
-            size /= 1024.0
-        return f"{size:.1f} PB"
+    def find_item_by_path(self, tree, path):
+        """Find an item in the tree by its path"""
+        if tree is self.catalog_tree:
+            return self.catalog_path_to_item.get(path)
+        return self.compare_path_to_item.get(path)
     
     def on_catalog_selection_changed(self):
         """Handle catalog tree selection change"""
@@ -342,228 +472,452 @@ class ComparisonResultsWindow(QMainWindow):
         if item:
             tree.setCurrentItem(item)
 
-class CompareWorker(QThread):
-    progress = pyqtSignal(int, str)
-    finished = pyqtSignal(dict, dict, set)
+class DuplicatesWindow(QMainWindow):
+    """Show the duplicate sets found across all catalogs"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Duplicate Files")
+        self.resize(1000, 700)
+        
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        layout = QVBoxLayout(central_widget)
+        
+        self.summary_label = QLabel()
+        self.summary_label.setStyleSheet("""
+            QLabel {
+                background-color: #2d2d2d;
+                color: #ffffff;
+                padding: 8px;
+                font-weight: bold;
+            }
+        """)
+        layout.addWidget(self.summary_label)
+        
+        # One top-level item per set, with its copies as children
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(["Name", "Size", "Catalog"])
+        self.tree.setColumnWidth(0, 550)
+        self.tree.setUniformRowHeights(True)
+        self.tree.setStyleSheet("""
+            QTreeWidget {
+                background-color: #1e1e1e;
+                color: #ffffff;
+                border: none;
+            }
+            QTreeWidget::item {
+                padding: 4px;
+            }
+            QTreeWidget::item:selected {
+                background-color: #0d47a1;
+                color: #ffffff;
+            }
+            QHeaderView::section {
+                background-color: #2d2d2d;
+                color: #ffffff;
+                padding: 8px;
+                border: none;
+                border-right: 1px solid #3d3d3d;
+            }
+        """)
+        layout.addWidget(self.tree)
+        
+        self.setStyleSheet("""
+            QMainWindow {
+                background-color: #1e1e1e;
+            }
+            QWidget {
+                background-color: #1e1e1e;
+                color: #ffffff;
+            }
+        """)
+    
+    def add_sets(self, sets, summary):
+        """Fill the tree from duplicate sets and show the totals"""
+        set_count, copies, reclaimable = summary
+        self.summary_label.setText(
+            f"{set_count} duplicate sets, {copies} files, {format_size(reclaimable)} reclaimable")
+        for duplicate in sets:
+            set_item = QTreeWidgetItem()
+            set_item.setText(0, f"{len(duplicate.files)} copies of {os.path.basename(duplicate.files[0][2])}")
+            set_item.setText(1, format_size(duplicate.size))
+            set_item.setText(2, f"{format_size(duplicate.reclaimable)} reclaimable")
+            for catalog_name, root_path, path in duplicate.files:
+                item = QTreeWidgetItem(set_item)
+                item.setText(0, os.path.join(root_path, path))
+                item.setText(1, format_size(duplicate.size))
+                item.setText(2, catalog_name)
+            self.tree.addTopLevelItem(set_item)
+
+class TreemapWidget(QWidget):
+    """Paint the entries of one directory as a squarified treemap"""
+
+    directory_clicked = pyqtSignal(int)
+    up_requested = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.items = []
+        self.rects = []
+        self.setMouseTracking(True)
+        self.setMinimumSize(400, 300)
+
+    def set_items(self, items):
+        """Show a list of UsageItems, largest first"""
+        self.items = items
+        self.layout_items()
+        self.update()
+
+    def layout_items(self):
+        rects = squarify([item.size for item in self.items], 0, 0, self.width(), self.height())
+        self.rects = [QRectF(*rect) for rect in rects]
+
+    def resizeEvent(self, event):
+        self.layout_items()
+        super().resizeEvent(event)
+
+    def item_at(self, position):
+        for item, rect in zip(self.items, self.rects):
+            if rect.contains(position):
+                return item
+        return None
+
+    def item_color(self, item):
+        """Directories are blue, the remainder gray and files colored by extension"""
+        if item.dir_id is not None:
+            return QColor("#1565c0")
+        if item.is_rest:
+            return QColor("#424242")
+        extension = os.path.splitext(item.name)[1].lower()
+        return QColor.fromHsv(zlib.crc32(extension.encode()) % 360, 110, 150)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("#1e1e1e"))
+        metrics = painter.fontMetrics()
+        line_height = metrics.height()
+        for item, rect in zip(self.items, self.rects):
+            if rect.width() < 1 or rect.height() < 1:
+                continue
+            painter.fillRect(rect, self.item_color(item))
+            painter.setPen(QColor("#1e1e1e"))
+            painter.drawRect(rect)
+            
+            # Label the blocks that have room for a line or two of text
+            text_rect = rect.adjusted(4, 2, -4, -2)
+            if text_rect.width() < 30 or text_rect.height() < line_height:
+                continue
+            lines = [item.name, format_size(item.size)]
+            lines = lines[:max(1, int(text_rect.height() // line_height))]
+            text = "\n".join(metrics.elidedText(line, Qt.ElideRight, int(text_rect.width())) for line in lines)
+            painter.setPen(QColor("#ffffff"))
+            painter.drawText(text_rect, Qt.AlignLeft | Qt.AlignTop, text)
+        painter.end()
+
+    def mouseMoveEvent(self, event):
+        item = self.item_at(event.pos())
+        if item is None:
+            self.setToolTip("")
+        elif item.dir_id is not None:
+            self.setToolTip(f"{item.name}\n{format_size(item.size)} in {item.file_count:,} files")
+        else:
+            self.setToolTip(f"{item.name}\n{format_size(item.size)}")
+
+    def mousePressEvent(self, event):
+        # Left click opens a directory, right click goes back up
+        if event.button() == Qt.RightButton:
+            self.up_requested.emit()
+            return
+        item = self.item_at(event.pos())
+        if event.button() == Qt.LeftButton and item is not None and item.dir_id is not None:
+            self.directory_clicked.emit(item.dir_id)
+
+class TreemapWindow(QMainWindow):
+    """Show where the space of a catalog went, one directory level at a time
+
+    Each level is read from the stored directory totals when it is opened,
+    so drilling down costs the same however large the catalog is.
+    """
+
+    def __init__(self, store, catalog_id, catalog_name, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Disk Usage - {catalog_name}")
+        self.resize(1000, 700)
+        self.catalog_name = catalog_name
+        self.store = store
+        self.conn = store.acquire()
+        root_id, = self.conn.execute(
+            'SELECT id FROM directories WHERE catalog_id = ? AND parent_id IS NULL', (catalog_id,)
+        ).fetchone()
+        self.parent_id = None
+        
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        layout = QVBoxLayout(central_widget)
+        
+        header = QHBoxLayout()
+        self.up_button = QPushButton("Up")
+        self.up_button.clicked.connect(self.go_up)
+        header.addWidget(self.up_button)
+        self.path_label = QLabel()
+        header.addWidget(self.path_label, 1)
+        layout.addLayout(header)
+        
+        self.treemap = TreemapWidget()
+        self.treemap.directory_clicked.connect(self.show_directory)
+        self.treemap.up_requested.connect(self.go_up)
+        layout.addWidget(self.treemap, 1)
+        
+        self.setStyleSheet("""
+            QMainWindow {
+                background-color: #1e1e1e;
+            }
+            QWidget {
+                background-color: #1e1e1e;
+                color: #ffffff;
+            }
+            QLabel {
+                padding: 8px;
+                font-weight: bold;
+            }
+            QPushButton {
+                background-color: #0d47a1;
+                border: none;
+                padding: 5px 12px;
+            }
+            QPushButton:disabled {
+                background-color: #2d2d2d;
+                color: #808080;
+            }
+        """)
+        self.show_directory(root_id)
+
+    def show_directory(self, dir_id):
+        """Load one directory level from the database and show it"""
+        path, self.parent_id, items = directory_usage(self.conn, dir_id)
+        total = sum(item.size for item in items)
+        self.path_label.setText(
+            f"{os.path.join(self.catalog_name, path) if path else self.catalog_name}"
+            f"  ({format_size(total)})"
+        )
+        self.up_button.setEnabled(self.parent_id is not None)
+        self.treemap.set_items(items)
+
+    def go_up(self):
+        if self.parent_id is not None:
+            self.show_directory(self.parent_id)
+
+    def closeEvent(self, event):
+        self.store.release(self.conn)
+        super().closeEvent(event)
+
+class DuplicateWorker(QThread):
+    progress = pyqtSignal(int, int, str, object)
+    finished = pyqtSignal(int)
     error = pyqtSignal(str)
     
-    def __init__(self, catalog_id, compare_path, options):
+    def __init__(self, store, min_size=1, hash_workers=DEFAULT_HASH_WORKERS):
         super().__init__()
-        self.catalog_id = catalog_id
-        self.compare_path = compare_path
-        self.options = options
-        self.is_cancelled = False
+        self.store = store
+        self.operation = DuplicateSearch(min_size, hash_workers=hash_workers, progress=self.progress.emit,
+                                         profile=Profile.from_environment())
         
     def run(self):
         try:
-            conn = sqlite3.connect('folder_catalog.db')
-            cursor = conn.cursor()
-            
-            # Get all files from catalog
-            cursor.execute('''
-                SELECT path, name, size, md5_hash, modified_at, is_directory
-                FROM files 
-                WHERE catalog_id = ?
-            ''', (self.catalog_id,))
-            catalog_items = {}
-            for row in cursor.fetchall():
-                catalog_items[row[0]] = {
-                    'name': row[1],
-                    'size': row[2],
-                    'md5_hash': row[3],
-                    'modified': datetime.fromisoformat(row[4]),
-                    'is_directory': row[5]
-                }
-            
-            # Get all files from comparison folder
-            compare_items = {}
-            differences = set()  # Use set for faster lookups
-            total_files = sum([len(files) for _, _, files in os.walk(self.compare_path)])
-            files_processed = 0
-            
-            for root, dirs, files in os.walk(self.compare_path):
-                if self.is_cancelled:
-                    return
-                    
-                # Process directories
-                for dir_name in dirs:
-                    full_path = os.path.join(root, dir_name)
-                    rel_path = os.path.relpath(full_path, self.compare_path)
-                    compare_items[rel_path] = {
-                        'name': dir_name,
-                        'size': 0,
-                        'modified': datetime.fromtimestamp(os.path.getmtime(full_path)),
-                        'is_directory': True
-                    }
-                    if rel_path not in catalog_items:
-                        differences.add(rel_path)
-                    self.progress.emit(files_processed, f"Processing directory: {rel_path}")
-                
-                # Process files
-                for file_name in files:
-                    if self.is_cancelled:
-                        return
-                        
-                    full_path = os.path.join(root, file_name)
-                    try:
-                        rel_path = os.path.relpath(full_path, self.compare_path)
-                        size = os.path.getsize(full_path)
-                        modified = datetime.fromtimestamp(os.path.getmtime(full_path))
-                        
-                        compare_items[rel_path] = {
-                            'name': file_name,
-                            'size': size,
-                            'modified': modified,
-                            'is_directory': False
-                        }
-                        
-                        if rel_path not in catalog_items:
-                            differences.add(rel_path)
-                            self.progress.emit(files_processed, f"New file: {rel_path}")
-                        else:
-                            catalog_item = catalog_items[rel_path]
-                            if self.options['check_size'] and size != catalog_item['size']:
-                                differences.add(rel_path)
-                                self.progress.emit(files_processed, f"Size difference: {rel_path}")
-                            if self.options['check_md5'] and catalog_item['md5_hash']:
-                                self.progress.emit(files_processed, f"Calculating MD5: {rel_path}")
-                                current_md5 = self.calculate_md5(full_path)
-                                if current_md5 != catalog_item['md5_hash']:
-                                    differences.add(rel_path)
-                                    self.progress.emit(files_processed, f"MD5 difference: {rel_path}")
-                        
-                        files_processed += 1
-                        self.progress.emit(files_processed, f"Processing: {rel_path}")
-                    except (OSError, FileNotFoundError):
-                        continue
-            
-            # Check for deleted files
-            for rel_path in catalog_items:
-                if rel_path not in compare_items:
-                    differences.add(rel_path)
-                    self.progress.emit(files_processed, f"Missing file: {rel_path}")
-            
-            self.finished.emit(catalog_items, compare_items, differences)
-            
+            sets_found = self.store.write(self.operation.run, profile=self.operation.profile).result()
+            self.finished.emit(sets_found)
+        except OperationCancelled:
+            pass
         except sqlite3.Error as e:
             self.error.emit(str(e))
-        finally:
-            if 'conn' in locals():
-                conn.close()
     
-    def calculate_md5(self, file_path):
-        """Calculate MD5 hash of a file"""
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                if self.is_cancelled:
-                    return None
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+    def cancel(self):
+        self.operation.cancel()
+
+class CompareWorker(QThread):
+    progress = pyqtSignal(int, int, str, object)
+    finished = pyqtSignal(int)
+    error = pyqtSignal(str)
+    
+    def __init__(self, store, catalog_id, compare_path, options, hash_workers=DEFAULT_HASH_WORKERS,
+                 scan_workers=DEFAULT_SCAN_WORKERS):
+        super().__init__()
+        self.store = store
+        self.operation = CatalogCompare(catalog_id, compare_path, options, hash_workers=hash_workers,
+                                        scan_workers=scan_workers, progress=self.progress.emit,
+                                        profile=Profile.from_environment())
+        
+    def run(self):
+        try:
+            run_id = self.store.write(self.operation.run, profile=self.operation.profile).result()
+            self.finished.emit(run_id)
+        except OperationCancelled:
+            pass
+        except sqlite3.Error as e:
+            self.error.emit(str(e))
     
     def cancel(self):
-        self.is_cancelled = True
+        self.operation.cancel()
 
 class CatalogWorker(QThread):
-    progress = pyqtSignal(int, str)
+    progress = pyqtSignal(int, int, str, object)
     finished = pyqtSignal()
     error = pyqtSignal(str)
     
-    def __init__(self, root_path, calculate_md5):
+    def __init__(self, store, root_path, algorithm, hash_workers=DEFAULT_HASH_WORKERS,
+                 scan_workers=DEFAULT_SCAN_WORKERS):
         super().__init__()
-        self.root_path = root_path
-        self.calculate_md5 = calculate_md5
-        self.catalog_name = os.path.basename(root_path)
-        self.conn = None
-        self.cursor = None
-        self.catalog_id = None
-        self.is_cancelled = False
+        self.store = store
+        self.operation = CatalogScan(root_path, algorithm, hash_workers=hash_workers,
+                                     scan_workers=scan_workers, progress=self.progress.emit,
+                                     profile=Profile.from_environment())
+        
+    @property
+    def catalog_name(self):
+        return self.operation.catalog_name
         
     def run(self):
         try:
-            self.conn = sqlite3.connect('folder_catalog.db')
-            self.cursor = self.conn.cursor()
-            
-            # Insert catalog
-            self.cursor.execute(
-                'INSERT INTO catalogs (name, root_path) VALUES (?, ?)',
-                (self.catalog_name, self.root_path)
-            )
-            self.catalog_id = self.cursor.lastrowid
-            
-            # Count total files for progress bar
-            total_files = sum([len(files) for _, _, files in os.walk(self.root_path)])
-            files_processed = 0
-            
-            # Walk through directory and save structure
-            for root, dirs, files in os.walk(self.root_path):
-                if self.is_cancelled:
-                    self.conn.rollback()
-                    return
-                    
-                # Save directories
-                for dir_name in dirs:
-                    full_path = os.path.join(root, dir_name)
-                    rel_path = os.path.relpath(full_path, self.root_path)
-                    self.cursor.execute(
-                        'INSERT INTO files (catalog_id, path, name, is_directory, size, modified_at) VALUES (?, ?, ?, ?, ?, ?)',
-                        (self.catalog_id, rel_path, dir_name, True, 0, datetime.fromtimestamp(os.path.getmtime(full_path)))
-                    )
-                    self.progress.emit(files_processed, f"Processing directory: {rel_path}")
-
-                # Save files
-                for file_name in files:
-                    if self.is_cancelled:
-                        self.conn.rollback()
-                        return
-
-                    full_path = os.path.join(root, file_name)
-                    try:
-                        rel_path = os.path.relpath(full_path, self.root_path)
-                        size = os.path.getsize(full_path)
-                        modified = datetime.fromtimestamp(os.path.getmtime(full_path))
-                        
-                        # Calculate MD5 if requested
-                        md5_hash = None
-                        if self.calculate_md5:
-                            self.progress.emit(files_processed, f"Calculating MD5: {rel_path}")
-                            md5_hash = self.calculate_md5_hash(full_path)
-                        
-                        self.cursor.execute(
-                            'INSERT INTO files (catalog_id, path, name, is_directory, size, modified_at, md5_hash) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                            (self.catalog_id, rel_path, file_name, False, size, modified, md5_hash)
-                        )
-                        
-                        files_processed += 1
-                        self.progress.emit(files_processed, f"Processing: {rel_path}")
-                    except (OSError, FileNotFoundError):
-                        continue
-
-            self.conn.commit()
+            self.store.write(self.operation.run, profile=self.operation.profile).result()
             self.finished.emit()
-            
+        except OperationCancelled:
+            pass
         except sqlite3.Error as e:
             self.error.emit(str(e))
-            if self.conn:
-                self.conn.rollback()
-        finally:
-            if self.conn:
-                self.conn.close()
-    
-    def calculate_md5_hash(self, file_path):
-        """Calculate MD5 hash of a file"""
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                if self.is_cancelled:
-                    return None
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
     
+    def cancel(self):
+        self.operation.cancel()
+
+class UpdateWorker(CatalogWorker):
+    """Update an existing catalog in place, touching only rows that changed"""
+
+    def __init__(self, store, catalog_id, catalog_name, root_path, algorithm, hash_workers=DEFAULT_HASH_WORKERS,
+                 scan_workers=DEFAULT_SCAN_WORKERS):
+        super().__init__(store, root_path, algorithm, hash_workers, scan_workers)
+        self.operation = CatalogUpdate(catalog_id, catalog_name, root_path, algorithm, hash_workers=hash_workers,
+                                       scan_workers=scan_workers, progress=self.progress.emit,
+                                       profile=Profile.from_environment())
+
+class ImportWorker(CatalogWorker):
+    """Load an exported catalog file as a new catalog"""
+
+    def __init__(self, store, source):
+        super().__init__(store, source.header.get('root_path') or '', None)
+        self.source = source
+        self.operation = CatalogImport(source, progress=self.progress.emit, profile=Profile.from_environment())
+
+    def run(self):
+        try:
+            self.store.write(self.operation.run, profile=self.operation.profile).result()
+            self.finished.emit()
+        except OperationCancelled:
+            pass
+        except (sqlite3.Error, CatalogFormatError, OSError) as e:
+            self.error.emit(str(e))
+        finally:
+            self.source.close()
+
+class ExportWorker(QThread):
+    """Write a catalog to a file through a read-only connection, so writers are not held up"""
+    progress = pyqtSignal(int, int, str, object)
+    finished = pyqtSignal(int)
+    error = pyqtSignal(str)
+
+    def __init__(self, store, catalog_id, path):
+        super().__init__()
+        self.store = store
+        self.path = path
+        self.operation = CatalogExport(catalog_id, path, progress=self.progress.emit,
+                                       profile=Profile.from_environment())
+
+    def run(self):
+        try:
+            with self.store.reader(self.operation.profile) as conn:
+                self.finished.emit(self.operation.run(conn))
+        except OperationCancelled:
+            pass
+        except (sqlite3.Error, CatalogFormatError, OSError) as e:
+            self.error.emit(str(e))
+
+    def cancel(self):
+        self.operation.cancel()
+
+class CatalogDiffWorker(CompareWorker):
+    """Compare two stored catalogs with SQL, without reading the filesystem"""
+
+    def __init__(self, store, catalog_id, other_catalog_id, options):
+        super().__init__(store, catalog_id, None, options)
+        self.operation = CatalogDiff(catalog_id, other_catalog_id, options, progress=self.progress.emit,
+                                     profile=Profile.from_environment())
+
+class PurgeWorker(QThread):
+    """Remove the rows of deleted catalogs, queueing one small batch at a time between other writes"""
+    progress = pyqtSignal(int, int, str, object)
+    finished = pyqtSignal(int)
+    error = pyqtSignal(str)
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self.operation = CatalogPurge(progress=self.progress.emit)
+
+    def run(self):
+        try:
+            while self.store.write(self.operation.step).result():
+                pass
+            while self.store.write(self.operation.reclaim).result():
+                pass
+            self.finished.emit(self.operation.rows_removed)
+        except sqlite3.Error as e:
+            self.error.emit(str(e))
+
+    def cancel(self):
+        self.operation.cancel()
+
+class WatchWorker(QThread):
+    """Keep a catalog up to date from file system events until cancelled"""
+    refreshed = pyqtSignal(int, int, int)
+    error = pyqtSignal(str)
+
+    def __init__(self, store, catalog_id, catalog_name, root_path, algorithm):
+        super().__init__()
+        self.store = store
+        self.catalog_id = catalog_id
+        self.catalog_name = catalog_name
+        self.root_path = root_path
+        self.algorithm = algorithm
+        self.watcher = CatalogWatcher(root_path)
+        self.operation = None
+        self.is_cancelled = False
+
+    def run(self):
+        try:
+            self.watcher.start()
+            while not self.is_cancelled:
+                changes = self.watcher.poll()
+                if changes is None or self.is_cancelled:
+                    continue
+                self.operation = CatalogRefresh(self.catalog_id, self.catalog_name, self.root_path, self.algorithm,
+                                                changes.dirs, changes.subtrees, profile=Profile.from_environment())
+                added, changed, removed = self.store.write(self.operation.run, profile=self.operation.profile).result()
+                self.refreshed.emit(added, changed, removed)
+        except OperationCancelled:
+            pass
+        except (sqlite3.Error, OSError) as e:
+            self.error.emit(str(e))
+        finally:
+            self.watcher.close()
+
     def cancel(self):
         self.is_cancelled = True
+        if self.operation:
+            self.operation.cancel()
 
 class FolderCatalogApp(QMainWindow):
+    # Carries a finished store write from the writer thread back to the GUI thread
+    write_finished = pyqtSignal(object, object)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Disk Catalog")
@@ -638,25 +992,28 @@ class FolderCatalogApp(QMainWindow):
         right_panel = QWidget()
         right_layout = QVBoxLayout(right_panel)
         right_layout.setContentsMargins(0, 0, 0, 0)
+        right_layout.addWidget(self.create_search_panel())
         
-        # Tree view
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabels(["Name", "Size", "Modified"])
-        self.tree.setColumnWidth(0, 400)
+        # Tree view, backed by a model that reads the catalog lazily
+        self.tree = QTreeView()
+        self.tree.setUniformRowHeights(True)
+        self.tree.setSortingEnabled(True)
+        self.tree.sortByColumn(0, Qt.AscendingOrder)
+        self.catalog_model = None
         self.tree.setStyleSheet("""
-            QTreeWidget {
+            QTreeView {
                 background-color: #1e1e1e;
                 color: #ffffff;
                 border: none;
             }
-            QTreeWidget::item {
+            QTreeView::item {
                 padding: 4px;
             }
-            QTreeWidget::item:selected {
+            QTreeView::item:selected {
                 background-color: #0d47a1;
                 color: #ffffff;
             }
-            QTreeWidget::item:hover {
+            QTreeView::item:hover {
                 background-color: #1565c0;
                 color: #ffffff;
             }
@@ -671,6 +1028,16 @@ class FolderCatalogApp(QMainWindow):
         
         right_layout.addWidget(self.tree)
         
+        # Search results replace the tree view while a search is shown
+        self.search_results = QTreeWidget()
+        self.search_results.setHeaderLabels(["Name", "Size", "Modified", "Catalog", "Folder"])
+        self.search_results.setColumnWidth(0, 300)
+        self.search_results.setUniformRowHeights(True)
+        self.search_results.setRootIsDecorated(False)
+        self.search_results.setStyleSheet(self.tree.styleSheet().replace("QTreeView", "QTreeWidget"))
+        self.search_results.hide()
+        right_layout.addWidget(self.search_results)
+        
         # Add panels to main layout
         main_layout.addWidget(left_panel)
         main_layout.addWidget(right_panel)
@@ -678,6 +1045,138 @@ class FolderCatalogApp(QMainWindow):
         # Update catalog list
         self.update_catalog_list()
 
+        # Catalogs kept up to date from file system events, by catalog id
+        self.watch_workers = {}
+
+        # Finish removing catalogs deleted before the last exit
+        self.purge_worker = None
+        with self.store.reader() as conn:
+            if has_deleted_catalogs(conn):
+                self.start_purge()
+
+    def create_search_panel(self):
+        """Create the search bar with its size, date and extension filters"""
+        panel = QWidget()
+        panel.setStyleSheet("""
+            QWidget {
+                background-color: #2d2d2d;
+                color: #ffffff;
+            }
+            QLineEdit, QSpinBox, QDateEdit {
+                background-color: #1e1e1e;
+                border: 1px solid #3d3d3d;
+                padding: 4px;
+            }
+            QPushButton {
+                background-color: #0d47a1;
+                border: none;
+                padding: 5px 12px;
+            }
+            QPushButton:hover {
+                background-color: #1565c0;
+            }
+        """)
+        layout = QVBoxLayout(panel)
+        layout.setContentsMargins(8, 8, 8, 8)
+        
+        search_row = QHBoxLayout()
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search file names and folders in all catalogs")
+        self.search_input.returnPressed.connect(self.search_catalogs)
+        search_row.addWidget(self.search_input)
+        search_button = QPushButton("Search")
+        search_button.clicked.connect(self.search_catalogs)
+        search_row.addWidget(search_button)
+        clear_button = QPushButton("Clear")
+        clear_button.clicked.connect(self.clear_search)
+        search_row.addWidget(clear_button)
+        layout.addLayout(search_row)
+        
+        filter_row = QHBoxLayout()
+        self.search_extensions = QLineEdit()
+        self.search_extensions.setPlaceholderText("Extensions, e.g. jpg png")
+        self.search_extensions.returnPressed.connect(self.search_catalogs)
+        filter_row.addWidget(self.search_extensions)
+        
+        # A size of 0 means no limit
+        self.search_min_size = QSpinBox()
+        self.search_max_size = QSpinBox()
+        for label, spin_box in [("Min MB", self.search_min_size), ("Max MB", self.search_max_size)]:
+            spin_box.setRange(0, 10 ** 7)
+            spin_box.setSpecialValueText("Any")
+            filter_row.addWidget(QLabel(label))
+            filter_row.addWidget(spin_box)
+        
+        # Dates only filter when their checkbox is ticked
+        self.search_after_enabled = QCheckBox("After")
+        self.search_after = QDateEdit(QDate.currentDate().addYears(-1))
+        self.search_before_enabled = QCheckBox("Before")
+        self.search_before = QDateEdit(QDate.currentDate())
+        for check_box, date_edit in [(self.search_after_enabled, self.search_after),
+                                     (self.search_before_enabled, self.search_before)]:
+            date_edit.setCalendarPopup(True)
+            date_edit.setDisplayFormat("yyyy-MM-dd")
+            filter_row.addWidget(check_box)
+            filter_row.addWidget(date_edit)
+        layout.addLayout(filter_row)
+        return panel
+
+    def search_catalogs(self):
+        """Search every catalog with the text and filters of the search panel"""
+        text = self.search_input.text()
+        extensions = self.search_extensions.text().replace(',', ' ').split()
+        min_size = self.search_min_size.value() * 1024 * 1024 or None
+        max_size = self.search_max_size.value() * 1024 * 1024 or None
+        modified_after = None
+        modified_before = None
+        if self.search_after_enabled.isChecked():
+            modified_after = datetime.combine(self.search_after.date().toPyDate(), datetime.min.time())
+        if self.search_before_enabled.isChecked():
+            modified_before = datetime.combine(self.search_before.date().toPyDate(), datetime.min.time())
+        if not text.strip() and not extensions and min_size is None and max_size is None \
+                and modified_after is None and modified_before is None:
+            self.clear_search()
+            return
+        
+        try:
+            conn = self.store.acquire()
+            results = search_files(conn, text, min_size=min_size, max_size=max_size, modified_after=modified_after,
+                                   modified_before=modified_before, extensions=extensions)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Error searching catalogs: {str(e)}")
+            return
+        finally:
+            if 'conn' in locals():
+                self.store.release(conn)
+        
+        self.search_results.clear()
+        items = []
+        for result in results:
+            item = QTreeWidgetItem([
+                os.path.basename(result.path),
+                format_size(result.size or 0),
+                format_mtime(result.modified_at, 'seconds') or "",
+                result.catalog_name,
+                os.path.join(result.root_path, os.path.dirname(result.path)),
+            ])
+            item.setData(0, Qt.UserRole, result.catalog_id)
+            items.append(item)
+        self.search_results.addTopLevelItems(items)
+        self.tree.hide()
+        self.search_results.show()
+        
+        if len(results) == SEARCH_LIMIT:
+            self.statusBar.showMessage(f"Showing the first {SEARCH_LIMIT} matches, refine the search to see others")
+        else:
+            self.statusBar.showMessage(f"Found {len(results)} matching files")
+
+    def clear_search(self):
+        """Hide the search results and show the catalog tree again"""
+        self.search_input.clear()
+        self.search_results.clear()
+        self.search_results.hide()
+        self.tree.show()
+
     def create_menu_bar(self):
         """Create menu bar with File menu"""
         menubar = self.menuBar()
@@ -714,6 +1213,10 @@ class FolderCatalogApp(QMainWindow):
         new_catalog_action = file_menu.addAction("New Catalog")
         new_catalog_action.triggered.connect(self.save_catalog)
         
+        # Import Catalog action
+        import_catalog_action = file_menu.addAction("Import Catalog")
+        import_catalog_action.triggered.connect(self.import_catalog)
+        
         file_menu.addSeparator()
         
         # Update Catalog action
@@ -724,12 +1227,28 @@ class FolderCatalogApp(QMainWindow):
         rename_catalog_action = file_menu.addAction("Rename Catalog")
         rename_catalog_action.triggered.connect(self.rename_selected_catalog)
         
+        # Export Catalog action
+        export_catalog_action = file_menu.addAction("Export Catalog")
+        export_catalog_action.triggered.connect(self.export_selected_catalog)
+        
         file_menu.addSeparator()
         
         # Compare Catalog action
         compare_catalog_action = file_menu.addAction("Compare Catalog")
         compare_catalog_action.triggered.connect(self.compare_selected_catalog)
         
+        # Compare with another catalog action
+        diff_catalog_action = file_menu.addAction("Compare with Catalog")
+        diff_catalog_action.triggered.connect(self.diff_selected_catalog)
+        
+        # Disk Usage action
+        disk_usage_action = file_menu.addAction("Show Disk Usage")
+        disk_usage_action.triggered.connect(self.show_selected_disk_usage)
+        
+        # Find Duplicates action
+        duplicates_action = file_menu.addAction("Find Duplicates")
+        duplicates_action.triggered.connect(self.find_duplicates)
+        
         file_menu.addSeparator()
         
         # Exit action
@@ -752,6 +1271,37 @@ class FolderCatalogApp(QMainWindow):
         else:
             QMessageBox.warning(self, "Warning", "Please select a catalog to rename")
 
+    def export_selected_catalog(self):
+        """Export the currently selected catalog"""
+        current_item = self.catalog_list.currentItem()
+        if current_item:
+            self.export_catalog(current_item)
+        else:
+            QMessageBox.warning(self, "Warning", "Please select a catalog to export")
+
+    def show_selected_disk_usage(self):
+        """Show the disk usage treemap of the currently selected catalog"""
+        current_item = self.catalog_list.currentItem()
+        if current_item:
+            self.show_disk_usage(current_item)
+        else:
+            QMessageBox.warning(self, "Warning", "Please select a catalog to show")
+
+    def show_disk_usage(self, item):
+        """Open a treemap of a catalog drawn from its stored directory totals"""
+        catalog_id = item.data(Qt.UserRole)
+        try:
+            conn = self.store.acquire()
+            row = conn.execute('SELECT name FROM catalogs WHERE id = ?', (catalog_id,)).fetchone()
+            if row:
+                treemap_window = TreemapWindow(self.store, catalog_id, row[0], self)
+                treemap_window.show()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Error loading disk usage: {str(e)}")
+        finally:
+            if 'conn' in locals():
+                self.store.release(conn)
+
     def show_catalog_context_menu(self, position):
         """Show context menu for catalog list"""
         item = self.catalog_list.itemAt(position)
@@ -776,7 +1326,13 @@ class FolderCatalogApp(QMainWindow):
 
         update_action = menu.addAction("Update Catalog")
         rename_action = menu.addAction("Rename Catalog")
+        export_action = menu.addAction("Export Catalog")
         compare_action = menu.addAction("Compare Catalog")
+        diff_action = menu.addAction("Compare with Catalog")
+        disk_usage_action = menu.addAction("Show Disk Usage")
+        is_watched = item.data(Qt.UserRole) in self.watch_workers
+        watch_action = menu.addAction("Stop Watching" if is_watched else "Watch for Changes")
+        watch_action.setEnabled(is_watched or watch_supported())
         menu.addSeparator()
         delete_action = menu.addAction("Delete Catalog")
 
@@ -786,8 +1342,19 @@ class FolderCatalogApp(QMainWindow):
             self.update_catalog(item)
         elif action == rename_action:
             self.rename_catalog(item)
+        elif action == export_action:
+            self.export_catalog(item)
         elif action == compare_action:
             self.compare_selected_catalog()
+        elif action == diff_action:
+            self.diff_selected_catalog()
+        elif action == disk_usage_action:
+            self.show_disk_usage(item)
+        elif action == watch_action:
+            if is_watched:
+                self.stop_watching(item.data(Qt.UserRole))
+            else:
+                self.watch_catalog(item)
         elif action == delete_action:
             self.delete_catalog(item)
 
@@ -796,8 +1363,7 @@ class FolderCatalogApp(QMainWindow):
         catalog_id = item.data(Qt.UserRole)  # Get catalog ID from the item
         
         try:
-            # Create a new connection for this operation
-            conn = sqlite3.connect('folder_catalog.db')
+            conn = self.store.acquire()
             cursor = conn.cursor()
             
             cursor.execute('SELECT name, root_path FROM catalogs WHERE id = ?', (catalog_id,))
@@ -806,30 +1372,22 @@ class FolderCatalogApp(QMainWindow):
                 return
                 
             catalog_name, root_path = result
+            if not os.path.isdir(root_path):
+                QMessageBox.warning(self, "Warning", f"Catalog folder '{root_path}' is not available")
+                return
             
-            # Ask if user wants to calculate MD5 hashes
-            calculate_md5 = QMessageBox.question(
-                self, "MD5 Calculation",
-                "Do you want to calculate MD5 hashes for files? (This will take longer but allows for more accurate comparison)",
-                QMessageBox.Yes | QMessageBox.No,
-                QMessageBox.No
-            ) == QMessageBox.Yes
-            
-            # Count total files for progress bar
-            total_files = sum([len(files) for _, _, files in os.walk(root_path)])
+            # Ask which fingerprints to keep, defaulting to the catalog's current algorithm
+            ok, algorithm = self.ask_hash_algorithm(catalog_hash_algorithm(conn, catalog_id))
+            if not ok:
+                return
             
-            # Create progress dialog
-            self.progress = QProgressDialog("Initializing...", "Cancel", 0, total_files, self)
-            self.progress.setWindowModality(Qt.WindowModal)
-            self.progress.setWindowTitle("Progress")
-            self.progress.setMinimumDuration(0)
-            self.progress.setAutoClose(True)
-            self.progress.setAutoReset(True)
+            # Create progress dialog; the total is estimated while scanning
+            self.create_progress_dialog("Initializing...")
             
-            # Create and start worker thread
-            self.worker = CatalogWorker(root_path, calculate_md5)
+            # Create and start worker thread that updates the catalog in place
+            self.worker = UpdateWorker(self.store, catalog_id, catalog_name, root_path, algorithm)
             self.worker.progress.connect(self.update_progress)
-            self.worker.finished.connect(self.on_catalog_finished)
+            self.worker.finished.connect(self.on_update_finished)
             self.worker.error.connect(self.on_catalog_error)
             self.progress.canceled.connect(self.worker.cancel)
             
@@ -840,15 +1398,54 @@ class FolderCatalogApp(QMainWindow):
             QMessageBox.critical(self, "Error", f"Error updating catalog: {str(e)}")
         finally:
             if 'conn' in locals():
-                conn.close()
+                self.store.release(conn)
+
+    def watch_catalog(self, item):
+        """Keep the selected catalog up to date while its folder changes"""
+        catalog_id = item.data(Qt.UserRole)
+        try:
+            conn = self.store.acquire()
+            row = conn.execute('SELECT name, root_path FROM catalogs WHERE id = ?', (catalog_id,)).fetchone()
+            if not row:
+                return
+            catalog_name, root_path = row
+            if not os.path.isdir(root_path):
+                QMessageBox.warning(self, "Warning", f"Catalog folder '{root_path}' is not available")
+                return
+            # New and changed files get the fingerprints the catalog already has
+            worker = WatchWorker(self.store, catalog_id, catalog_name, root_path,
+                                 catalog_hash_algorithm(conn, catalog_id))
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Error watching catalog: {str(e)}")
+            return
+        finally:
+            if 'conn' in locals():
+                self.store.release(conn)
+        worker.refreshed.connect(lambda added, changed, removed: self.statusBar.showMessage(
+            f"{catalog_name}: {added} added, {changed} changed, {removed} removed"))
+        worker.error.connect(lambda error_msg: self.on_watch_error(catalog_id, catalog_name, error_msg))
+        self.watch_workers[catalog_id] = worker
+        worker.start()
+        self.statusBar.showMessage(f"Watching '{root_path}' for changes")
+
+    def stop_watching(self, catalog_id):
+        """Stop keeping a catalog up to date"""
+        worker = self.watch_workers.pop(catalog_id, None)
+        if worker is not None:
+            worker.cancel()
+            worker.wait()
+
+    def on_watch_error(self, catalog_id, catalog_name, error_msg):
+        """Stop watching a catalog whose folder can't be followed any more"""
+        self.watch_workers.pop(catalog_id, None)
+        QMessageBox.warning(self, "Warning", f"Stopped watching '{catalog_name}': {error_msg}")
 
     def rename_catalog(self, item):
         """Rename the selected catalog"""
         catalog_id = item.data(Qt.UserRole)  # Get catalog ID from the item
         
         try:
-            # Create a new connection for this operation
-            conn = sqlite3.connect('folder_catalog.db')
+            conn = self.store.acquire()
             cursor = conn.cursor()
             
             # Get current name
@@ -866,29 +1463,21 @@ class FolderCatalogApp(QMainWindow):
             )
             
             if ok and new_name and new_name != old_name:
-                cursor.execute(
-                    'UPDATE catalogs SET name = ? WHERE id = ?',
-                    (new_name, catalog_id)
-                )
-                conn.commit()
-                self.update_catalog_list()
-                self.statusBar.showMessage(f"Catalog renamed from '{old_name}' to '{new_name}'")
+                self.write_later(lambda future: self.on_catalog_renamed(future, old_name, new_name),
+                                 rename_catalog, catalog_id, new_name)
                 
         except sqlite3.Error as e:
             QMessageBox.critical(self, "Error", f"Error renaming catalog: {str(e)}")
-            if 'conn' in locals():
-                conn.rollback()
         finally:
             if 'conn' in locals():
-                conn.close()
+                self.store.release(conn)
 
     def delete_catalog(self, item):
         """Delete the selected catalog"""
         catalog_id = item.data(Qt.UserRole)  # Get catalog ID from the item
         
         try:
-            # Create a new connection for this operation
-            conn = sqlite3.connect('folder_catalog.db')
+            conn = self.store.acquire()
             cursor = conn.cursor()
             
             # Get catalog name for the confirmation dialog
@@ -907,20 +1496,61 @@ class FolderCatalogApp(QMainWindow):
             )
             
             if reply == QMessageBox.Yes:
-                cursor.execute('DELETE FROM files WHERE catalog_id = ?', (catalog_id,))
-                cursor.execute('DELETE FROM catalogs WHERE id = ?', (catalog_id,))
-                conn.commit()
-                self.update_catalog_list()
-                self.tree.clear()
-                self.statusBar.showMessage(f"Catalog deleted")
+                # Hide the catalog right away; its rows are removed in the background
+                self.stop_watching(catalog_id)
+                self.write_later(lambda future: self.on_catalog_deleted(future, catalog_id, catalog_name),
+                                 delete_catalog, catalog_id)
                 
         except sqlite3.Error as e:
             QMessageBox.critical(self, "Error", f"Error deleting catalog: {str(e)}")
-            if 'conn' in locals():
-                conn.rollback()
         finally:
             if 'conn' in locals():
-                conn.close()
+                self.store.release(conn)
+
+    def on_catalog_renamed(self, future, old_name, new_name):
+        try:
+            future.result()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Error renaming catalog: {str(e)}")
+            return
+        self.update_catalog_list()
+        self.statusBar.showMessage(f"Catalog renamed from '{old_name}' to '{new_name}'")
+
+    def on_catalog_deleted(self, future, catalog_id, catalog_name):
+        try:
+            future.result()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Error deleting catalog: {str(e)}")
+            return
+        self.update_catalog_list()
+        if self.catalog_model is not None and self.catalog_model.catalog_id == catalog_id:
+            self.show_catalog_model(None)
+        self.statusBar.showMessage(f"Catalog '{catalog_name}' deleted")
+        self.start_purge()
+
+    def start_purge(self):
+        """Remove the rows of deleted catalogs in a background thread"""
+        if self.purge_worker is not None and self.purge_worker.isRunning():
+            # The running purge moves on to newly deleted catalogs by itself
+            return
+        self.purge_worker = PurgeWorker(self.store)
+        self.purge_worker.progress.connect(self.update_purge_progress)
+        self.purge_worker.finished.connect(self.on_purge_finished)
+        self.purge_worker.error.connect(self.on_purge_error)
+        self.purge_worker.start()
+
+    def update_purge_progress(self, value, total, message, stats):
+        """Show how far the background purge got in the status bar"""
+        self.statusBar.showMessage(f"{message}: {format_progress(value, total, stats)}")
+
+    def on_purge_finished(self, rows_removed):
+        """Report a finished background purge"""
+        if rows_removed:
+            self.statusBar.showMessage(f"Removed {rows_removed:,} rows of deleted catalogs")
+
+    def on_purge_error(self, error_msg):
+        """Report a failed background purge; it is tried again at the next start"""
+        self.statusBar.showMessage(f"Error removing deleted catalogs: {error_msg}")
 
     def set_dark_theme(self):
         """Set dark theme for the application"""
@@ -972,45 +1602,32 @@ class FolderCatalogApp(QMainWindow):
         """)
 
     def init_database(self):
-        """Initialize SQLite database and create necessary tables"""
-        self.conn = sqlite3.connect('folder_catalog.db')
-        self.cursor = self.conn.cursor()
-        
-        # Create tables if they don't exist
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS catalogs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                root_path TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS files (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                catalog_id INTEGER,
-                path TEXT NOT NULL,
-                name TEXT NOT NULL,
-                is_directory BOOLEAN,
-                size INTEGER,
-                modified_at TIMESTAMP,
-                md5_hash TEXT,
-                FOREIGN KEY (catalog_id) REFERENCES catalogs (id)
-            )
-        ''')
-        
-        self.conn.commit()
+        """Open the catalog database, creating or upgrading its tables"""
+        # Writes go through one writer thread and reads use a pool of read-only connections
+        self.store = CatalogStore(profiled=Profile.from_environment() is not None)
+        self.write_finished.connect(self.on_write_finished)
+
+    def write_later(self, on_done, function, *args):
+        """Queue a write on the store and call on_done(future) on the GUI thread once it has run
+
+        The writer may be busy with a scan or purge, so the GUI thread never
+        waits on the future itself.
+        """
+        future = self.store.write(function, *args)
+        # Done callbacks run on the writer thread; the signal is queued to the GUI thread
+        future.add_done_callback(lambda future: self.write_finished.emit(on_done, future))
+
+    def on_write_finished(self, on_done, future):
+        on_done(future)
 
     def update_catalog_list(self):
         """Update the list of saved catalogs"""
         try:
-            # Create a new connection for this operation
-            conn = sqlite3.connect('folder_catalog.db')
+            conn = self.store.acquire()
             cursor = conn.cursor()
             
             self.catalog_list.clear()
-            cursor.execute('SELECT id, name, root_path FROM catalogs ORDER BY created_at DESC')
+            cursor.execute('SELECT id, name, root_path FROM catalogs WHERE deleted_at IS NULL ORDER BY created_at DESC')
             for catalog_id, name, path in cursor.fetchall():
                 item = QListWidgetItem(f"{name} ({os.path.basename(path)})")
                 item.setData(Qt.UserRole, catalog_id)  # Store catalog ID in the item
@@ -1020,15 +1637,14 @@ class FolderCatalogApp(QMainWindow):
             QMessageBox.critical(self, "Error", f"Error updating catalog list: {str(e)}")
         finally:
             if 'conn' in locals():
-                conn.close()
+                self.store.release(conn)
 
     def load_catalog(self, item):
         """Load selected catalog into the tree view"""
         catalog_id = item.data(Qt.UserRole)  # Get catalog ID from the item
             
         try:
-            # Create a new connection for this operation
-            conn = sqlite3.connect('folder_catalog.db')
+            conn = self.store.acquire()
             cursor = conn.cursor()
             
             cursor.execute('SELECT name, root_path FROM catalogs WHERE id = ?', (catalog_id,))
@@ -1036,39 +1652,9 @@ class FolderCatalogApp(QMainWindow):
             
             if result:
                 catalog_name, root_path = result
-                self.tree.clear()
-                
-                # Get all files and directories for this catalog
-                cursor.execute('''
-                    SELECT path, name, is_directory, size, modified_at 
-                    FROM files 
-                    WHERE catalog_id = ? 
-                    ORDER BY path
-                ''', (catalog_id,))
-                
-                files = cursor.fetchall()
-                
-                # Create a dictionary to store path -> item mapping
-                path_to_item = {}
-                
-                # First pass: create all items
-                for rel_path, name, is_dir, size, modified in files:
-                    parent_path = os.path.dirname(rel_path)
-                    item = QTreeWidgetItem()
-                    item.setText(0, name)
-                    if not is_dir:
-                        item.setText(1, self.format_size(size))
-                    item.setText(2, datetime.fromisoformat(modified).strftime('%Y-%m-%d %H:%M:%S'))
-                    path_to_item[rel_path] = item
-                
-                # Second pass: set up parent-child relationships
-                for rel_path, item in path_to_item.items():
-                    parent_path = os.path.dirname(rel_path)
-                    if parent_path in path_to_item:
-                        path_to_item[parent_path].addChild(item)
-                    else:
-                        self.tree.addTopLevelItem(item)
-                
+                self.show_catalog_model(CatalogTreeModel(self.store, catalog_id))
+                self.search_results.hide()
+                self.tree.show()
                 self.statusBar.showMessage(f"Loaded catalog: {catalog_name}")
             
         except sqlite3.Error as e:
@@ -1077,23 +1663,17 @@ class FolderCatalogApp(QMainWindow):
             QMessageBox.critical(self, "Error", f"Unexpected error: {str(e)}")
         finally:
             if 'conn' in locals():
-                conn.close()
-
-    def format_size(self, size):
-        """Format file size in human readable format"""
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if size < 1024.0:
-                return f"{size:.1f} {unit}"
-            size /= 1024.0
-        return f"{size:.1f} PB"
-
-    def calculate_md5(self, file_path):
-        """Calculate MD5 hash of a file"""
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+                self.store.release(conn)
+
+    def show_catalog_model(self, model):
+        """Show a catalog model in the tree view, closing the previous one"""
+        previous = self.catalog_model
+        self.catalog_model = model
+        self.tree.setModel(model)
+        if model is not None:
+            self.tree.setColumnWidth(0, 400)
+        if previous is not None:
+            previous.close()
 
     def save_catalog(self):
         """Save current folder structure to database"""
@@ -1101,27 +1681,16 @@ class FolderCatalogApp(QMainWindow):
         if not root_path:
             return
 
-        # Ask if user wants to calculate MD5 hashes
-        calculate_md5 = QMessageBox.question(
-            self, "MD5 Calculation",
-            "Do you want to calculate MD5 hashes for files? (This will take longer but allows for more accurate comparison)",
-            QMessageBox.Yes | QMessageBox.No,
-            QMessageBox.No
-        ) == QMessageBox.Yes
+        # Ask which fingerprints to calculate
+        ok, algorithm = self.ask_hash_algorithm()
+        if not ok:
+            return
 
-        # Count total files for progress bar
-        total_files = sum([len(files) for _, _, files in os.walk(root_path)])
-        
-        # Create progress dialog
-        self.progress = QProgressDialog("Initializing...", "Cancel", 0, total_files, self)
-        self.progress.setWindowModality(Qt.WindowModal)
-        self.progress.setWindowTitle("Progress")
-        self.progress.setMinimumDuration(0)
-        self.progress.setAutoClose(True)
-        self.progress.setAutoReset(True)
+        # Create progress dialog; the total is estimated while scanning
+        self.create_progress_dialog("Initializing...")
         
         # Create and start worker thread
-        self.worker = CatalogWorker(root_path, calculate_md5)
+        self.worker = CatalogWorker(self.store, root_path, algorithm)
         self.worker.progress.connect(self.update_progress)
         self.worker.finished.connect(self.on_catalog_finished)
         self.worker.error.connect(self.on_catalog_error)
@@ -1130,21 +1699,129 @@ class FolderCatalogApp(QMainWindow):
         # Start the worker
         self.worker.start()
         
-    def update_progress(self, value, filename):
-        """Update progress dialog with percentage and current file"""
+    def import_catalog(self):
+        """Load a catalog exported on this or another machine as a new catalog"""
+        path, _ = QFileDialog.getOpenFileName(self, "Import Catalog", os.path.expanduser("~"), self.export_file_filter())
+        if not path:
+            return
+        try:
+            source = CatalogReader(path)
+        except (CatalogFormatError, OSError) as e:
+            QMessageBox.critical(self, "Error", f"Error importing catalog: {str(e)}")
+            return
+
+        # Create progress dialog; the total is estimated from how much of the file was read
+        self.create_progress_dialog("Importing...")
+
+        self.worker = ImportWorker(self.store, source)
+        self.worker.progress.connect(self.update_progress)
+        self.worker.finished.connect(self.on_catalog_finished)
+        self.worker.error.connect(self.on_catalog_error)
+        self.progress.canceled.connect(self.worker.cancel)
+        self.worker.start()
+
+    def export_catalog(self, item):
+        """Write the selected catalog to a JSONL, CSV or Parquet file"""
+        catalog_id = item.data(Qt.UserRole)
+        name = item.text().rsplit(' (', 1)[0]
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export Catalog", os.path.join(os.path.expanduser("~"), f"{name}.jsonl.gz"),
+            self.export_file_filter()
+        )
+        if not path:
+            return
+
+        self.create_progress_dialog("Exporting...")
+
+        self.worker = ExportWorker(self.store, catalog_id, path)
+        self.worker.progress.connect(self.update_progress)
+        self.worker.finished.connect(self.on_export_finished)
+        self.worker.error.connect(self.on_export_error)
+        self.progress.canceled.connect(self.worker.cancel)
+        self.worker.start()
+
+    def export_file_filter(self):
+        """Return the file dialog filter for the export formats available here"""
+        patterns = []
+        for file_format in available_formats():
+            patterns.append(f"*.{file_format}")
+            if file_format != 'parquet':
+                patterns.extend(f"*.{file_format}.{compression}" for compression in available_compressions())
+        return f"Catalog exports ({' '.join(patterns)});;All files (*)"
+
+    def on_export_finished(self, entries_written):
+        """Handle catalog export completion"""
+        if hasattr(self, 'progress'):
+            self.progress.close()
+        self.statusBar.showMessage(f"Exported {entries_written:,} entries to {self.worker.path}{self.profile_summary()}")
+
+    def on_export_error(self, error_msg):
+        """Handle catalog export error"""
         if hasattr(self, 'progress'):
-            self.progress.setValue(value)
-            percentage = int((value / self.progress.maximum()) * 100)
-            self.progress.setLabelText(f"Cataloging files... {percentage}%\n{filename}")
+            self.progress.close()
+        QMessageBox.critical(self, "Error", f"Error exporting catalog: {error_msg}")
+
+    def ask_hash_algorithm(self, current=None):
+        """Ask which fingerprint algorithm to use; returns (ok, algorithm)"""
+        algorithms = [None] + [algorithm for algorithm in ALGORITHM_LABELS if algorithm in available_algorithms()]
+        labels = [ALGORITHM_LABELS[algorithm] for algorithm in algorithms]
+        label, ok = QInputDialog.getItem(
+            self, "File Fingerprints",
+            "Fingerprints take longer to calculate but allow comparing file contents:",
+            labels, algorithms.index(current) if current in algorithms else 0, False
+        )
+        return ok, algorithms[labels.index(label)] if ok else None
+        
+    def create_progress_dialog(self, label):
+        """Create the modal progress dialog used by catalog and compare workers"""
+        self.progress = QProgressDialog(label, "Cancel", 0, 0, self)
+        self.progress.setWindowModality(Qt.WindowModal)
+        self.progress.setWindowTitle("Progress")
+        self.progress.setMinimumDuration(0)
+        self.progress.setAutoClose(True)
+        self.progress.setAutoReset(True)
+
+    def update_progress(self, value, total, filename, stats=None):
+        """Update progress dialog with percentage, throughput and current file"""
+        if hasattr(self, 'progress'):
+            with timed(self.worker.operation.profile, 'ui', signals=1):
+                self.progress.setMaximum(max(total, 1))
+                self.progress.setValue(value)
+                percentage = int((value / self.progress.maximum()) * 100)
+                self.progress.setLabelText(
+                    f"Cataloging files... {percentage}%\n{format_progress(value, total, stats)}\n{filename}")
         
     def on_catalog_finished(self):
         """Handle catalog creation completion"""
         if hasattr(self, 'progress'):
             self.progress.close()
         self.update_catalog_list()
-        self.statusBar.showMessage(f"Catalog '{self.worker.catalog_name}' saved successfully")
+        self.statusBar.showMessage(f"Catalog '{self.worker.catalog_name}' saved successfully{self.hash_cache_summary()}{self.profile_summary()}")
         QMessageBox.information(self, "Success", f"Catalog '{self.worker.catalog_name}' has been saved successfully!")
         
+    def on_update_finished(self):
+        """Handle in-place catalog update completion"""
+        if hasattr(self, 'progress'):
+            self.progress.close()
+        self.update_catalog_list()
+        self.show_catalog_model(None)
+        update = self.worker.operation
+        summary = f"{update.added} added, {update.changed} changed, {update.removed} removed"
+        self.statusBar.showMessage(f"Catalog '{self.worker.catalog_name}' updated: {summary}{self.hash_cache_summary()}{self.profile_summary()}")
+        QMessageBox.information(self, "Success", f"Catalog '{self.worker.catalog_name}' has been updated!\n{summary}")
+        
+    def hash_cache_summary(self):
+        """Describe how many hashes the finished worker took from the hash cache"""
+        cache = self.worker.operation.hash_cache
+        if cache is None or cache.hit_rate() is None:
+            return ""
+        return f" ({cache.summary()})"
+
+    def profile_summary(self):
+        """Describe the time per stage of the finished worker when profiling is switched on"""
+        profile = self.worker.operation.profile
+        return f" [{profile.summary()}]" if profile else ""
+        
     def on_catalog_error(self, error_msg):
         """Handle catalog creation error"""
         if hasattr(self, 'progress'):
@@ -1161,8 +1838,7 @@ class FolderCatalogApp(QMainWindow):
         catalog_id = current_item.data(Qt.UserRole)  # Get catalog ID from the item
         
         try:
-            # Create a new connection for this operation
-            conn = sqlite3.connect('folder_catalog.db')
+            conn = self.store.acquire()
             cursor = conn.cursor()
             
             cursor.execute('SELECT name, root_path FROM catalogs WHERE id = ?', (catalog_id,))
@@ -1188,22 +1864,18 @@ class FolderCatalogApp(QMainWindow):
                 return
 
             options = dialog.get_options()
+            if options['content'] == 'full' and checkable_hash_algorithm(conn, catalog_id) is None:
+                QMessageBox.warning(self, "Warning", "The catalog has no full hashes that can be checked here. "
+                                                     "Compare sample fingerprints instead.")
+                return
             
-            # Count total files for progress bar
-            total_files = sum([len(files) for _, _, files in os.walk(compare_path)])
-            
-            # Create progress dialog
-            self.progress = QProgressDialog("Initializing comparison...", "Cancel", 0, total_files, self)
-            self.progress.setWindowModality(Qt.WindowModal)
-            self.progress.setWindowTitle("Progress")
-            self.progress.setMinimumDuration(0)
-            self.progress.setAutoClose(True)
-            self.progress.setAutoReset(True)
+            # Create progress dialog; the total is estimated while scanning
+            self.create_progress_dialog("Initializing comparison...")
             
             # Create and start worker thread
-            self.worker = CompareWorker(catalog_id, compare_path, options)
+            self.worker = CompareWorker(self.store, catalog_id, compare_path, options)
             self.worker.progress.connect(self.update_progress)
-            self.worker.finished.connect(lambda cat_items, comp_items, diffs: self.on_compare_finished(catalog_name, compare_path, cat_items, comp_items, diffs))
+            self.worker.finished.connect(lambda run_id: self.on_compare_finished(catalog_name, compare_path, run_id))
             self.worker.error.connect(self.on_compare_error)
             self.progress.canceled.connect(self.worker.cancel)
             
@@ -1214,20 +1886,104 @@ class FolderCatalogApp(QMainWindow):
             QMessageBox.critical(self, "Error", f"Error comparing catalog: {str(e)}")
         finally:
             if 'conn' in locals():
-                conn.close()
+                self.store.release(conn)
     
-    def on_compare_finished(self, catalog_name, compare_path, catalog_items, compare_items, differences):
+    def diff_selected_catalog(self):
+        """Compare the currently selected catalog with another stored catalog"""
+        current_item = self.catalog_list.currentItem()
+        if not current_item:
+            QMessageBox.warning(self, "Warning", "Please select a catalog to compare")
+            return
+
+        catalog_id = current_item.data(Qt.UserRole)  # Get catalog ID from the item
+        
+        try:
+            conn = self.store.acquire()
+            catalogs = {row[0]: row for row in list_catalogs(conn)}
+            if catalog_id not in catalogs:
+                return
+            catalog_name = catalogs[catalog_id][1]
+            
+            # Ask user to select the catalog to compare with
+            others = [row for row in catalogs.values() if row[0] != catalog_id]
+            if not others:
+                QMessageBox.warning(self, "Warning", "There is no other catalog to compare with")
+                return
+            labels = [f"{name} ({created_at})" for _, name, _, created_at in others]
+            label, ok = QInputDialog.getItem(self, "Compare with Catalog", "Catalog:", labels, 0, False)
+            if not ok:
+                return
+            other_id, other_name, other_root_path, _ = others[labels.index(label)]
+
+            # Show comparison options dialog
+            dialog = CompareOptionsDialog(self)
+            if dialog.exec_() != QDialog.Accepted:
+                return
+
+            options = dialog.get_options()
+            if options['content'] in ('full', 'tiered') and shared_hash_algorithm(conn, catalog_id, other_id) is None:
+                if options['content'] == 'full':
+                    QMessageBox.warning(self, "Warning", "The catalogs have no full hashes of the same algorithm to "
+                                                         "compare. Compare sample fingerprints instead.")
+                    return
+                QMessageBox.warning(self, "Warning", "The catalogs have no full hashes of the same algorithm, "
+                                                     "so only sample fingerprints are compared.")
+            self.create_progress_dialog("Comparing catalogs...")
+            
+            self.worker = CatalogDiffWorker(self.store, catalog_id, other_id, options)
+            self.worker.progress.connect(self.update_progress)
+            self.worker.finished.connect(lambda run_id: self.on_compare_finished(
+                catalog_name, other_root_path, run_id, f"Catalog: {other_name}"))
+            self.worker.error.connect(self.on_compare_error)
+            self.progress.canceled.connect(self.worker.cancel)
+            self.worker.start()
+            
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Error", f"Error comparing catalog: {str(e)}")
+        finally:
+            if 'conn' in locals():
+                self.store.release(conn)
+    
+    def on_compare_finished(self, catalog_name, compare_path, run_id, compare_title=None):
         """Handle comparison completion"""
         if hasattr(self, 'progress'):
             self.progress.close()
             
-        if differences:
-            results_window = ComparisonResultsWindow(catalog_name, compare_path, differences, self)
-            results_window.add_items_to_trees(catalog_items, compare_items)
+        if self.worker.operation.differences:
+            results_window = ComparisonResultsWindow(catalog_name, compare_path, self, compare_title)
+            profile = self.worker.operation.profile
+            with self.store.reader(profile) as conn, timed(profile, 'ui', trees=1):
+                results_window.add_items_to_trees(compare_results(conn, run_id))
             results_window.show()
+            self.statusBar.showMessage(f"Comparison finished{self.hash_cache_summary()}{self.profile_summary()}")
         else:
             QMessageBox.information(self, "Comparison Results", 
-                f"No differences found between catalog '{catalog_name}' and selected folder!")
+                f"No differences found between catalog '{catalog_name}' and selected {'catalog' if compare_title else 'folder'}!")
+    
+    def find_duplicates(self):
+        """Look for files with the same contents across all catalogs"""
+        self.create_progress_dialog("Looking for duplicates...")
+        self.worker = DuplicateWorker(self.store)
+        self.worker.progress.connect(self.update_progress)
+        self.worker.finished.connect(self.on_duplicates_finished)
+        self.worker.error.connect(self.on_compare_error)
+        self.progress.canceled.connect(self.worker.cancel)
+        self.worker.start()
+    
+    def on_duplicates_finished(self, sets_found):
+        """Handle duplicate search completion"""
+        if hasattr(self, 'progress'):
+            self.progress.close()
+        
+        if not sets_found:
+            QMessageBox.information(self, "Duplicate Files", "No duplicate files found in the catalogs")
+            return
+        results_window = DuplicatesWindow(self)
+        profile = self.worker.operation.profile
+        with self.store.reader(profile) as conn, timed(profile, 'ui', trees=1):
+            results_window.add_sets(duplicate_sets(conn), duplicate_summary(conn))
+        results_window.show()
+        self.statusBar.showMessage(f"Found {sets_found} duplicate sets{self.hash_cache_summary()}{self.profile_summary()}")
     
     def on_compare_error(self, error_msg):
         """Handle comparison error"""
@@ -1236,8 +1992,19 @@ class FolderCatalogApp(QMainWindow):
         QMessageBox.critical(self, "Error", f"Error comparing catalog: {error_msg}")
 
     def closeEvent(self, event):
-        """Clean up database connection when closing the application"""
-        self.conn.close()
+        """Clean up database connections when closing the application"""
+        # Queued writes are finished before the store closes, so stop the running ones first
+        if getattr(self, 'worker', None) is not None and self.worker.isRunning():
+            self.worker.cancel()
+            self.worker.wait()
+        for catalog_id in list(self.watch_workers):
+            self.stop_watching(catalog_id)
+        if self.purge_worker is not None:
+            # An interrupted purge carries on at the next start
+            self.purge_worker.cancel()
+            self.purge_worker.wait()
+        self.show_catalog_model(None)
+        self.store.close()
         event.accept()
 
 if __name__ == "__main__":
@@ -1253,6 +2020,8 @@ if __name__ == "__main__":
         import ctypes
         libc = ctypes.CDLL('libc.dylib')
         libc.setprogname("Disk Catalog".encode('utf-8'))
+    if os.environ.get(PROFILE_ENV):
+        logging.basicConfig(level=logging.INFO, format='%(name)s: %(message)s')
     window = FolderCatalogApp()
     window.show()
     sys.exit(app.exec_())
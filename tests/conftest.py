@@ -0,0 +1,70 @@
+import os
+import sys
+import sqlite3
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_db import init_schema, iter_catalog_tree, find_directory
+
+# 2020-09-13, well before any test runs
+OLD_MTIME = 1_600_000_000
+
+
+def write_tree(root, spec):
+    """Create files and directories below root; spec maps relative paths to contents, None for a directory"""
+    os.makedirs(root, exist_ok=True)
+    for rel_path, content in spec.items():
+        full_path = os.path.join(root, *rel_path.split('/'))
+        if content is None:
+            os.makedirs(full_path, exist_ok=True)
+            continue
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(content.encode() if isinstance(content, str) else content)
+
+
+def age_tree(root, mtime=OLD_MTIME):
+    """Give everything below root the same old mtime, so later changes always move it"""
+    for dir_path, dir_names, file_names in os.walk(root):
+        for name in dir_names + file_names:
+            os.utime(os.path.join(dir_path, name), (mtime, mtime))
+    os.utime(root, (mtime, mtime))
+
+
+def catalog_state(conn, catalog_id):
+    """Return a catalog's entries in tree order, root first, and its directory totals, without ids"""
+    root = find_directory(conn, catalog_id, '')
+    entries = [(entry.path, entry.is_directory, entry.size, entry.modified_at, entry.md5_hash, entry.sample_hash)
+               for entry in [root] + list(iter_catalog_tree(conn, catalog_id))]
+    totals = sorted(conn.execute(
+        'SELECT path, total_size, total_files, newest_modified_at FROM directories WHERE catalog_id = ?',
+        (catalog_id,)
+    ))
+    return entries, totals
+
+
+@pytest.fixture
+def conn(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'catalog.db'))
+    init_schema(connection)
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """A small tree with nested directories, an empty directory and files of different sizes"""
+    root = str(tmp_path / 'tree')
+    write_tree(root, {
+        'a.txt': 'alpha',
+        'b/c.txt': 'charlie',
+        'b/d/e.bin': b'\x00' * 300,
+        'b/d/f.txt': 'foxtrot',
+        'b-side/g.txt': 'golf',
+        'empty': None,
+        'z.txt': 'zulu!',
+    })
+    age_tree(root)
+    return root
@@ -0,0 +1,90 @@
+import os
+import shutil
+
+import pytest
+
+import catalog_cli
+from catalog_core import CatalogScan, CatalogCompare
+from catalog_db import compare_results
+
+from conftest import write_tree
+
+
+def differences(conn, operation):
+    run_id = operation.run(conn)
+    return [(result.path, result.status, result.detail) for result in compare_results(conn, run_id)]
+
+
+def change_tree(tree):
+    """Change the fixture tree in every way a compare reports"""
+    write_tree(tree, {'a.txt': 'alpha, longer now', 'b/c.txt': 'CHARLIE', 'b/new.txt': 'new'})
+    os.remove(os.path.join(tree, 'z.txt'))
+    shutil.rmtree(os.path.join(tree, 'b', 'd'))
+    os.rmdir(os.path.join(tree, 'empty'))
+    write_tree(tree, {'empty': 'a file now'})
+
+
+def test_unchanged_tree_has_no_differences(conn, tree):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    operation = CatalogCompare(catalog_id, tree, {'check_size': True, 'content': 'tiered'}, scan_workers=1)
+    assert differences(conn, operation) == []
+    assert operation.differences == 0
+
+
+@pytest.mark.parametrize('content, detail', [(None, None), ('sample', 'sample'), ('full', 'hash'),
+                                             ('tiered', 'sample')])
+def test_known_differences(conn, tree, content, detail):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    change_tree(tree)
+    operation = CatalogCompare(catalog_id, tree, {'check_size': True, 'content': content}, scan_workers=1)
+    expected = [
+        ('a.txt', 'modified', 'size'),
+        (os.path.join('b', 'd'), 'missing', None),
+        (os.path.join('b', 'd', 'e.bin'), 'missing', None),
+        (os.path.join('b', 'd', 'f.txt'), 'missing', None),
+        (os.path.join('b', 'new.txt'), 'new', None),
+        ('empty', 'modified', 'type'),
+        ('z.txt', 'missing', None),
+    ]
+    if detail:
+        # Same size, different contents
+        expected.insert(1, (os.path.join('b', 'c.txt'), 'modified', detail))
+    assert sorted(differences(conn, operation)) == sorted(expected)
+    assert operation.differences == len(expected)
+
+
+def test_parallel_compare_matches(conn, tree):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    change_tree(tree)
+    options = {'check_size': True, 'content': 'tiered'}
+    serial = differences(conn, CatalogCompare(catalog_id, tree, options, scan_workers=1))
+    assert differences(conn, CatalogCompare(catalog_id, tree, options, scan_workers=3)) == serial
+
+
+def test_only_the_latest_run_is_kept(conn, tree):
+    catalog_id = CatalogScan(tree, None, scan_workers=1).run(conn)
+    for _ in range(2):
+        CatalogCompare(catalog_id, tree, {'check_size': True}, scan_workers=1).run(conn)
+    assert conn.execute('SELECT COUNT(*) FROM compare_runs WHERE catalog_id = ?', (catalog_id,)).fetchone() == (1,)
+
+
+@pytest.mark.parametrize('algorithm', [None, 'sample'])
+def test_full_tier_is_skipped_without_full_hashes(conn, tree, caplog, algorithm):
+    catalog_id = CatalogScan(tree, algorithm, scan_workers=1).run(conn)
+    change_tree(tree)
+    operation = CatalogCompare(catalog_id, tree, {'check_size': True, 'content': 'tiered'}, scan_workers=1)
+    results = differences(conn, operation)
+    assert operation.full_hash_skipped
+    assert 'no full hashes that can be checked here' in caplog.text
+    # Sample-only catalogs still have the sample tier
+    assert ((os.path.join('b', 'c.txt'), 'modified', 'sample') in results) == (algorithm == 'sample')
+
+
+def test_cli_refuses_full_compare_without_full_hashes(tmp_path, tree, capsys):
+    db_path = str(tmp_path / 'cli.db')
+    assert catalog_cli.main(['--db', db_path, 'scan', tree, '--name', 'sampled', '--hash', 'sample']) == 0
+    capsys.readouterr()
+
+    assert catalog_cli.main(['--db', db_path, 'compare', 'sampled', tree, '--content', 'full']) == catalog_cli.EXIT_USAGE
+    assert 'no full hashes that can be checked here (sample)' in capsys.readouterr().err
+    assert catalog_cli.main(['--db', db_path, 'compare', 'sampled', tree, '--content', 'tiered']) == catalog_cli.EXIT_OK
@@ -0,0 +1,90 @@
+import os
+import shutil
+
+import pytest
+
+import catalog_cli
+from catalog_core import CatalogScan, CatalogDiff
+from catalog_db import compare_results, shared_hash_algorithm
+
+from conftest import write_tree
+
+
+def diff(conn, catalog_id, other_catalog_id, content=None, check_size=True):
+    operation = CatalogDiff(catalog_id, other_catalog_id, {'check_size': check_size, 'content': content})
+    run_id = operation.run(conn)
+    results = [(result.path, result.status, result.detail) for result in compare_results(conn, run_id)]
+    assert operation.differences == len(results)
+    return results
+
+
+@pytest.fixture
+def catalogs(conn, tree):
+    """Catalog the fixture tree, change it and catalog it again; returns both catalog ids"""
+    catalog_id = CatalogScan(tree, 'md5', name='before', scan_workers=1).run(conn)
+    write_tree(tree, {'a.txt': 'alpha, longer now', 'b/c.txt': 'CHARLIE', 'b/new.txt': 'new', 'b/d/more': None})
+    os.remove(os.path.join(tree, 'z.txt'))
+    shutil.rmtree(os.path.join(tree, 'b-side'))
+    other_catalog_id = CatalogScan(tree, 'md5', name='after', scan_workers=1).run(conn)
+    return catalog_id, other_catalog_id
+
+
+def test_identical_catalogs(conn, tree):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    other_catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    assert diff(conn, catalog_id, other_catalog_id, 'tiered') == []
+
+
+@pytest.mark.parametrize('content, detail', [(None, None), ('sample', 'sample'), ('full', 'hash'),
+                                             ('tiered', 'sample')])
+def test_known_differences(conn, catalogs, content, detail):
+    expected = [
+        ('a.txt', 'modified', 'size'),
+        (os.path.join('b', 'd', 'more'), 'new', None),
+        (os.path.join('b', 'new.txt'), 'new', None),
+        ('b-side', 'missing', None),
+        (os.path.join('b-side', 'g.txt'), 'missing', None),
+        ('z.txt', 'missing', None),
+    ]
+    if detail:
+        expected.append((os.path.join('b', 'c.txt'), 'modified', detail))
+    assert diff(conn, *catalogs, content) == sorted(expected)
+
+
+def test_size_check_can_be_left_out(conn, catalogs):
+    assert ('a.txt', 'modified', 'size') not in diff(conn, *catalogs, check_size=False)
+
+
+def test_full_hashes_need_a_shared_algorithm(conn, tree):
+    md5_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    blake_id = CatalogScan(tree, 'blake2b', scan_workers=1).run(conn)
+    unhashed_id = CatalogScan(tree, None, scan_workers=1).run(conn)
+    sampled_id = CatalogScan(tree, 'sample', scan_workers=1).run(conn)
+    assert shared_hash_algorithm(conn, md5_id, md5_id) == 'md5'
+    assert shared_hash_algorithm(conn, md5_id, blake_id) is None
+    assert shared_hash_algorithm(conn, md5_id, unhashed_id) is None
+    assert shared_hash_algorithm(conn, sampled_id, sampled_id) is None
+
+
+def test_cli_refuses_full_diff_without_shared_algorithm(tmp_path, tree, capsys):
+    db_path = str(tmp_path / 'cli.db')
+    assert catalog_cli.main(['--db', db_path, 'scan', tree, '--name', 'md5', '--hash', 'md5']) == 0
+    assert catalog_cli.main(['--db', db_path, 'scan', tree, '--name', 'blake', '--hash', 'blake2b']) == 0
+    capsys.readouterr()
+
+    assert catalog_cli.main(['--db', db_path, 'diff', 'md5', 'blake', '--content', 'full']) == catalog_cli.EXIT_USAGE
+    assert 'no full hashes of the same algorithm' in capsys.readouterr().err
+    assert catalog_cli.main(['--db', db_path, 'diff', 'md5', 'blake', '--content', 'sample']) == catalog_cli.EXIT_OK
+
+
+def test_tiered_diff_without_shared_algorithm_compares_samples(conn, tree, caplog):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    write_tree(tree, {'b/c.txt': 'CHARLIE'})
+    other_catalog_id = CatalogScan(tree, 'blake2b', scan_workers=1).run(conn)
+    operation = CatalogDiff(catalog_id, other_catalog_id, {'check_size': True, 'content': 'tiered'})
+    run_id = operation.run(conn)
+    assert operation.full_hash_skipped
+    assert 'no full hashes of the same algorithm' in caplog.text
+    assert [(result.path, result.detail) for result in compare_results(conn, run_id)] == [
+        (os.path.join('b', 'c.txt'), 'sample')
+    ]
@@ -0,0 +1,94 @@
+import os
+import shutil
+
+from catalog_core import CatalogScan, DuplicateSearch
+from catalog_db import duplicate_sets, duplicate_summary, delete_catalog
+from catalog_hash import SAMPLE_SIZE
+
+from conftest import write_tree
+
+# Large enough that the sample fingerprint leaves gaps between its three ranges
+LARGE = 4 * SAMPLE_SIZE
+# A byte inside the gap after the first sampled range
+UNSAMPLED = SAMPLE_SIZE + 100
+
+
+def large_file(fill, change_at=None):
+    data = bytearray(fill * LARGE)
+    if change_at is not None:
+        data[change_at] ^= 0xff
+    return bytes(data)
+
+
+def found_sets(conn):
+    return sorted(sorted(path for _, _, path in duplicate.files) for duplicate in duplicate_sets(conn))
+
+
+def test_sets_across_catalogs(conn, tmp_path):
+    first, second = str(tmp_path / 'first'), str(tmp_path / 'second')
+    write_tree(first, {
+        'small.txt': 'same small contents',
+        'large.bin': large_file(b'a'),
+        'unsampled.bin': large_file(b'a', UNSAMPLED),
+        'unique.txt': 'nothing else has this size',
+    })
+    write_tree(second, {
+        'copy/small.txt': 'same small contents',
+        # Same size as small.txt, different contents
+        'other.txt': 'sane small contents',
+        'copy/large.bin': large_file(b'a'),
+    })
+    CatalogScan(first, None, scan_workers=1).run(conn)
+    CatalogScan(second, None, scan_workers=1).run(conn)
+
+    assert DuplicateSearch().run(conn) == 2
+    # unsampled.bin ties on its sample and only the full hash tells it apart
+    assert found_sets(conn) == [
+        [os.path.join('copy', 'large.bin'), 'large.bin'],
+        [os.path.join('copy', 'small.txt'), 'small.txt'],
+    ]
+    assert duplicate_summary(conn) == (2, 4, LARGE + len('same small contents'))
+
+
+def test_min_size(conn, tmp_path):
+    root = str(tmp_path / 'tree')
+    write_tree(root, {'a.txt': 'tiny', 'b.txt': 'tiny', 'c.bin': large_file(b'c'), 'd.bin': large_file(b'c')})
+    CatalogScan(root, None, scan_workers=1).run(conn)
+    assert DuplicateSearch(min_size=1000).run(conn) == 1
+    assert found_sets(conn) == [['c.bin', 'd.bin']]
+
+
+def test_offline_catalogs_use_stored_hashes(conn, tmp_path):
+    root = str(tmp_path / 'offline')
+    write_tree(root, {
+        'a.bin': large_file(b'x'),
+        'b.bin': large_file(b'x'),
+        'c.bin': large_file(b'x', 0),
+        'd.bin': large_file(b'x', UNSAMPLED),
+    })
+    catalog_id = CatalogScan(root, 'md5', scan_workers=1).run(conn)
+    shutil.rmtree(root)
+    # c.bin's sample differs, so a stored hash claiming a.bin's contents must not put it in the set
+    conn.execute('''
+        UPDATE files SET md5_hash = (SELECT md5_hash FROM files WHERE name = 'a.bin')
+        WHERE name = 'c.bin' AND catalog_id = ?
+    ''', (catalog_id,))
+    conn.commit()
+
+    assert DuplicateSearch().run(conn) == 1
+    assert found_sets(conn) == [['a.bin', 'b.bin']]
+
+
+def test_deleted_catalogs_are_left_out(conn, tmp_path):
+    kept, deleted = str(tmp_path / 'kept'), str(tmp_path / 'deleted')
+    write_tree(kept, {'a.txt': 'shared', 'b.txt': 'only one'})
+    write_tree(deleted, {'a.txt': 'shared', 'b.txt': 'only one'})
+    CatalogScan(kept, None, scan_workers=1).run(conn)
+    deleted_id = CatalogScan(deleted, None, scan_workers=1).run(conn)
+    delete_catalog(conn, deleted_id)
+    conn.commit()
+
+    operation = DuplicateSearch()
+    assert operation.run(conn) == 0
+    assert operation.total_groups == 0
+    assert found_sets(conn) == []
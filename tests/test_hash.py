@@ -0,0 +1,50 @@
+import hashlib
+import threading
+import time
+
+import catalog_hash
+from catalog_hash import HashPipeline
+
+from conftest import write_tree
+
+SPINNING, SOLID = 1, 2
+
+
+class TracingPipeline(HashPipeline):
+    """HashPipeline that records how many jobs of each device run at once"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.running = {SPINNING: 0, SOLID: 0}
+        self.most_running = {SPINNING: 0, SOLID: 0}
+
+    def _hash(self, file_path, payload, algorithms):
+        device = payload[0]
+        with self.lock:
+            self.running[device] += 1
+            self.most_running[device] = max(self.most_running[device], self.running[device])
+        time.sleep(0.01)
+        try:
+            return super()._hash(file_path, payload, algorithms)
+        finally:
+            with self.lock:
+                self.running[device] -= 1
+
+
+def test_spinning_disks_get_one_reader(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog_hash, 'is_rotational', lambda device: device == SPINNING)
+    root = str(tmp_path / 'tree')
+    write_tree(root, {f'{i}.txt': str(i) for i in range(16)})
+
+    pipeline = TracingPipeline(workers=4, algorithms=('md5',), batch_size=4)
+    for i in range(16):
+        device = SPINNING if i % 2 else SOLID
+        pipeline.submit(f'{root}/{i}.txt', device, i, (device, i))
+    results = dict(pipeline.drain())
+    pipeline.close()
+
+    assert results == {(SPINNING if i % 2 else SOLID, i): (hashlib.md5(str(i).encode()).digest(),) for i in range(16)}
+    assert pipeline.most_running[SPINNING] == 1
+    # The spinning disk's backlog leaves the other threads to the solid state one
+    assert pipeline.most_running[SOLID] > 1
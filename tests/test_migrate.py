@@ -0,0 +1,133 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from catalog_db import (
+    init_schema, iter_catalog_tree, search_files, datetime_to_mtime_ns, SCHEMA_VERSION
+)
+
+# The tables of the first release, before the database had a user_version
+BASELINE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS catalogs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        root_path TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        catalog_id INTEGER,
+        path TEXT NOT NULL,
+        name TEXT NOT NULL,
+        is_directory BOOLEAN,
+        size INTEGER,
+        modified_at TIMESTAMP,
+        md5_hash TEXT,
+        FOREIGN KEY (catalog_id) REFERENCES catalogs (id)
+    )
+    ''',
+]
+
+MODIFIED = datetime(2021, 3, 4, 5, 6, 7, 890123)
+NEWER = datetime(2022, 1, 2, 3, 4, 5)
+DIGEST = '0123456789abcdef0123456789abcdef'
+
+
+def schema_of(conn):
+    """Return the tables and indexes of a database with the column names of each table
+
+    Declared column types are left out: they only set SQLite's type affinity,
+    and migrations convert the values themselves.
+    """
+    objects = conn.execute(
+        "SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' AND name NOT LIKE 'file_search_%'"
+    ).fetchall()
+    return {
+        (kind, name): [row[1] for row in conn.execute(f'PRAGMA table_info({name})')]
+        if kind == 'table' else None
+        for kind, name in objects
+    }
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """A database written by the first release, with one hashed and one unhashed catalog"""
+    conn = sqlite3.connect(str(tmp_path / 'baseline.db'))
+    for statement in BASELINE_SCHEMA:
+        conn.execute(statement)
+    conn.execute("INSERT INTO catalogs (name, root_path) VALUES ('photos', '/data/photos')")
+    conn.execute("INSERT INTO catalogs (name, root_path) VALUES ('music', '/data/music')")
+    rows = [
+        (1, 'albums', 'albums', True, 0, MODIFIED, None),
+        (1, os.path.join('albums', '2021'), '2021', True, 0, MODIFIED, None),
+        (1, os.path.join('albums', '2021', 'beach.jpg'), 'beach.jpg', False, 2048, NEWER, DIGEST),
+        (1, os.path.join('albums', 'cover.png'), 'cover.png', False, 100, MODIFIED, DIGEST),
+        (1, 'readme.txt', 'readme.txt', False, 7, MODIFIED, None),
+        (2, 'song.mp3', 'song.mp3', False, 5000, MODIFIED, None),
+        # Rows of a catalog deleted without removing its files
+        (9, 'orphan.txt', 'orphan.txt', False, 1, MODIFIED, None),
+    ]
+    conn.executemany(
+        'INSERT INTO files (catalog_id, path, name, is_directory, size, modified_at, md5_hash) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [row[:5] + (str(row[5]), row[6]) for row in rows]
+    )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_migrates_to_the_current_schema(tmp_path, baseline):
+    init_schema(baseline)
+    fresh = sqlite3.connect(str(tmp_path / 'fresh.db'))
+    init_schema(fresh)
+    assert baseline.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+    assert schema_of(baseline) == schema_of(fresh)
+    fresh.close()
+
+
+def test_migrated_rows(baseline):
+    init_schema(baseline)
+    entries = [(entry.path, entry.is_directory, entry.size, entry.modified_at, entry.md5_hash)
+               for entry in iter_catalog_tree(baseline, 1)]
+    assert entries == [
+        ('albums', True, 0, datetime_to_mtime_ns(MODIFIED), None),
+        (os.path.join('albums', '2021'), True, 0, datetime_to_mtime_ns(MODIFIED), None),
+        (os.path.join('albums', '2021', 'beach.jpg'), False, 2048, datetime_to_mtime_ns(NEWER),
+         bytes.fromhex(DIGEST)),
+        (os.path.join('albums', 'cover.png'), False, 100, datetime_to_mtime_ns(MODIFIED), bytes.fromhex(DIGEST)),
+        ('readme.txt', False, 7, datetime_to_mtime_ns(MODIFIED), None),
+    ]
+    assert baseline.execute('SELECT id, hash_algorithm, deleted_at FROM catalogs').fetchall() == [
+        (1, 'md5', None), (2, None, None)
+    ]
+    # Directories moved to their own table and the orphaned row was dropped
+    assert baseline.execute('SELECT COUNT(*) FROM files').fetchone() == (4,)
+
+
+def test_migrated_totals_and_search(baseline):
+    init_schema(baseline)
+    totals = dict(((catalog_id, path), rest) for catalog_id, path, *rest in baseline.execute(
+        'SELECT catalog_id, path, total_size, total_files, newest_modified_at FROM directories'
+    ))
+    assert totals == {
+        (1, ''): [2155, 3, datetime_to_mtime_ns(NEWER)],
+        (1, 'albums'): [2148, 2, datetime_to_mtime_ns(NEWER)],
+        (1, os.path.join('albums', '2021')): [2048, 1, datetime_to_mtime_ns(NEWER)],
+        (2, ''): [5000, 1, datetime_to_mtime_ns(MODIFIED)],
+    }
+    assert [result.path for result in search_files(baseline, 'beach')] == [
+        os.path.join('albums', '2021', 'beach.jpg')
+    ]
+
+
+def test_migration_is_idempotent(baseline):
+    init_schema(baseline)
+    before = list(iter_catalog_tree(baseline, 1))
+    init_schema(baseline)
+    assert list(iter_catalog_tree(baseline, 1)) == before
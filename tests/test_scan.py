@@ -0,0 +1,56 @@
+import os
+
+import catalog_scan
+from catalog_scan import TreeScanner, ParallelTreeScanner
+
+from conftest import write_tree
+
+
+def scanned(scanner):
+    return [(entry.path, entry.parent, entry.name, entry.is_directory, entry.size) for entry in scanner.scan()]
+
+
+def test_tree_order(tree):
+    paths = [entry[0] for entry in scanned(TreeScanner(tree))]
+    assert paths == [
+        'a.txt',
+        'b', os.path.join('b', 'c.txt'), os.path.join('b', 'd'),
+        os.path.join('b', 'd', 'e.bin'), os.path.join('b', 'd', 'f.txt'),
+        'b-side', os.path.join('b-side', 'g.txt'),
+        'empty',
+        'z.txt',
+    ]
+
+
+def test_parallel_scan_matches_tree_scanner(tmp_path, monkeypatch):
+    root = str(tmp_path / 'tree')
+    spec = {}
+    for top in range(6):
+        for sub in range(4):
+            for index in range(3):
+                spec[f'd{top}/s{sub}/f{index}.txt'] = 'x' * (top * 10 + sub + index)
+        spec[f'd{top}/top.txt'] = 'top'
+    spec['root.txt'] = 'root'
+    write_tree(root, spec)
+    # Small chunks so subtrees are handed over in several pieces
+    monkeypatch.setattr(catalog_scan, 'SCAN_CHUNK_SIZE', 2)
+
+    expected = scanned(TreeScanner(root))
+    scanner = ParallelTreeScanner(root, 4)
+    assert scanned(scanner) == expected
+    assert scanner.is_finished
+    assert scanner.files_seen == len(spec)
+    assert scanner.dirs_scanned == scanner.dirs_queued == scanner.dirs_seen + 1
+
+
+def test_symlinked_directories_are_listed_not_followed(tree):
+    os.symlink(os.path.join(tree, 'b'), os.path.join(tree, 'link'))
+    for scanner in (TreeScanner(tree), ParallelTreeScanner(tree, 2)):
+        paths = [entry[0] for entry in scanned(scanner)]
+        assert 'link' in paths
+        assert not any(path.startswith('link' + os.sep) for path in paths)
+
+
+def test_scan_directory_without_recursion(tree):
+    entries = TreeScanner(tree).scan_directory('b', recursive=False)
+    assert [entry.name for entry in entries] == ['c.txt', 'd']
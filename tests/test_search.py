@@ -0,0 +1,78 @@
+import os
+from datetime import datetime
+
+import pytest
+
+from catalog_core import CatalogScan
+from catalog_db import search_files, delete_catalog
+
+from conftest import write_tree, age_tree, OLD_MTIME
+
+
+@pytest.fixture
+def catalogs(conn, tmp_path):
+    """Two catalogs with names, paths and sizes to filter on; returns their ids"""
+    photos, music = str(tmp_path / 'photos'), str(tmp_path / 'music')
+    write_tree(photos, {
+        'Holiday/beach.JPG': b'x' * 3000,
+        'Holiday/notes.txt': b'x' * 10,
+        'work/report_v2.pdf': b'x' * 500,
+        'work/100%.txt': b'x' * 20,
+        'ab.txt': b'x' * 5,
+    })
+    write_tree(music, {'beach boys/surf.mp3': b'x' * 4000, 'jazz/take5.mp3': b'x' * 2000})
+    age_tree(photos)
+    age_tree(music)
+    recent = OLD_MTIME + 10 * 24 * 3600
+    os.utime(os.path.join(photos, 'work', 'report_v2.pdf'), (recent, recent))
+    return (CatalogScan(photos, None, scan_workers=1).run(conn),
+            CatalogScan(music, None, scan_workers=1).run(conn))
+
+
+def found(conn, text='', **filters):
+    return sorted((result.catalog_name, result.path) for result in search_files(conn, text, **filters))
+
+
+def test_indexed_words_match_names_and_paths(conn, catalogs):
+    assert found(conn, 'beach') == [
+        ('music', os.path.join('beach boys', 'surf.mp3')),
+        ('photos', os.path.join('Holiday', 'beach.JPG')),
+    ]
+    # Case is ignored and every word has to match
+    assert found(conn, 'HOLIDAY txt') == [('photos', os.path.join('Holiday', 'notes.txt'))]
+
+
+def test_short_words_fall_back_to_like(conn, catalogs):
+    assert found(conn, 'ab') == [('photos', 'ab.txt')]
+    # A short word combined with an indexed one
+    assert found(conn, 'mp3 5') == [('music', os.path.join('jazz', 'take5.mp3'))]
+    # LIKE wildcards in a short word are matched literally
+    assert found(conn, '%') == [('photos', os.path.join('work', '100%.txt'))]
+    assert found(conn, '_v') == [('photos', os.path.join('work', 'report_v2.pdf'))]
+
+
+def test_filters(conn, catalogs):
+    photos_id, music_id = catalogs
+    assert found(conn, 'mp3', catalog_id=photos_id) == []
+    assert found(conn, catalog_id=music_id, min_size=3000) == [('music', os.path.join('beach boys', 'surf.mp3'))]
+    assert found(conn, catalog_id=photos_id, min_size=10, max_size=500) == [
+        ('photos', os.path.join('Holiday', 'notes.txt')),
+        ('photos', os.path.join('work', '100%.txt')),
+        ('photos', os.path.join('work', 'report_v2.pdf')),
+    ]
+    assert found(conn, extensions=['jpg', '.pdf']) == [
+        ('photos', os.path.join('Holiday', 'beach.JPG')),
+        ('photos', os.path.join('work', 'report_v2.pdf')),
+    ]
+    cutoff = datetime.fromtimestamp(OLD_MTIME + 24 * 3600)
+    assert found(conn, modified_after=cutoff) == [('photos', os.path.join('work', 'report_v2.pdf'))]
+    assert len(found(conn, modified_before=cutoff)) == 6
+
+
+def test_limit(conn, catalogs):
+    assert len(search_files(conn, limit=3)) == 3
+
+
+def test_deleted_catalogs_are_not_searched(conn, catalogs):
+    delete_catalog(conn, catalogs[1])
+    assert found(conn, 'beach') == [('photos', os.path.join('Holiday', 'beach.JPG'))]
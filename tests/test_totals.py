@@ -0,0 +1,59 @@
+import os
+
+from catalog_core import CatalogScan, CatalogUpdate
+from catalog_db import largest_directories
+
+from conftest import OLD_MTIME, write_tree
+
+OLD_NS = OLD_MTIME * 10 ** 9
+
+
+def totals(conn, catalog_id):
+    return {path: (total_size, total_files, newest) for path, total_size, total_files, newest in conn.execute(
+        'SELECT path, total_size, total_files, newest_modified_at FROM directories WHERE catalog_id = ?', (catalog_id,)
+    )}
+
+
+def test_scan_rolls_totals_up_to_the_root(conn, tree):
+    catalog_id = CatalogScan(tree, None, scan_workers=1).run(conn)
+    assert totals(conn, catalog_id) == {
+        '': (328, 6, OLD_NS),
+        'b': (314, 3, OLD_NS),
+        os.path.join('b', 'd'): (307, 2, OLD_NS),
+        'b-side': (4, 1, OLD_NS),
+        'empty': (0, 0, None),
+    }
+    assert [row[0] for row in largest_directories(conn, catalog_id, 2)] == ['', 'b']
+
+
+def test_update_applies_deltas_to_every_ancestor(conn, tree):
+    newest = OLD_MTIME + 100
+    os.utime(os.path.join(tree, 'b', 'd', 'f.txt'), (newest, newest))
+    catalog_id = CatalogScan(tree, None, scan_workers=1).run(conn)
+    assert totals(conn, catalog_id)[''] == (328, 6, newest * 10 ** 9)
+
+    # Losing the newest file takes the newest mtime back down, in b/d and above
+    os.remove(os.path.join(tree, 'b', 'd', 'f.txt'))
+    write_tree(tree, {'empty/new.bin': b'\x01' * 1000})
+    os.utime(os.path.join(tree, 'empty', 'new.bin'), (OLD_MTIME + 50, OLD_MTIME + 50))
+    write_tree(tree, {'b-side/g.txt': 'golf golf'})
+    os.utime(os.path.join(tree, 'b-side', 'g.txt'), (OLD_MTIME + 10, OLD_MTIME + 10))
+
+    CatalogUpdate(catalog_id, 'tree', tree, None, scan_workers=1).run(conn)
+    assert totals(conn, catalog_id) == {
+        '': (328 - 7 + 1000 + 5, 6, (OLD_MTIME + 50) * 10 ** 9),
+        'b': (307, 2, OLD_NS),
+        os.path.join('b', 'd'): (300, 1, OLD_NS),
+        'b-side': (9, 1, (OLD_MTIME + 10) * 10 ** 9),
+        'empty': (1000, 1, (OLD_MTIME + 50) * 10 ** 9),
+    }
+
+
+def test_update_matches_totals_of_a_fresh_scan(conn, tree):
+    catalog_id = CatalogScan(tree, None, scan_workers=1).run(conn)
+    write_tree(tree, {'b/d/deeper/x.txt': 'x' * 40, 'a.txt': 'a'})
+    os.remove(os.path.join(tree, 'b', 'c.txt'))
+
+    CatalogUpdate(catalog_id, 'tree', tree, None, scan_workers=1).run(conn)
+    fresh_id = CatalogScan(tree, None, scan_workers=1).run(conn)
+    assert totals(conn, catalog_id) == totals(conn, fresh_id)
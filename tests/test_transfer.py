@@ -0,0 +1,103 @@
+import os
+import gzip
+
+import pytest
+
+from catalog_core import CatalogScan, CatalogExport, CatalogImport
+from catalog_db import find_catalog
+from catalog_transfer import (
+    CatalogReader, CatalogFormatError, export_catalog, detect_format, available_formats, available_compressions
+)
+
+from conftest import write_tree, catalog_state
+
+# Directories and files of the fixture tree with the file added below, without the root
+ENTRIES = 11
+
+
+def imported_state(conn, catalog_id):
+    """Return catalog_state() without the root's mtime, which exports carry no row for"""
+    (root, *entries), totals = catalog_state(conn, catalog_id)
+    return [root[:3] + (None,) + root[4:]] + entries, totals
+
+
+def round_trip(conn, tmp_path, catalog_id, name, **options):
+    """Export a catalog to a file called name, import it again and return the imported catalog's id"""
+    path = str(tmp_path / name)
+    assert CatalogExport(catalog_id, path, **options).run(conn) == ENTRIES
+    with CatalogReader(path, **options) as source:
+        return CatalogImport(source, name='imported', root_path=source.header.get('root_path') or 'tree').run(conn)
+
+
+@pytest.fixture
+def catalog_id(conn, tree):
+    write_tree(tree, {'b/d/unicode é.txt': 'üñí'})
+    return CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+
+
+@pytest.mark.parametrize('name', ['export.jsonl', 'export.jsonl.gz', 'export.csv', 'export.csv.gz'])
+def test_round_trip(conn, tmp_path, catalog_id, name):
+    imported_id = round_trip(conn, tmp_path, catalog_id, name)
+    assert imported_state(conn, imported_id) == imported_state(conn, catalog_id)
+
+
+def test_round_trip_zstd(conn, tmp_path, catalog_id):
+    if 'zst' not in available_compressions():
+        pytest.skip("zstandard is not installed")
+    imported_id = round_trip(conn, tmp_path, catalog_id, 'export.jsonl.zst')
+    assert imported_state(conn, imported_id) == imported_state(conn, catalog_id)
+
+
+def test_round_trip_parquet(conn, tmp_path, catalog_id):
+    if 'parquet' not in available_formats():
+        pytest.skip("pyarrow is not installed")
+    imported_id = round_trip(conn, tmp_path, catalog_id, 'export.parquet')
+    assert imported_state(conn, imported_id) == imported_state(conn, catalog_id)
+
+
+def test_gzip_output_is_compressed(conn, tmp_path, catalog_id):
+    path = str(tmp_path / 'export.jsonl.gz')
+    export_catalog(conn, catalog_id, path)
+    with gzip.open(path, 'rt') as f:
+        assert f.readline().startswith('{"catalog": ')
+
+
+def test_jsonl_header_fills_in_the_catalog_fields(conn, tmp_path, catalog_id, tree):
+    path = str(tmp_path / 'export.jsonl')
+    export_catalog(conn, catalog_id, path)
+    with CatalogReader(path) as source:
+        assert source.header['root_path'] == tree
+        assert source.header['hash_algorithm'] == 'md5'
+        imported_id = CatalogImport(source).run(conn)
+    assert find_catalog(conn, str(imported_id))[1:] == ('tree', tree)
+
+
+def test_explicit_format_overrides_the_file_name(conn, tmp_path, catalog_id):
+    path = str(tmp_path / 'export.txt')
+    export_catalog(conn, catalog_id, path, file_format='csv', compression='gz')
+    with open(path, 'rb') as f:
+        assert f.read(2) == b'\x1f\x8b'
+    with CatalogReader(path, file_format='csv', compression='gz') as source:
+        assert len(list(source)) == ENTRIES
+
+
+def test_detect_format():
+    assert detect_format('a.jsonl') == ('jsonl', None)
+    assert detect_format('a.CSV.GZ') == ('csv', 'gz')
+    assert detect_format('a.ndjson.gz', compression='none') == ('jsonl', None)
+    assert detect_format(None) == ('jsonl', None)
+    assert detect_format('-', 'csv') == ('csv', None)
+    with pytest.raises(CatalogFormatError):
+        detect_format('a.parquet', compression='gz')
+
+
+def test_failed_export_leaves_no_file(conn, tmp_path, catalog_id):
+    path = str(tmp_path / 'export.jsonl')
+
+    def progress(value, total, message):
+        if value == 3:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        export_catalog(conn, catalog_id, path, progress=progress)
+    assert not os.path.exists(path)
@@ -0,0 +1,77 @@
+import os
+import shutil
+
+import catalog_db
+from catalog_core import CatalogScan, CatalogUpdate
+
+from conftest import write_tree, catalog_state
+
+
+def fresh_state(conn, root):
+    """Catalog root from scratch and return its state, to compare an updated catalog with"""
+    return catalog_state(conn, CatalogScan(root, 'md5', scan_workers=1).run(conn))
+
+
+def search_rows(conn, catalog_id):
+    return sorted(conn.execute('''
+        SELECT s.name, s.path FROM file_search s JOIN files f ON f.id = s.rowid WHERE f.catalog_id = ?
+    ''', (catalog_id,)))
+
+
+def test_unchanged_tree_writes_nothing(conn, tree):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    before = catalog_state(conn, catalog_id)
+    assert CatalogUpdate(catalog_id, 'tree', tree, 'md5', scan_workers=1).run(conn) == (0, 0, 0)
+    assert catalog_state(conn, catalog_id) == before
+
+
+def test_inserts_updates_and_deletes(conn, tree):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    write_tree(tree, {'b/new.txt': 'new file', 'empty/sub/deep.txt': 'deep'})
+    write_tree(tree, {'a.txt': 'alpha, longer now'})
+    os.remove(os.path.join(tree, 'z.txt'))
+    shutil.rmtree(os.path.join(tree, 'b', 'd'))
+
+    added, changed, removed = CatalogUpdate(catalog_id, 'tree', tree, 'md5', scan_workers=1).run(conn)
+    # Added b/new.txt, empty/sub and empty/sub/deep.txt; changed a.txt and the listings of the root, b and
+    # empty; removed z.txt, b/d and its two files
+    assert (added, changed, removed) == (3, 4, 4)
+    assert catalog_state(conn, catalog_id) == fresh_state(conn, tree)
+    assert search_rows(conn, catalog_id) == [
+        ('a.txt', ''), ('c.txt', 'b'), ('deep.txt', os.path.join('empty', 'sub')), ('g.txt', 'b-side'),
+        ('new.txt', 'b'),
+    ]
+
+
+def test_file_and_directory_swap(conn, tree):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    os.remove(os.path.join(tree, 'a.txt'))
+    write_tree(tree, {'a.txt/inner.txt': 'inner'})
+    shutil.rmtree(os.path.join(tree, 'empty'))
+    write_tree(tree, {'empty': 'now a file'})
+
+    CatalogUpdate(catalog_id, 'tree', tree, 'md5', scan_workers=1).run(conn)
+    assert catalog_state(conn, catalog_id) == fresh_state(conn, tree)
+
+
+def test_merge_survives_flushes_during_the_merge(conn, tree, monkeypatch):
+    # Tiny batches write rows while the stored tree is still being read
+    monkeypatch.setattr(catalog_db.BatchWriter.__init__, '__defaults__', (2,))
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    write_tree(tree, {f'b/n{index}.txt': 'n' * index for index in range(6)})
+    shutil.rmtree(os.path.join(tree, 'b-side'))
+    write_tree(tree, {'b-side/g.txt/h.txt': 'was a file'})
+
+    CatalogUpdate(catalog_id, 'tree', tree, 'md5', scan_workers=1).run(conn)
+    assert catalog_state(conn, catalog_id) == fresh_state(conn, tree)
+
+
+def test_unchanged_files_keep_their_hashes(conn, tree):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    hashes = {entry[0]: entry[4] for entry in catalog_state(conn, catalog_id)[0]}
+    write_tree(tree, {'b/c.txt': 'changed contents'})
+
+    CatalogUpdate(catalog_id, 'tree', tree, 'md5', scan_workers=1).run(conn)
+    updated = {entry[0]: entry[4] for entry in catalog_state(conn, catalog_id)[0]}
+    assert updated[os.path.join('b', 'c.txt')] != hashes[os.path.join('b', 'c.txt')]
+    assert updated['a.txt'] == hashes['a.txt']
@@ -0,0 +1,86 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from catalog_core import CatalogScan, CatalogRefresh
+from catalog_watch import CatalogWatcher, IN_Q_OVERFLOW
+
+from conftest import write_tree, catalog_state
+
+
+@pytest.fixture
+def watcher(tree):
+    watcher = CatalogWatcher(tree, debounce=0.05, max_delay=2.0)
+    try:
+        watcher.start()
+    except OSError:
+        pytest.skip("inotify is not available")
+    yield watcher
+    watcher.close()
+
+
+def wait_for_changes(watcher, timeout=5.0):
+    """Poll until the watcher hands out a batch of changes"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        changes = watcher.poll(timeout=0.05)
+        if changes is not None:
+            return changes
+    pytest.fail("no changes were reported")
+
+
+def refresh(conn, catalog_id, tree, changes):
+    return CatalogRefresh(catalog_id, 'tree', tree, 'md5', changes.dirs, changes.subtrees).run(conn)
+
+
+def test_events_mark_the_changed_directories(tree, watcher):
+    write_tree(tree, {'b/d/f.txt': 'changed', 'b-side/new.txt': 'new'})
+    os.remove(os.path.join(tree, 'z.txt'))
+    changes = wait_for_changes(watcher)
+    assert changes.dirs == {'', os.path.join('b', 'd'), 'b-side'}
+    assert changes.subtrees == set()
+
+
+def test_refresh_from_events_matches_a_fresh_scan(conn, tree, watcher):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    write_tree(tree, {'a.txt': 'alpha, longer now', 'empty/new/deeper/x.txt': 'x', 'b/new.txt': 'new'})
+    os.remove(os.path.join(tree, 'z.txt'))
+    os.rename(os.path.join(tree, 'b', 'd'), os.path.join(tree, 'b-side', 'd'))
+    shutil.rmtree(os.path.join(tree, 'b'))
+
+    assert refresh(conn, catalog_id, tree, wait_for_changes(watcher)) != (0, 0, 0)
+    fresh_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    assert catalog_state(conn, catalog_id) == catalog_state(conn, fresh_id)
+
+
+def test_new_directories_are_watched(conn, tree, watcher):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    write_tree(tree, {'fresh': None})
+    refresh(conn, catalog_id, tree, wait_for_changes(watcher))
+
+    # Changes inside the new directory now come from its own watch
+    write_tree(tree, {'fresh/inside.txt': 'inside'})
+    changes = wait_for_changes(watcher)
+    assert changes.dirs == {'fresh'}
+    refresh(conn, catalog_id, tree, changes)
+    fresh_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    assert catalog_state(conn, catalog_id) == catalog_state(conn, fresh_id)
+
+
+def test_overflow_watches_new_directories(conn, tree, watcher):
+    catalog_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    watched = dict(watcher.paths)
+    # Created before their events are read, as when the queue overflows and drops them
+    write_tree(tree, {'fresh/deeper/inside.txt': 'inside'})
+    watcher.handle(-1, IN_Q_OVERFLOW, '')
+    assert {'fresh', os.path.join('fresh', 'deeper')} <= set(watcher.paths.values())
+    # Directories watched before keep their watches
+    assert all(watcher.paths.get(wd) == path for wd, path in watched.items())
+
+    changes = wait_for_changes(watcher)
+    assert '' in changes.subtrees
+    refresh(conn, catalog_id, tree, changes)
+    fresh_id = CatalogScan(tree, 'md5', scan_workers=1).run(conn)
+    assert catalog_state(conn, catalog_id) == catalog_state(conn, fresh_id)